@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import numpy as np
+
+from traffic_flow import models
+from traffic_flow.models.vehicle import MAXIMUM_DECELERATION
+from traffic_flow.simulation_helpers.network_generator import merge_tree
+
+
+def run_scenario() -> models.Recorder:
+    network = merge_tree(3)
+    simulation = network.build_simulation(
+        2_000, 600, models.TrafficFlow, od_pairs_count=8, recorder=models.Recorder()
+    )
+    simulation.total_time = 300
+
+    simulation.run()
+    return simulation.recorder
+
+
+def check_result(recorder: models.Recorder) -> None:
+    # Vehicles merging onto a road right behind slower ones brake hard, but at about the
+    # physical limit - the gap still closes for a few ticks after the entry.
+    minimal_acceleration = recorder.trajectory("acceleration").min()
+    print(f"Strongest braking: {minimal_acceleration:.2f} m/s²")
+    assert minimal_acceleration > -2 * MAXIMUM_DECELERATION
+
+
+def plot_result(recorder: models.Recorder):
+    from plotly.subplots import make_subplots
+
+    time = recorder.trajectory("time")
+    acceleration = recorder.trajectory("acceleration")
+    roads = recorder.trajectory("road").astype(int)
+    levels = np.array([int(str(road_name).split(".")[0]) for road_name in recorder.road_names])
+
+    fig = make_subplots(
+        4, 1, shared_xaxes=True, row_titles=[f"Level {level}" for level in range(4)]
+    )
+    for level in range(4):
+        on_level = levels[roads] == level
+        fig.add_scattergl(
+            x=time[on_level],
+            y=acceleration[on_level],
+            mode="markers",
+            marker_size=2,
+            row=level + 1,
+            col=1,
+            showlegend=False,
+        )
+
+    fig.update_layout(
+        template="plotly_white", xaxis4_title="Time (s)", yaxis_title="Acceleration (m/s²)"
+    )
+    fig.show()
+
+    fig.write_image(Path("img", "merge.png"))
+
+
+if __name__ == "__main__":
+    recorder = run_scenario()
+    check_result(recorder)
+
+    plot_result(recorder)
@@ -1,7 +1,6 @@
 from pathlib import Path
 
 import numpy as np
-from plotly.subplots import make_subplots
 
 from traffic_flow import models
 from traffic_flow.simulation_helpers.vehicle_generator import VehiclesGenerator
@@ -32,6 +31,8 @@ def process_simulation_evolution(
 
 
 def plot_result(data: dict[str, list]):
+    from plotly.subplots import make_subplots
+
     properties = ["position", "velocity", "acceleration"]
     fig = make_subplots(
         3, 1, shared_xaxes=True, subplot_titles=[_property.title() for _property in properties]
@@ -1,7 +1,6 @@
 from pathlib import Path
 
 import numpy as np
-from plotly.subplots import make_subplots
 
 from traffic_flow import models
 from traffic_flow.simulation_helpers.vehicle_generator import VehiclesGenerator
@@ -43,6 +42,8 @@ def run_scenario() -> list[dict]:
 
 
 def plot_result(data):
+    from plotly.subplots import make_subplots
+
     properties = ["position", "velocity", "acceleration"]
     colors = ["green", "red"]
     fig = make_subplots(
@@ -1,7 +1,6 @@
 from pathlib import Path
 
 import numpy as np
-from plotly.subplots import make_subplots
 
 from traffic_flow import models
 from traffic_flow.simulation_helpers.vehicle_generator import VehiclesGenerator
@@ -35,6 +34,8 @@ def process_simulation_evolution(
 
 
 def plot_result(data):
+    from plotly.subplots import make_subplots
+
     properties = ["position", "velocity", "acceleration"]
     fig = make_subplots(
         3,
@@ -0,0 +1,19 @@
+import math
+import warnings
+
+from traffic_flow.models.metrics_recorder import TravelTimeHistogram
+
+
+def test_quantile_ends_are_within_recorded_times():
+    histogram = TravelTimeHistogram(bin_width=5.0, max_time=100.0)
+    histogram.add([12.0, 30.0])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert histogram.quantile(0.0) == 12.0
+        assert histogram.quantile(1.0) == 30.0
+        assert histogram.quantile(0.1) == 12.0
+
+
+def test_quantile_of_empty_histogram_is_nan():
+    assert math.isnan(TravelTimeHistogram().quantile(0.5))
@@ -0,0 +1,287 @@
+"""`traffic-flow` command: run scenarios described by config files
+
+Only the standard library is imported up front; NumPy and the engines are imported once
+a scenario is built, so starting the command costs little more than starting the interpreter.
+"""
+
+import argparse
+import json
+import resource
+import sys
+import time
+from pathlib import Path
+
+ENGINES = {
+    "object": "TrafficFlow",
+    "vectorized": "VectorizedTrafficFlow",
+}
+
+INTEGRATION_SCHEMES = {
+    "explicit": "ExplicitScheme",
+    "ballistic": "BallisticScheme",
+    "adaptive": "AdaptiveScheme",
+}
+
+# Argument of each scheme the top-level `time_step` of a config sets.
+TIME_STEP_ARGUMENTS = {
+    "explicit": "time_step",
+    "ballistic": "time_step",
+    "adaptive": "fine_time_step",
+}
+
+OUTPUT_MODES = ("summary", "metrics", "store", "trajectories")
+
+# Where the output modes which write files put them unless a path is given, as in
+# `store_scenario` and `stream_trajectories` of `simple_traffic_light`.
+DEFAULT_OUTPUT_PATHS = {
+    "store": str(Path("results", "store")),
+    "trajectories": str(Path("results", "trajectories")),
+}
+
+# Commands whose start-up time `cold-start` measures, each in a fresh interpreter.
+COLD_START_COMMANDS = {
+    "interpreter": ["-c", "pass"],
+    "cli": ["-m", "traffic_flow", "--help"],
+    "engine": ["-c", "import traffic_flow.models; traffic_flow.models.VectorizedTrafficFlow"],
+}
+
+
+def load_config(path: Path | str) -> dict:
+    """Read a scenario config, JSON or TOML (by the file extension)"""
+    path = Path(path)
+    if path.suffix == ".toml":
+        import tomllib
+
+        with open(path, "rb") as file:
+            return tomllib.load(file)
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def _build_demand(config: dict):
+    from traffic_flow.simulation_helpers import arrival_processes
+
+    processes = []
+    for process_config in config.get("arrivals", []):
+        process_config = dict(process_config)
+        route = process_config.pop("route")
+        if "headway" in process_config:
+            process = arrival_processes.FixedHeadwayArrivals(route, **process_config)
+        elif "rates" in process_config:
+            process = arrival_processes.TimeVaryingPoissonArrivals(route, **process_config)
+        elif "rate" in process_config:
+            process = arrival_processes.PoissonArrivals(route, **process_config)
+        else:
+            raise ValueError("Each arrival process needs a headway, a rate or rates!")
+        processes.append(process)
+
+    vehicles = config.get("vehicles", [])
+    if not processes and not vehicles:
+        raise ValueError("You cannot start simulation with no vehicle specified!")
+
+    return arrival_processes.VehiclesStream(processes, vehicles)
+
+
+def build_simulation(config: dict, recorder=None):
+    """Simulation of a scenario config
+
+    The config holds:
+
+    - `roads` - name: `{"start": [x, y], "end": [x, y], "next": [names]}`,
+    - `traffic_lights` - a list of the `TrafficLights` arguments (`roads` by name),
+    - `demand` - `arrivals` (the arguments of `FixedHeadwayArrivals` with `headway`,
+      `PoissonArrivals` with `rate` or `TimeVaryingPoissonArrivals` with `rates`) and
+      `vehicles` (explicit vehicle specifications),
+    - `engine` - `object` or `vectorized` (default),
+    - `integration_scheme` - `{"name": "explicit" | "ballistic" | "adaptive", ...}` with its
+      arguments,
+    - `time_step` - the time step of the scheme (the fine one of the adaptive scheme),
+    - `horizon` - the total time in seconds.
+    """
+    from traffic_flow import models
+
+    roadmap = {
+        name: models.Road(tuple(road["start"]), tuple(road["end"]), name)
+        for name, road in config["roads"].items()
+    }
+    for name, road in config["roads"].items():
+        for next_road in road.get("next", []):
+            roadmap[name].add_next_road(roadmap[next_road])
+
+    traffic_lights = []
+    for lights_config in config.get("traffic_lights", []):
+        lights_config = dict(lights_config)
+        roads = [roadmap[name] for name in lights_config.pop("roads")]
+        traffic_lights.append(
+            models.TrafficLights(
+                roads,
+                lights_config.pop("cycle_times"),
+                [tuple(lights) for lights in lights_config.pop("cycle_green_lights")],
+                **lights_config,
+            )
+        )
+
+    scheme_config = dict(config.get("integration_scheme", {}))
+    scheme_name = scheme_config.pop("name", "explicit")
+    if scheme_name not in INTEGRATION_SCHEMES:
+        raise ValueError(f"Integration scheme must be one of {', '.join(INTEGRATION_SCHEMES)}!")
+    if "time_step" in config:
+        # The top-level time step is the fine one of the adaptive scheme.
+        name = TIME_STEP_ARGUMENTS[scheme_name]
+        if scheme_config.setdefault(name, config["time_step"]) != config["time_step"]:
+            raise ValueError(
+                f"time_step {config['time_step']} contradicts {name} {scheme_config[name]} "
+                "of the integration scheme!"
+            )
+    integration_scheme = getattr(models, INTEGRATION_SCHEMES[scheme_name])(**scheme_config)
+
+    simulation_class = getattr(models, ENGINES[config.get("engine", "vectorized")])
+    simulation = simulation_class(
+        _build_demand(config["demand"]),
+        roadmap,
+        traffic_lights,
+        recorder if recorder is not None else models.Recorder(models.RecordingLevel.TRAVEL_TIMES),
+        integration_scheme,
+    )
+    simulation.total_time = config.get("horizon", simulation.total_time)
+
+    return simulation
+
+
+def _summary(simulation) -> dict:
+    travel_times = simulation.travel_times
+    return {
+        "finished_vehicles": len(travel_times),
+        "mean_travel_time": sum(travel_times) / len(travel_times) if travel_times else None,
+        "max_travel_time": max(travel_times, default=None),
+        "mean_entry_delay": (
+            sum(simulation.entry_delays) / len(simulation.entry_delays)
+            if simulation.entry_delays
+            else None
+        ),
+        "simulated_time": simulation.time,
+        "ticks": simulation.tick,
+    }
+
+
+def run_config(config: dict, output: dict | None = None) -> dict:
+    """Build and run a scenario config, return what its output mode reports
+
+    `output` (by default the `output` of the config) is `{"mode": ..., "path": ...}`:
+
+    - `summary` - travel time statistics,
+    - `metrics` - `MetricsRecorder.metrics`,
+    - `store` - results kept in the `ResultsStore` at `path`, a stored scenario is not run
+      again,
+    - `trajectories` - trajectories written to the directory `path` by `StreamingRecorder`.
+
+    Without a `path` these two write under `DEFAULT_OUTPUT_PATHS`.
+
+    Timings of the phases are reported in seconds, the first `build` in a process includes
+    importing NumPy and the engine.
+    """
+    output = output if output is not None else config.get("output", {})
+    mode = output.get("mode", "summary")
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Output mode must be one of {', '.join(OUTPUT_MODES)}!")
+    path = output.get("path", DEFAULT_OUTPUT_PATHS.get(mode))
+
+    timings = {}
+    start = time.perf_counter()
+    from traffic_flow import models
+
+    recorder = None
+    if mode == "metrics":
+        recorder = models.MetricsRecorder()
+    elif mode == "trajectories":
+        recorder = models.StreamingRecorder(path)
+    simulation = build_simulation(config, recorder)
+    timings["build"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = {}
+    if mode == "store":
+        from traffic_flow.simulation_helpers.results_store import ResultsStore
+
+        store = ResultsStore(path)
+        report["key"] = store.run(simulation)
+        # A scenario found in the store is not run at all.
+        report["cached"] = simulation.tick == 0
+    else:
+        simulation.run()
+    timings["run"] = time.perf_counter() - start
+
+    if mode == "metrics":
+        report["metrics"] = recorder.metrics()
+    elif mode != "store":
+        report["summary"] = _summary(simulation)
+
+    return report | {"timings": timings}
+
+
+def measure_cold_start(repeats: int = 10) -> dict[str, float]:
+    """Median wall time (seconds) of starting each of `COLD_START_COMMANDS` in a new process"""
+    import statistics
+    import subprocess
+
+    results = {}
+    for name, arguments in COLD_START_COMMANDS.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *arguments], check=True, capture_output=True)
+            times.append(time.perf_counter() - start)
+        results[name] = statistics.median(times)
+
+    return results
+
+
+def _startup_cpu_time() -> float:
+    # CPU time of the process so far, before any scenario - interpreter and import start-up.
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def main(argv: list[str] | None = None) -> int:
+    startup_cpu_time = _startup_cpu_time()
+
+    parser = argparse.ArgumentParser(
+        prog="traffic-flow", description="Run traffic flow scenarios from config files."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run scenario configs (JSON or TOML)")
+    run_parser.add_argument("configs", nargs="+", type=Path)
+    run_parser.add_argument("--output-mode", choices=OUTPUT_MODES)
+    run_parser.add_argument("--output-path", type=Path)
+
+    cold_start_parser = subparsers.add_parser(
+        "cold-start", help="measure the start-up time of the command in fresh processes"
+    )
+    cold_start_parser.add_argument("--repeats", type=int, default=10)
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "cold-start":
+        for name, seconds in measure_cold_start(arguments.repeats).items():
+            print(f"{name:>12}: {seconds * 1000:7.1f} ms")
+        return 0
+
+    for config_path in arguments.configs:
+        config = load_config(config_path)
+        output = dict(config.get("output", {}))
+        if arguments.output_mode is not None:
+            output["mode"] = arguments.output_mode
+        if arguments.output_path is not None:
+            output["path"] = str(arguments.output_path)
+
+        report = run_config(config, output)
+        report["timings"]["startup_cpu"] = startup_cpu_time
+        print(json.dumps({"config": str(config_path)} | report))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
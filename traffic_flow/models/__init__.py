@@ -1,4 +1,74 @@
-from .road import Road  # noqa
-from .traffic_flow import TrafficFlow  # noqa
-from .traffic_flow import TrafficLights  # noqa
-from .vehicle import Vehicle  # noqa
+"""Simulation models, each imported from its module on first use
+
+A process which needs only e.g. `TrafficFlow` does not pay for importing the other engines.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+_MODULES = {
+    "BatchedTrafficFlow": "batched_traffic_flow",
+    "VariantsRecorder": "batched_traffic_flow",
+    "Instrumentation": "instrumentation",
+    "AdaptiveScheme": "integration_schemes",
+    "BallisticScheme": "integration_schemes",
+    "ExplicitScheme": "integration_schemes",
+    "IntegrationScheme": "integration_schemes",
+    "MetricsRecorder": "metrics_recorder",
+    "TravelTimeHistogram": "metrics_recorder",
+    "PartitionedTrafficFlow": "partitioned_traffic_flow",
+    "PartitionTrafficFlow": "partitioned_traffic_flow",
+    "Recorder": "recorder",
+    "RecordingLevel": "recorder",
+    "Road": "road",
+    "RoadNetwork": "road_network",
+    "SpawnScheduler": "spawn_scheduler",
+    "StreamingRecorder": "streaming_recorder",
+    "read_trajectories": "streaming_recorder",
+    "TrafficFlow": "traffic_flow",
+    "TrafficLights": "traffic_lights",
+    "VectorizedTrafficFlow": "vectorized_traffic_flow",
+    "Vehicle": "vehicle",
+    "VehicleType": "vehicle",
+}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name: str):
+    if (module := _MODULES.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + __all__)
+
+
+if TYPE_CHECKING:
+    from .batched_traffic_flow import BatchedTrafficFlow  # noqa
+    from .batched_traffic_flow import VariantsRecorder  # noqa
+    from .instrumentation import Instrumentation  # noqa
+    from .integration_schemes import AdaptiveScheme  # noqa
+    from .integration_schemes import BallisticScheme  # noqa
+    from .integration_schemes import ExplicitScheme  # noqa
+    from .integration_schemes import IntegrationScheme  # noqa
+    from .metrics_recorder import MetricsRecorder  # noqa
+    from .metrics_recorder import TravelTimeHistogram  # noqa
+    from .partitioned_traffic_flow import PartitionedTrafficFlow  # noqa
+    from .partitioned_traffic_flow import PartitionTrafficFlow  # noqa
+    from .recorder import Recorder  # noqa
+    from .recorder import RecordingLevel  # noqa
+    from .road import Road  # noqa
+    from .road_network import RoadNetwork  # noqa
+    from .spawn_scheduler import SpawnScheduler  # noqa
+    from .streaming_recorder import StreamingRecorder  # noqa
+    from .streaming_recorder import read_trajectories  # noqa
+    from .traffic_flow import TrafficFlow  # noqa
+    from .traffic_lights import TrafficLights  # noqa
+    from .vectorized_traffic_flow import VectorizedTrafficFlow  # noqa
+    from .vehicle import Vehicle  # noqa
+    from .vehicle import VehicleType  # noqa
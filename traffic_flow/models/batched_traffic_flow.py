@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+import numpy as np
+
+from .integration_schemes import IntegrationScheme
+from .recorder import Recorder, RecordingLevel
+from .traffic_lights import TrafficLights
+from .vectorized_traffic_flow import VectorizedTrafficFlow
+
+
+class VariantsRecorder(Recorder):
+    """Recorders of all the variants of `BatchedTrafficFlow` seen by the engine as a single one"""
+
+    def __init__(self, recorders: list[Recorder]) -> None:
+        super().__init__(RecordingLevel.NONE)
+        self.recorders = recorders
+
+    def set_road_names(self, road_names: list[str | int]) -> None:
+        super().set_road_names(road_names)
+        for recorder in self.recorders:
+            recorder.set_road_names(road_names)
+
+    def set_road_lengths(self, road_lengths: np.ndarray) -> None:
+        super().set_road_lengths(road_lengths)
+        for recorder in self.recorders:
+            recorder.set_road_lengths(road_lengths)
+
+    def should_record_tick(self, tick: int) -> bool:
+        return any(recorder.should_record_tick(tick) for recorder in self.recorders)
+
+    def finish(self) -> None:
+        for recorder in self.recorders:
+            recorder.finish()
+
+
+class BatchedTrafficFlow(VectorizedTrafficFlow):
+    """Many variants of a simulation advanced together in lockstep
+
+    The variants share the network and the vehicles specification and differ only in their
+    traffic lights - each variant gets its own copy of the roads (`roadmaps`, same road names
+    and lengths) with its own `traffic_lights` set up on them. The variant is an extra axis of
+    the state: the roads of variant `k` take indices `[k * R, (k + 1) * R)`, where `R` is the
+    number of roads (routes are resolved on the first variant), and each vehicle of the
+    specification gets one row per variant - it enters each variant on its own, as soon as
+    there is room at the entry there. All the
+    variants are then updated by the same array operations, so the per tick overhead is paid
+    once for the whole batch.
+
+    Each variant keeps its own recorder, `travel_times` is a list of travel times per variant.
+    The time step is common, an adaptive scheme takes the fine one if any variant needs it.
+    """
+
+    def __init__(
+        self,
+        vehicles_specification: Iterable[dict],
+        roadmaps: list[dict[str, "Road"]],  # type: ignore # noqa
+        traffic_lights: list[list[TrafficLights]] | None = None,
+        recorders: list[Recorder] | None = None,
+        integration_scheme: IntegrationScheme | None = None,
+    ) -> None:
+        if not roadmaps:
+            raise ValueError("You cannot start simulation with no variant specified!")
+        self._check_same_network(roadmaps)
+        if traffic_lights is not None and len(traffic_lights) != len(roadmaps):
+            raise ValueError("Each variant must have its own list of traffic lights!")
+        if recorders is not None and len(recorders) != len(roadmaps):
+            raise ValueError("Each variant must have its own recorder!")
+
+        self.variants_count = len(roadmaps)
+        self.roads_per_variant = len(roadmaps[0])
+        self.roadmaps = roadmaps
+        self.recorders = recorders if recorders is not None else [Recorder() for _ in roadmaps]
+
+        # The engine is set up for the first variant, then the roads of the others are added.
+        super().__init__(
+            vehicles_specification,
+            roadmaps[0],
+            [lights for variant_lights in traffic_lights or [] for lights in variant_lights],
+            VariantsRecorder(self.recorders),
+            integration_scheme,
+        )
+        self.travel_times: list[list[float]] = [[] for _ in roadmaps]
+        self.entry_delays: list[list[float]] = [[] for _ in roadmaps]
+
+        self.roads = [road for roadmap in roadmaps for road in roadmap.values()]
+        self.road_lengths = np.array([road.length for road in self.roads])
+        self.road_tails = [-1] * len(self.roads)
+        self._set_up_roads_traffic_lights()
+
+    @staticmethod
+    def _check_same_network(roadmaps: list[dict[str, "Road"]]) -> None:  # type: ignore # noqa
+        def network(roadmap: dict) -> list:
+            return [
+                (road_name, road.length, sorted(road.next_roads))
+                for road_name, road in roadmap.items()
+            ]
+
+        first_network = network(roadmaps[0])
+        for roadmap in roadmaps[1:]:
+            if network(roadmap) != first_network:
+                raise ValueError("All the variants must share the same network!")
+            if any(road in roadmaps[0].values() for road in roadmap.values()):
+                raise ValueError("Each variant must have its own roads!")
+
+    def _variants(self, rows) -> np.ndarray:
+        return self.state["road"][rows] // self.roads_per_variant
+
+    def _entries(self, vehicle_specification: dict) -> list[int]:
+        first_road = super()._entries(vehicle_specification)[0]
+        return [
+            variant * self.roads_per_variant + first_road for variant in range(self.variants_count)
+        ]
+
+    def _record_entry_delay(self, entry: int, vehicle_id: int, entry_delay: float) -> None:
+        self.recorders[entry // self.roads_per_variant].record_entry_delays(
+            [vehicle_id], [entry_delay]
+        )
+
+    def _record_travel_times(self, finished: list[int]) -> None:
+        state = self.state
+        vehicle_ids = state["vehicle_id"][finished]
+        travel_times = self.time + self.time_step - state["start_time"][finished]
+        delays = travel_times - self._free_flow_times(finished)
+        variants = self._variants(finished)
+
+        for variant in np.unique(variants).tolist():
+            in_variant = variants == variant
+            self.recorders[variant].record_travel_times(
+                vehicle_ids[in_variant], travel_times[in_variant]
+            )
+            self.recorders[variant].record_delays(vehicle_ids[in_variant], delays[in_variant])
+
+    def _record(self) -> None:
+        if not self.state:
+            return
+
+        state = self.state
+        variants = self._variants(slice(None))
+        roads = state["road"] % self.roads_per_variant
+
+        for variant, recorder in enumerate(self.recorders):
+            if not recorder.should_record_tick(self.tick):
+                continue
+            rows = variants == variant
+            if rows.any():
+                recorder.record_trajectories(
+                    self.time + self.time_step,
+                    state["vehicle_id"][rows],
+                    roads[rows],
+                    state["position"][rows],
+                    state["velocity"][rows],
+                    state["acceleration"][rows],
+                    self.time_step,
+                )
+
+    def _gather_data(self):
+        self.travel_times = [recorder.travel_times for recorder in self.recorders]
+        self.entry_delays = [recorder.entry_delays for recorder in self.recorders]
+
+    @property
+    def simulation_evolution(self) -> list[list[dict]]:
+        """Recorded trajectories of each variant, see `Recorder.simulation_evolution`"""
+        return [recorder.simulation_evolution() for recorder in self.recorders]
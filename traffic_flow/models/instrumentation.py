@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import time
+from typing import Callable
+
+
+class Instrumentation:
+    """Timers of the phases of the simulation ticks, event counters and observers
+
+    Switched on by setting `simulation.instrumentation`, with `None` (the default) the
+    simulation only checks it once per phase. Phase times are in seconds, summed over all the
+    ticks. Counters:
+
+    - `ticks` - ticks actually simulated, not the skipped idle ones,
+    - `vehicle_updates` - active vehicles summed over the ticks, `max_active_vehicles`,
+    - `road_changes` - vehicles which passed from one road to the next one,
+    - `red_light_stops` - vehicles brought to a standstill (in this model only the red traffic
+      lights and the queues in front of them stop the vehicles).
+
+    Observers are called with the simulation at the end of every `sample_interval` ticks.
+    """
+
+    PHASES = (
+        "skip",
+        "spawn",
+        "time_step",
+        "moves",
+        "traffic_lights",
+        "record",
+        "update",
+        "gather",
+    )
+    COUNTERS = (
+        "ticks",
+        "vehicle_updates",
+        "max_active_vehicles",
+        "road_changes",
+        "red_light_stops",
+    )
+
+    def __init__(self) -> None:
+        self.phase_times = dict.fromkeys(self.PHASES, 0.0)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.observers: list[tuple[Callable, int]] = []
+        self._lap_start = 0.0
+
+    def add_observer(
+        self,
+        observer: Callable[["TrafficFlow"], None],  # type: ignore # noqa
+        sample_interval: int = 1,
+    ) -> None:
+        if sample_interval < 1:
+            raise ValueError("Sample interval must be a positive number of ticks!")
+        self.observers.append((observer, sample_interval))
+
+    def start(self) -> None:
+        self._lap_start = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        """Add the time since the previous lap (or start) to the `phase`"""
+        now = time.perf_counter()
+        self.phase_times[phase] += now - self._lap_start
+        self._lap_start = now
+
+    def count(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] += value
+
+    def end_tick(
+        self, simulation: "TrafficFlow", active_vehicles: int  # type: ignore # noqa
+    ) -> None:
+        counters = self.counters
+        counters["ticks"] += 1
+        counters["vehicle_updates"] += active_vehicles
+        if active_vehicles > counters["max_active_vehicles"]:
+            counters["max_active_vehicles"] = active_vehicles
+
+        for observer, sample_interval in self.observers:
+            if simulation.tick % sample_interval == 0:
+                observer(simulation)
+
+    def report(self) -> dict:
+        total_time = sum(self.phase_times.values())
+        ticks = max(self.counters["ticks"], 1)
+
+        return {
+            "phase_times": dict(self.phase_times),
+            "phase_shares": {
+                phase: phase_time / total_time if total_time else 0.0
+                for phase, phase_time in self.phase_times.items()
+            },
+            "counters": dict(self.counters),
+            "time_per_tick": total_time / ticks,
+            "mean_active_vehicles": self.counters["vehicle_updates"] / ticks,
+        }
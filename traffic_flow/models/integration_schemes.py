@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class IntegrationScheme(ABC):
+    """Way the vehicles' dynamics is integrated over time and the length of the time steps
+
+    `integrate` works on single vehicles (`TrafficFlow`), `integrate_arrays` on all vehicles at
+    once (`VectorizedTrafficFlow`). `time_step` is the initial time step of the simulation, the
+    simulation asks for `next_time_step` before each tick - fixed schemes keep the current one.
+    """
+
+    def __init__(self, time_step: float = 1 / 60) -> None:
+        if time_step <= 0:
+            raise ValueError("Time step must be positive!")
+        self.time_step = time_step
+
+    def next_time_step(self, simulation: "TrafficFlow") -> float:  # type: ignore # noqa
+        return simulation.time_step
+
+    @abstractmethod
+    def integrate(
+        self, position: float, velocity: float, acceleration: float, time_step: float
+    ) -> tuple[float, float]:
+        pass
+
+    @abstractmethod
+    def integrate_arrays(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        acceleration: np.ndarray,
+        time_step: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        pass
+
+
+class ExplicitScheme(IntegrationScheme):
+    """The original scheme of the model, meant for small steps like the default 1/60 s
+
+    A vehicle which would get negative velocity is stopped and moved back by half of the
+    distance it would pass with its velocity.
+    """
+
+    def integrate(
+        self, position: float, velocity: float, acceleration: float, time_step: float
+    ) -> tuple[float, float]:
+        updated_velocity = velocity + acceleration * time_step
+
+        if updated_velocity < 0:
+            return position - velocity * time_step / 2, 0
+
+        return (
+            position + (updated_velocity * time_step + (acceleration * time_step**2) / 2),
+            updated_velocity,
+        )
+
+    def integrate_arrays(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        acceleration: np.ndarray,
+        time_step: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        updated_velocity = velocity + acceleration * time_step
+        stopped = updated_velocity < 0
+
+        updated_position = position + np.where(
+            stopped,
+            -velocity * time_step / 2,
+            updated_velocity * time_step + acceleration * time_step**2 / 2,
+        )
+
+        return updated_position, np.where(stopped, 0, updated_velocity)
+
+
+class BallisticScheme(IntegrationScheme):
+    """Ballistic update - constant acceleration over the step, stays stable up to ~0.5 s
+
+    A vehicle which would get negative velocity stops exactly where the constant deceleration
+    brings it to a standstill.
+    """
+
+    def __init__(self, time_step: float = 0.25) -> None:
+        super().__init__(time_step)
+
+    def integrate(
+        self, position: float, velocity: float, acceleration: float, time_step: float
+    ) -> tuple[float, float]:
+        updated_velocity = velocity + acceleration * time_step
+
+        if updated_velocity < 0:
+            return position - velocity**2 / (2 * acceleration), 0
+
+        return position + (velocity + updated_velocity) * time_step / 2, updated_velocity
+
+    def integrate_arrays(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        acceleration: np.ndarray,
+        time_step: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        updated_velocity = velocity + acceleration * time_step
+        stopped = updated_velocity < 0
+
+        stopping_distance = np.divide(
+            velocity**2, -2 * acceleration, out=np.zeros_like(velocity), where=stopped
+        )
+        updated_position = position + np.where(
+            stopped, stopping_distance, (velocity + updated_velocity) * time_step / 2
+        )
+
+        return updated_position, np.where(stopped, 0, updated_velocity)
+
+
+class AdaptiveScheme(BallisticScheme):
+    """Ballistic update with a fine time step only where the dynamics needs it
+
+    The fine step is used when a vehicle would change its velocity by more than
+    `velocity_tolerance` during a coarse step (e.g. braking hard when entering the slowing down
+    zone), when a moving head vehicle gets close to the end of its road or the zones of red
+    traffic lights, creeps up to the node on red or the lights are about to switch, or a vehicle
+    closes in on its leader - see `TrafficFlow.needs_fine_time_step`. Otherwise the coarse step
+    is taken, shortened so it does not jump over a traffic lights phase change (so the lights
+    stay the same during the whole step) or a start of a ride.
+
+    The coarse step is kept at 0.1 s - queues on red move forward in slow stop-and-go waves
+    which no rule above catches, and with longer steps they creep up further each cycle until a
+    vehicle crosses the node a whole cycle early.
+    """
+
+    def __init__(
+        self,
+        fine_time_step: float = 1 / 60,
+        coarse_time_step: float = 0.1,
+        velocity_tolerance: float = 0.5,
+    ) -> None:
+        if fine_time_step > coarse_time_step:
+            raise ValueError("Fine time step cannot be longer than the coarse one!")
+        super().__init__(fine_time_step)
+
+        self.fine_time_step = fine_time_step
+        self.coarse_time_step = coarse_time_step
+        self.velocity_tolerance = velocity_tolerance
+
+    def next_time_step(self, simulation: "TrafficFlow") -> float:  # type: ignore # noqa
+        if simulation.needs_fine_time_step(self.coarse_time_step, self.velocity_tolerance):
+            return self.fine_time_step
+
+        time_step = min(
+            self.coarse_time_step, simulation.next_traffic_lights_switch_time - simulation.time
+        )
+        if (next_ride_start_time := simulation.next_vehicle_ride_start_time) is not None:
+            if next_ride_start_time > simulation.time:
+                time_step = min(time_step, next_ride_start_time - simulation.time)
+
+        return max(time_step, self.fine_time_step)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import numpy as np
+
+from .recorder import Recorder, RecordingLevel
+
+
+class TravelTimeHistogram:
+    """Travel times counted in bins of `bin_width` seconds, with the quantiles interpolated
+
+    Times from `max_time` up fall into the last, open bin. The memory does not depend on the
+    number of vehicles.
+    """
+
+    def __init__(self, bin_width: float = 5.0, max_time: float = 7200.0) -> None:
+        if bin_width <= 0 or max_time <= bin_width:
+            raise ValueError("Bin width must be positive and below the maximal time!")
+
+        self.bin_width = bin_width
+        self.bins_count = int(np.ceil(max_time / bin_width))
+        self.counts = np.zeros(self.bins_count + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+
+    def add(self, travel_times) -> None:
+        travel_times = np.asarray(travel_times, dtype=float)
+        if not travel_times.size:
+            return
+
+        bins = np.minimum((travel_times // self.bin_width).astype(np.int64), self.bins_count)
+        self.counts += np.bincount(bins, minlength=self.bins_count + 1)
+        self.count += travel_times.size
+        self.total += float(travel_times.sum())
+        self.minimum = min(self.minimum, float(travel_times.min()))
+        self.maximum = max(self.maximum, float(travel_times.max()))
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float("nan")
+
+    def quantile(self, q: float) -> float:
+        """Quantile with the times spread uniformly within their bins (the last one up to the
+        maximum), within the recorded times"""
+        if not self.count:
+            return float("nan")
+
+        rank = q * self.count
+        cumulative_counts = np.cumsum(self.counts)
+        # The first non-empty bin holds the rank 0, the empty ones before it end with it too.
+        side = "right" if rank == 0 else "left"
+        n = min(int(np.searchsorted(cumulative_counts, rank, side=side)), self.bins_count)
+        below = cumulative_counts[n - 1] if n else 0
+        bin_start = n * self.bin_width
+        bin_end = self.maximum if n == self.bins_count else bin_start + self.bin_width
+
+        quantile = bin_start + (rank - below) / self.counts[n] * (bin_end - bin_start)
+        return min(max(float(quantile), self.minimum), self.maximum)
+
+
+class MetricsRecorder(Recorder):
+    """Recorder aggregating traffic metrics while the simulation runs, in constant memory
+
+    Each tick adds to per-road totals, so nothing grows with the simulated time or the number of
+    vehicles. Over the observed period (from the first recorded tick to the last one) it gives,
+    for each road:
+
+    - `flow` (vehicles per hour), `density` (vehicles per km) and `mean_speed` (space-mean,
+      m/s) - the generalized definitions: the distance driven and the time spent by all the
+      vehicles on the road, divided by the length of the road and the period,
+    - `mean_queue` and `max_queue` - vehicles slower than `queue_velocity` on the road, i.e.
+      queued in front of its traffic lights (or a congestion),
+
+    and for the whole network the throughput, the travel times histogram with quantiles and the
+    delays against the free-flow travel times (route length over the desired velocity).
+
+    The trajectories and the travel times are also kept according to the `recording_level`, by
+    default nothing is.
+    """
+
+    QUANTILES = (0.5, 0.9, 0.95)
+
+    def __init__(
+        self,
+        recording_level: RecordingLevel | str = RecordingLevel.NONE,
+        recording_interval: int = 1,
+        queue_velocity: float = 1.0,
+        histogram_bin_width: float = 5.0,
+        histogram_max_time: float = 7200.0,
+    ) -> None:
+        super().__init__(recording_level, recording_interval)
+
+        self.queue_velocity = queue_velocity
+        self.travel_times_histogram = TravelTimeHistogram(histogram_bin_width, histogram_max_time)
+        self.delays_histogram = TravelTimeHistogram(histogram_bin_width, histogram_max_time)
+
+        self.start_time: float | None = None
+        self.end_time = 0.0
+        self._tick_count = 0
+        self._set_up_road_totals()
+
+    def _set_up_road_totals(self) -> None:
+        roads_count = len(self.road_names)
+        self.vehicle_times = np.zeros(roads_count)  # vehicle-seconds
+        self.distances = np.zeros(roads_count)  # vehicle-meters
+        self.queue_times = np.zeros(roads_count)  # vehicle-seconds in queues
+        self.max_queues = np.zeros(roads_count, dtype=np.int64)
+
+    def set_road_names(self, road_names: list[str | int]) -> None:
+        super().set_road_names(road_names)
+        self._set_up_road_totals()
+
+    def should_record_tick(self, tick: int) -> bool:
+        # The totals need every tick, `recording_interval` applies only to the trajectories.
+        return True
+
+    def record_trajectories(
+        self,
+        time: float,
+        vehicle_ids,
+        roads,
+        positions,
+        velocities,
+        accelerations,
+        time_step: float | None = None,
+    ) -> None:
+        if self.records_trajectories and self._tick_count % self.recording_interval == 0:
+            super().record_trajectories(
+                time, vehicle_ids, roads, positions, velocities, accelerations
+            )
+        self._tick_count += 1
+
+        if self.start_time is None:
+            self.start_time = time - time_step
+        self.end_time = time
+
+        roads = np.asarray(roads, dtype=np.int64)
+        velocities = np.asarray(velocities, dtype=float)
+        roads_count = len(self.road_names)
+
+        self.vehicle_times += time_step * np.bincount(roads, minlength=roads_count)
+        self.distances += time_step * np.bincount(roads, velocities, minlength=roads_count)
+
+        queues = np.bincount(roads[velocities < self.queue_velocity], minlength=roads_count)
+        self.queue_times += time_step * queues
+        np.maximum(self.max_queues, queues, out=self.max_queues)
+
+    def record_travel_times(self, vehicle_ids, travel_times) -> None:
+        super().record_travel_times(vehicle_ids, travel_times)
+        self.travel_times_histogram.add(travel_times)
+
+    def record_delays(self, vehicle_ids, delays) -> None:
+        # Rounding to the ticks can make the travel time a fraction of a tick shorter.
+        self.delays_histogram.add(np.maximum(delays, 0))
+
+    @property
+    def period(self) -> float:
+        return self.end_time - self.start_time if self.start_time is not None else 0.0
+
+    def road_metrics(self) -> dict[str | int, dict[str, float]]:
+        period = self.period or float("nan")
+        road_lengths = self.road_lengths
+        with np.errstate(divide="ignore", invalid="ignore"):
+            flows = self.distances / (road_lengths * period) * 3600
+            densities = self.vehicle_times / (road_lengths * period) * 1000
+            mean_speeds = self.distances / self.vehicle_times
+            mean_queues = self.queue_times / period
+
+        return {
+            road_name: {
+                "flow": float(flows[n]),
+                "density": float(densities[n]),
+                "mean_speed": float(mean_speeds[n]),
+                "mean_queue": float(mean_queues[n]),
+                "max_queue": int(self.max_queues[n]),
+            }
+            for n, road_name in enumerate(self.road_names)
+        }
+
+    def metrics(self) -> dict:
+        """Aggregated metrics of the observed period, see the class description"""
+        travel_times = self.travel_times_histogram
+        delays = self.delays_histogram
+
+        return {
+            "period": self.period,
+            "throughput": travel_times.count / self.period * 3600 if self.period else 0.0,
+            "roads": self.road_metrics(),
+            "travel_time": {
+                "count": travel_times.count,
+                "mean": travel_times.mean,
+                "max": travel_times.maximum,
+                "quantiles": {q: travel_times.quantile(q) for q in self.QUANTILES},
+            },
+            "delay": {
+                "total": delays.total,
+                "mean": delays.mean,
+                "quantiles": {q: delays.quantile(q) for q in self.QUANTILES},
+            },
+        }
@@ -0,0 +1,629 @@
+from __future__ import annotations
+
+import math
+import multiprocessing
+import time
+from collections import deque
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from .integration_schemes import AdaptiveScheme, IntegrationScheme
+from .recorder import Recorder
+from .road_network import RoadNetwork
+from .streaming_recorder import StreamingRecorder
+from .traffic_lights import TrafficLights
+from .vectorized_traffic_flow import VectorizedTrafficFlow
+
+# Most ticks the partitions run between two exchanges, even if no vehicle can leave them.
+MAXIMUM_BATCH_TICKS = 3600
+
+
+class PartitionTrafficFlow(VectorizedTrafficFlow):
+    """Engine of a single partition of `PartitionedTrafficFlow`, run by its worker process
+
+    It holds the whole network (the traffic lights timetables make the replicated lights
+    agree), but only the vehicles on the roads of its partition. A vehicle which passes onto
+    a road of another partition is removed and handed over as a transfer: its row of the state
+    with its route. Vehicles of the demand get their ids from the position in the whole
+    demand, so they are the same as in a single process.
+
+    `exit_tick` bounds when the next vehicle can be handed over: no vehicle is faster than its
+    desired velocity (or its velocity, if it is faster) plus the acceleration of a time step.
+    Until then the partition runs without the others.
+    """
+
+    def __init__(
+        self,
+        vehicles_specification: Iterable[dict],
+        roadmap: dict[str, "Road"],  # type: ignore # noqa
+        traffic_lights: list[TrafficLights] | None,
+        recorder: Recorder | None,
+        integration_scheme: IntegrationScheme | None,
+        partition: int,
+        road_partitions: list[int],
+    ) -> None:
+        self.partition = partition
+        self.road_partitions = road_partitions
+        self.owned_roads = np.array(road_partitions) == partition
+        # The demand is filtered before `super().__init__` compiles the network.
+        self._entry_partitions = dict(zip(roadmap, road_partitions))
+
+        super().__init__(
+            vehicles_specification, roadmap, traffic_lights, recorder, integration_scheme
+        )
+        self.transfers_out = 0
+        self.transfers_in = 0
+        # Active vehicles summed over the ticks.
+        self.vehicle_updates = 0
+        self._transfers: list[dict] = []
+        self._route_exits_cache: dict[tuple, list[tuple[float, int]]] = {}
+        # Free ticks of the new vehicles by their route and starting dynamics.
+        self._spawn_free_ticks_cache: dict[tuple, float] = {}
+        # Vehicles of other partitions enter these roads, so all the vehicles entering them
+        # join them when the transfers are imported.
+        entered_from_other_partitions = np.zeros(len(road_partitions), dtype=bool)
+        for road_id in np.flatnonzero(~self.owned_roads).tolist():
+            entered_from_other_partitions[self.network.next_road_ids(road_id)] = True
+        self.boundary_roads = self.owned_roads & entered_from_other_partitions
+        # Ids of the vehicles of the partition which entered the boundary roads in the last tick.
+        self._postponed: list[int] = []
+        self._moves_red_lights = self.red_lights
+        # Ids, positions and velocities of the vehicles before the last move.
+        self._start_of_tick = np.empty(0, dtype=int), np.empty(0), np.empty(0)
+
+    def _prepare_vehicles_specification_queue(
+        self, vehicles_specification: Iterable[dict]
+    ) -> Iterator[dict]:
+        vehicles_specification = super()._prepare_vehicles_specification_queue(
+            vehicles_specification
+        )
+        self._demand = (
+            vehicle_specification | {"vehicle_id": vehicle_id}
+            for vehicle_id, vehicle_specification in enumerate(vehicles_specification)
+            if self._entry_partition(vehicle_specification) == self.partition
+        )
+        # Vehicles read ahead from the demand by `exit_tick`, not yet due.
+        self._upcoming: deque[dict] = deque()
+        return self._demand_queue()
+
+    def _demand_queue(self) -> Iterator[dict]:
+        while self._upcoming or self._read_ahead():
+            yield self._upcoming.popleft()
+
+    def _read_ahead(self) -> bool:
+        if (vehicle_specification := next(self._demand, None)) is None:
+            return False
+        self._upcoming.append(vehicle_specification)
+        return True
+
+    def _entry_partition(self, vehicle_specification: dict) -> int:
+        if "route" in vehicle_specification:
+            return self._entry_partitions[vehicle_specification["route"][0]]
+        return self._entry_partitions[vehicle_specification["origin"]]
+
+    def _new_vehicle_id(self, vehicle_specification: dict) -> int:
+        self.vehicles_count += 1
+        return vehicle_specification["vehicle_id"]
+
+    def _change_roads(
+        self, crossing: np.ndarray, start_of_tick: tuple[np.ndarray, np.ndarray]
+    ) -> tuple[list[int], list[int], list[int]]:
+        finished, entered_later_roads, overtaken = super()._change_roads(crossing, start_of_tick)
+        # With the vehicles which entered a road at their entry, as `_change_roads` left them.
+        self._start_of_tick = self._start_of_tick[0], *start_of_tick
+
+        state = self.state
+        finished_rows = set(finished)
+        self._postponed = [
+            state["vehicle_id"][row]
+            for row in crossing.tolist()
+            if row not in finished_rows and self.boundary_roads[state["road"][row]]
+        ]
+
+        return finished, entered_later_roads, overtaken
+
+    def _postpones_joining(self, road: int) -> bool:
+        # Vehicles leaving the partition join their road in the partition they enter.
+        return not self.owned_roads[road] or self.boundary_roads[road]
+
+    def _move_vehicles(self) -> None:
+        # The traffic lights may switch before the handed over vehicles make their move.
+        self._moves_red_lights = self.red_lights
+        super()._move_vehicles()
+
+    def _move_state(self) -> None:
+        state = self.state
+        self._start_of_tick = (
+            state["vehicle_id"].copy(),
+            state["position"].copy(),
+            state["velocity"].copy(),
+        )
+        super()._move_state()
+
+        leaving = np.flatnonzero(~self.owned_roads[self.state["road"]])
+        if leaving.size:
+            self._transfers.extend(self._export(leaving))
+
+    def _export(self, rows: np.ndarray) -> list[dict]:
+        state = self.state
+        # They move in the partition they enter from the next tick on.
+        exit_ticks = [
+            float(self._exit_ticks([row], self.road_partitions[state["road"][row]])[0]) + 1
+            for row in rows.tolist()
+        ]
+        transfers = [
+            {
+                "values": {
+                    name: column[row].item()
+                    for name, column in state.columns.items()
+                    if name != "leader"
+                },
+                "route": self.routes[row],
+                "exit_tick": exit_tick,
+            }
+            for row, exit_tick in zip(rows.tolist(), exit_ticks)
+        ]
+        self._drop_rows(rows.tolist())
+        self.transfers_out += len(transfers)
+
+        return transfers
+
+    def import_vehicles(self, transfers: list[dict]) -> None:
+        """Put the vehicles which entered the boundary roads in the last tick on them
+
+        The handed over vehicles and the ones of the partition join the roads in the order of
+        `VectorizedTrafficFlow._change_roads`: by the road they came from and then from the
+        furthest one. Vehicles which came from a road visited earlier in the tick make their move
+        on the new road now, just as `VectorizedTrafficFlow._move_state` would: they enter the
+        road as it was before the move, and the vehicles they get in front of move again behind
+        them. The others join the roads as they are after the move.
+        """
+        state = self.state
+        rows = []
+        for transfer in transfers:
+            rows.append(state.append(transfer["values"] | {"leader": -1}))
+            self.routes.append(transfer["route"])
+        if self._postponed:
+            rows.extend(np.flatnonzero(np.isin(state["vehicle_id"], self._postponed)).tolist())
+            self._postponed = []
+        self.transfers_in += len(transfers)
+        if not rows:
+            return
+
+        road = state["road"]
+        previous_roads = [self.routes[row][state["route_step"][row] - 1] for row in rows]
+        moved_on_arrival = []
+        joined_after_move = []
+        for previous_road, _, row in sorted(
+            zip(previous_roads, (-state["position"][rows]).tolist(), rows)
+        ):
+            if previous_road < road[row]:
+                moved_on_arrival.append(row)
+            else:
+                joined_after_move.append(row)
+
+        start_of_tick = self._start_of_tick_view()
+        overtaken = []
+        for row in moved_on_arrival:
+            follower = self._insert(row, road[row], *start_of_tick)
+            start_of_tick[0][row] = state["position"][row]
+            start_of_tick[1][row] = state["velocity"][row]
+            if follower >= 0:
+                overtaken.append(follower)
+
+        if moved_on_arrival:
+            red_lights, self.red_lights = self.red_lights, self._moves_red_lights
+            self._move_entered(moved_on_arrival, overtaken, start_of_tick)
+            self.red_lights = red_lights
+
+        for row in joined_after_move:
+            self._insert(row, road[row])
+
+    def exit_tick(self) -> float:
+        """Earliest tick in which a vehicle of the partition may pass onto another partition
+
+        Including the vehicles of the demand which may start their rides by then, at most
+        `MAXIMUM_BATCH_TICKS` ahead.
+        """
+        state = self.state
+        exit_tick = self.tick + MAXIMUM_BATCH_TICKS
+        if state:
+            exit_tick = min(
+                exit_tick, float(self._exit_ticks(list(range(len(state))), self.partition).min())
+            )
+
+        spawn_scheduler = self.spawn_scheduler
+        due_vehicles = [
+            (self.time, vehicle_specification)
+            for waiting_vehicles in spawn_scheduler.waiting.values()
+            for _, _, vehicle_specification in waiting_vehicles
+        ]
+        # The vehicles starting after `exit_tick` cannot lower it.
+        scheduled = sorted(spawn_scheduler.scheduled(), key=lambda item: item[0])
+        for ride_start_time, vehicle_specification in due_vehicles + scheduled:
+            if self._spawn_tick(ride_start_time) >= exit_tick:
+                break
+            exit_tick = min(
+                exit_tick, self._spawn_exit_tick(ride_start_time, vehicle_specification)
+            )
+
+        # The demand is time-ordered as well.
+        read_ahead = 0
+        while read_ahead < len(self._upcoming) or self._read_ahead():
+            vehicle_specification = self._upcoming[read_ahead]
+            read_ahead += 1
+            ride_start_time = vehicle_specification["ride_start_time"]
+            if self._spawn_tick(ride_start_time) >= exit_tick:
+                break
+            exit_tick = min(
+                exit_tick, self._spawn_exit_tick(ride_start_time, vehicle_specification)
+            )
+
+        return exit_tick
+
+    def _exit_ticks(self, rows: list[int], partition: int) -> np.ndarray:
+        """Earliest ticks in which the vehicles may pass onto a road outside `partition`"""
+        state = self.state
+        route_exits = [
+            self._route_exits(self.routes[row], partition)[int(state["route_step"][row])]
+            for row in rows
+        ]
+        distances, road_changes = np.array(route_exits).reshape(-1, 2).T
+        return self.tick + _free_ticks(
+            distances - state["position"][rows],
+            road_changes,
+            state["velocity"][rows],
+            state["desired_velocity"][rows],
+            state["maximum_acceleration"][rows],
+            self.time_step,
+        )
+
+    def _spawn_tick(self, ride_start_time: float) -> int:
+        # With a tick to spare for the rounding of the clock.
+        return self.tick + max(math.floor((ride_start_time - self.time) / self.time_step) - 1, 0)
+
+    def _spawn_exit_tick(self, ride_start_time: float, vehicle_specification: dict) -> float:
+        vehicle_specification = self._resolve_route(vehicle_specification)
+        values = self._vehicle_values(vehicle_specification, -1)
+        # The vehicles of a stream mostly share the route and the vehicle type.
+        key = (
+            tuple(vehicle_specification["route"]),
+            values["position"],
+            values["velocity"],
+            values["desired_velocity"],
+            values["maximum_acceleration"],
+        )
+        if (free_ticks := self._spawn_free_ticks_cache.get(key)) is None:
+            route = self._prepare_route(vehicle_specification["route"])
+            distance, road_changes = self._route_exits(route, self.partition)[0]
+            free_ticks = float(
+                _free_ticks(
+                    np.array([distance - values["position"]]),
+                    np.array([road_changes]),
+                    np.array([values["velocity"]]),
+                    np.array([values["desired_velocity"]]),
+                    np.array([values["maximum_acceleration"]]),
+                    self.time_step,
+                )[0]
+            )
+            self._spawn_free_ticks_cache[key] = free_ticks
+        return self._spawn_tick(ride_start_time) + free_ticks
+
+    def _route_exits(self, route: list[int], partition: int) -> list[tuple[float, int]]:
+        """Distance from the start of each road of the route to the first road outside
+        `partition` and the number of roads entered on the way, by the route step"""
+        key = (tuple(route), partition)
+        if (route_exits := self._route_exits_cache.get(key)) is not None:
+            return route_exits
+
+        route_exits = []
+        distance, exit_step = math.inf, len(route)
+        for step in reversed(range(len(route))):
+            if step + 1 < len(route) and self.road_partitions[route[step + 1]] != partition:
+                distance, exit_step = 0.0, step + 1
+            distance += self.road_lengths[route[step]]
+            route_exits.append((distance, exit_step - step))
+        route_exits.reverse()
+
+        self._route_exits_cache[key] = route_exits
+        return route_exits
+
+    def _start_of_tick_view(self) -> tuple[np.ndarray, np.ndarray]:
+        """Positions and velocities of the vehicles before the last move, by row
+
+        Vehicles which were not in the partition then have their current ones.
+        """
+        vehicle_ids, positions, velocities = self._start_of_tick
+        start_position = self.state["position"].copy()
+        start_velocity = self.state["velocity"].copy()
+        if vehicle_ids.size:
+            order = np.argsort(vehicle_ids)
+            index = order[
+                np.searchsorted(vehicle_ids, self.state["vehicle_id"], sorter=order).clip(
+                    max=vehicle_ids.size - 1
+                )
+            ]
+            found = vehicle_ids[index] == self.state["vehicle_id"]
+            start_position[found] = positions[index[found]]
+            start_velocity[found] = velocities[index[found]]
+
+        return start_position, start_velocity
+
+    def advance(
+        self, transfers: list[dict], next_ride_start_time: float | None, last_tick: float
+    ) -> tuple[dict[int, list[dict]], dict]:
+        """Run the ticks up to `last_tick` as `run` does, return the transfers for the others
+
+        No vehicle passes onto another partition before `last_tick`, so all the transfers come
+        from the last one. The partitions skip the idle time together, to the ride start time
+        of the next vehicle of the whole simulation.
+        """
+        self.import_vehicles(transfers)
+        self._transfers = []
+
+        if next_ride_start_time is not None:
+            self._skip_idle_time(next_ride_start_time)
+        while self.time <= self.total_time:
+            self.vehicle_updates += self._active_vehicles_count()
+            self._tick()
+            if self.tick > last_tick:
+                break
+            self.import_vehicles([])
+
+        outgoing: dict[int, list[dict]] = {}
+        for transfer in self._transfers:
+            partition = self.road_partitions[transfer["values"]["road"]]
+            outgoing.setdefault(partition, []).append(transfer)
+
+        return outgoing, self.status()
+
+    def status(self) -> dict:
+        return {
+            "time": self.time,
+            "tick": self.tick,
+            "active_vehicles": self._active_vehicles_count(),
+            "next_ride_start_time": self.next_vehicle_ride_start_time,
+            "exit_tick": self.exit_tick(),
+        }
+
+
+def _run_partition(
+    connection, partition: int, simulation_arguments: dict, total_time: float
+) -> None:
+    """Worker process: advance a `PartitionTrafficFlow` whenever the coordinator says so"""
+    simulation = PartitionTrafficFlow(partition=partition, **simulation_arguments)
+    simulation.total_time = total_time
+    connection.send(simulation.status())
+
+    busy_time = 0.0
+    wait_time = 0.0
+    while True:
+        start = time.perf_counter()
+        command, transfers, next_ride_start_time, last_tick = connection.recv()
+        wait_time += time.perf_counter() - start
+        if command == "finish":
+            break
+
+        start = time.perf_counter()
+        outgoing, status = simulation.advance(transfers, next_ride_start_time, last_tick)
+        busy_time += time.perf_counter() - start
+        connection.send((outgoing, status))
+
+    simulation.recorder.finish()
+    simulation._gather_data()
+    connection.send(
+        {
+            "recorder": simulation.recorder,
+            "report": {
+                "partition": partition,
+                "roads": int(simulation.owned_roads.sum()),
+                "road_length": float(simulation.road_lengths[simulation.owned_roads].sum()),
+                "vehicles_spawned": simulation.vehicles_count,
+                "vehicle_updates": simulation.vehicle_updates,
+                "transfers_out": simulation.transfers_out,
+                "transfers_in": simulation.transfers_in,
+                "finished_vehicles": len(simulation.travel_times),
+                "busy_time": busy_time,
+                "wait_time": wait_time,
+            },
+        }
+    )
+    connection.close()
+
+
+class PartitionedTrafficFlow:
+    """Simulation of a large network split into regions advanced by separate processes
+
+    The roads are split into `partitions` (a number of connected regions of about equal length,
+    see `RoadNetwork.partition`, or the partition of each road). Each partition is simulated by
+    a `PartitionTrafficFlow` in its own worker process. They run on their own up to the
+    earliest tick in which any vehicle may cross onto the roads of another partition (see
+    `PartitionTrafficFlow.exit_tick`), then the vehicles which crossed are handed over and join
+    their road at the start of the next tick, in the order and with the moves they would make
+    in a single process. The results are the same as of a `VectorizedTrafficFlow`, except that
+    the trajectories of the handed over vehicles miss the tick in which they crossed.
+    `exchanges` counts the hand-overs.
+
+    The time step must not depend on the state of the vehicles, so `AdaptiveScheme` cannot be
+    used. The arguments are sent to the workers, so the demand must be picklable (a list of
+    specifications or a `VehiclesStream`) and each worker gets a copy of the `recorder`, a
+    `StreamingRecorder` writes to a subdirectory `partition_<n>` of its own. Travel times and
+    entry delays of all the partitions are merged by the vehicle id, `partition_report` shows
+    how the work was spread between the partitions.
+    """
+
+    def __init__(
+        self,
+        vehicles_specification: Iterable[dict],
+        roadmap: dict[str, "Road"],  # type: ignore # noqa
+        traffic_lights: list[TrafficLights] | None = None,
+        recorder: Recorder | None = None,
+        integration_scheme: IntegrationScheme | None = None,
+        partitions: int | list[int] = 2,
+    ) -> None:
+        if isinstance(integration_scheme, AdaptiveScheme):
+            raise ValueError("Partitions cannot agree on an adaptive time step!")
+
+        self.network = RoadNetwork(roadmap)
+        self.road_partitions = (
+            self.network.partition(partitions) if isinstance(partitions, int) else partitions
+        )
+        if len(self.road_partitions) != len(roadmap):
+            raise ValueError("Each road must be assigned to a partition!")
+        self.partitions_count = max(self.road_partitions) + 1
+
+        self.simulation_arguments = {
+            "vehicles_specification": vehicles_specification,
+            "roadmap": roadmap,
+            "traffic_lights": traffic_lights,
+            "recorder": recorder,
+            "integration_scheme": integration_scheme,
+            "road_partitions": self.road_partitions,
+        }
+        self.total_time = 120  # seconds
+        self.time = 0.0
+        self.tick = 0
+        self.exchanges = 0
+
+        self.recorders: list[Recorder] = []
+        self.travel_times: list[float] = []
+        self.entry_delays: list[float] = []
+        self.partition_report: list[dict] = []
+
+    def run(self) -> None:
+        context = multiprocessing.get_context()
+        connections = []
+        workers = []
+        for partition in range(self.partitions_count):
+            connection, worker_connection = context.Pipe()
+            simulation_arguments = self.simulation_arguments | {
+                "recorder": self._partition_recorder(partition)
+            }
+            worker = context.Process(
+                target=_run_partition,
+                args=(worker_connection, partition, simulation_arguments, self.total_time),
+            )
+            worker.start()
+            connections.append(connection)
+            workers.append(worker)
+
+        try:
+            statuses = [connection.recv() for connection in connections]
+            self._advance_partitions(connections, statuses)
+
+            results = []
+            for connection in connections:
+                connection.send(("finish", None, None, None))
+                results.append(connection.recv())
+        finally:
+            for worker in workers:
+                worker.join()
+
+        self._gather_data(results)
+
+    def _partition_recorder(self, partition: int) -> Recorder | None:
+        recorder = self.simulation_arguments["recorder"]
+        if not isinstance(recorder, StreamingRecorder):
+            return recorder
+
+        # The copies would write (and truncate when unpickled) the very same files.
+        return StreamingRecorder(
+            recorder.directory / f"partition_{partition}",
+            recorder.recording_level,
+            recorder.recording_interval,
+            recorder.chunk_rows,
+        )
+
+    def _advance_partitions(self, connections: list, statuses: list[dict]) -> None:
+        transfers: list[list[dict]] = [[] for _ in connections]
+
+        while self.time <= self.total_time:
+            pending_transfers = any(transfers)
+            active_vehicles = sum(status["active_vehicles"] for status in statuses)
+            next_ride_start_time = min(
+                (
+                    status["next_ride_start_time"]
+                    for status in statuses
+                    if status["next_ride_start_time"] is not None
+                ),
+                default=None,
+            )
+            if not active_vehicles and not pending_transfers and next_ride_start_time is None:
+                break
+
+            # As in `TrafficFlow.run`, the idle time is skipped when no vehicle is on the roads.
+            skip_to = (
+                next_ride_start_time if not active_vehicles and not pending_transfers else None
+            )
+            last_tick = min(
+                [status["exit_tick"] for status in statuses]
+                + [
+                    transfer["exit_tick"]
+                    for partition_transfers in transfers
+                    for transfer in partition_transfers
+                ]
+            )
+            for connection, partition_transfers in zip(connections, transfers):
+                connection.send(("run", partition_transfers, skip_to, last_tick))
+            self.exchanges += 1
+
+            transfers = [[] for _ in connections]
+            statuses = []
+            for connection in connections:
+                outgoing, status = connection.recv()
+                for partition, partition_transfers in outgoing.items():
+                    transfers[partition].extend(partition_transfers)
+                statuses.append(status)
+
+            self.time = statuses[0]["time"]
+            self.tick = statuses[0]["tick"]
+
+    def _gather_data(self, results: list[dict]) -> None:
+        self.recorders = [result["recorder"] for result in results]
+        self.partition_report = [result["report"] for result in results]
+
+        for name in ("travel_times", "entry_delays"):
+            data = [
+                (vehicle_id, value)
+                for recorder in self.recorders
+                for vehicle_id, value in zip(
+                    getattr(recorder, f"{name}_data")["vehicle_id"].tolist(),
+                    getattr(recorder, name),
+                )
+            ]
+            setattr(self, name, [value for _, value in sorted(data)])
+
+    def load_imbalance(self) -> float:
+        """Largest number of vehicle updates of a partition over the mean one (1 is perfect)"""
+        vehicle_updates = [report["vehicle_updates"] for report in self.partition_report]
+        mean_vehicle_updates = sum(vehicle_updates) / len(vehicle_updates)
+        return max(vehicle_updates) / mean_vehicle_updates if mean_vehicle_updates else math.nan
+
+
+def _free_ticks(
+    distances: np.ndarray,
+    road_changes: np.ndarray,
+    velocities: np.ndarray,
+    desired_velocities: np.ndarray,
+    maximum_accelerations: np.ndarray,
+    time_step: float,
+) -> np.ndarray:
+    """Ticks the vehicles surely need to pass `distances`
+
+    A step of a scheme covers at most `v dt + 1.5 a dt²`, the velocity grows by at most `a dt`
+    in a step and never above the desired one plus that (or the velocity, if it is higher).
+    A vehicle makes a step more in each tick in which it enters a road, a tick is spared for
+    the rounding.
+    """
+    top_velocities = np.maximum(velocities, desired_velocities + maximum_accelerations * time_step)
+    step_gains = 1.5 * maximum_accelerations * time_step**2
+    # Steps at the top velocity and accelerating all the time, both are lower bounds.
+    cruising_steps = distances / (top_velocities * time_step + step_gains)
+    quadratic = maximum_accelerations * time_step**2 / 2
+    linear = velocities * time_step + 2 * quadratic
+    accelerating_steps = (-linear + np.sqrt(linear**2 + 4 * quadratic * distances)) / (
+        2 * quadratic
+    )
+    steps = np.floor(np.maximum(cruising_steps, accelerating_steps))
+    return np.maximum(steps - road_changes - 2, 0)
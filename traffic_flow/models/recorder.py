@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+from enum import Enum
+
+import numpy as np
+
+
+class RecordingLevel(Enum):
+    NONE = "none"
+    TRAVEL_TIMES = "travel_times"
+    SAMPLED = "sampled"  # trajectories every `recording_interval` ticks
+    FULL = "full"
+
+
+class ColumnarBuffer:
+    """Preallocated float columns of equal length, growing by doubling their capacity"""
+
+    def __init__(self, columns: tuple[str, ...], capacity: int = 1024) -> None:
+        self.size = 0
+        self.capacity = capacity
+        self.columns = {name: np.empty(capacity) for name in columns}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name][: self.size]
+
+    def __getstate__(self) -> dict:
+        # Only the filled rows, not the spare capacity.
+        return {"size": self.size, "columns": {name: self[name].copy() for name in self.columns}}
+
+    def __setstate__(self, state: dict) -> None:
+        self.size = state["size"]
+        self.capacity = max(self.size, 64)
+        self.columns = {}
+        for name, column in state["columns"].items():
+            self.columns[name] = np.empty(self.capacity)
+            self.columns[name][: self.size] = column
+
+    def _reserve(self, rows_count: int) -> None:
+        if self.size + rows_count <= self.capacity:
+            return
+
+        while self.size + rows_count > self.capacity:
+            self.capacity *= 2
+        for name, column in self.columns.items():
+            grown_column = np.empty(self.capacity)
+            grown_column[: self.size] = column[: self.size]
+            self.columns[name] = grown_column
+
+    def clear(self) -> None:
+        self.size = 0
+
+    def append_rows(self, rows_count: int, values: dict) -> None:
+        """Append `rows_count` rows, `values` maps columns to scalars or sequences of values"""
+        self._reserve(rows_count)
+
+        for name, column in self.columns.items():
+            column[self.size : self.size + rows_count] = values[name]
+        self.size += rows_count
+
+
+class Recorder:
+    """Storage of the data gathered during a simulation
+
+    Depending on the `recording_level` it keeps nothing, only the travel times (with the entry
+    delays) or also the trajectories of the vehicles - in every tick or in every
+    `recording_interval` ticks. Roads are stored as their indices in `road_names`.
+    """
+
+    TRAJECTORY_COLUMNS = ("time", "vehicle_id", "road", "position", "velocity", "acceleration")
+    TRAVEL_TIME_COLUMNS = ("vehicle_id", "travel_time")
+    ENTRY_DELAY_COLUMNS = ("vehicle_id", "entry_delay")
+
+    def __init__(
+        self,
+        recording_level: RecordingLevel | str = RecordingLevel.FULL,
+        recording_interval: int = 1,
+    ) -> None:
+        if recording_interval < 1:
+            raise ValueError("Recording interval must be a positive number of ticks!")
+
+        self.recording_level = RecordingLevel(recording_level)
+        self.recording_interval = recording_interval if self.records_sampled else 1
+
+        self.road_names: list[str | int] = []
+        self.road_lengths = np.empty(0)
+        self.trajectories = ColumnarBuffer(self.TRAJECTORY_COLUMNS)
+        self.travel_times_data = ColumnarBuffer(self.TRAVEL_TIME_COLUMNS, capacity=64)
+        self.entry_delays_data = ColumnarBuffer(self.ENTRY_DELAY_COLUMNS, capacity=64)
+
+    @property
+    def records_sampled(self) -> bool:
+        return self.recording_level == RecordingLevel.SAMPLED
+
+    @property
+    def records_trajectories(self) -> bool:
+        return self.recording_level in (RecordingLevel.SAMPLED, RecordingLevel.FULL)
+
+    @property
+    def records_travel_times(self) -> bool:
+        return self.recording_level != RecordingLevel.NONE
+
+    def set_road_names(self, road_names: list[str | int]) -> None:
+        self.road_names = road_names
+
+    def set_road_lengths(self, road_lengths: np.ndarray) -> None:
+        self.road_lengths = road_lengths
+
+    def should_record_tick(self, tick: int) -> bool:
+        return self.records_trajectories and tick % self.recording_interval == 0
+
+    def record_trajectories(
+        self,
+        time: float,
+        vehicle_ids,
+        roads,
+        positions,
+        velocities,
+        accelerations,
+        time_step: float | None = None,
+    ) -> None:
+        """Record the state of many vehicles at a single point in time
+
+        `time_step` is the length of the tick which ended at `time`.
+        """
+        self.trajectories.append_rows(
+            len(vehicle_ids),
+            {
+                "time": time,
+                "vehicle_id": vehicle_ids,
+                "road": roads,
+                "position": positions,
+                "velocity": velocities,
+                "acceleration": accelerations,
+            },
+        )
+
+    def record_travel_times(self, vehicle_ids, travel_times) -> None:
+        if self.records_travel_times:
+            self.travel_times_data.append_rows(
+                len(vehicle_ids), {"vehicle_id": vehicle_ids, "travel_time": travel_times}
+            )
+
+    def record_delays(self, vehicle_ids, delays) -> None:
+        """Called with the travel times of the finished vehicles minus their free-flow travel
+        times, see `MetricsRecorder`"""
+
+    def record_entry_delays(self, vehicle_ids, entry_delays) -> None:
+        """Record how long after their ride start times the vehicles entered the network"""
+        if self.records_travel_times:
+            self.entry_delays_data.append_rows(
+                len(vehicle_ids), {"vehicle_id": vehicle_ids, "entry_delay": entry_delays}
+            )
+
+    def finish(self) -> None:
+        """Called by the simulation once it's over"""
+
+    def trajectory(self, name: str) -> np.ndarray:
+        return self.trajectories[name]
+
+    @property
+    def travel_times(self) -> list[float]:
+        return self.travel_times_data["travel_time"].tolist()
+
+    @property
+    def entry_delays(self) -> list[float]:
+        return self.entry_delays_data["entry_delay"].tolist()
+
+    def simulation_evolution(self) -> list[dict]:
+        """Recorded trajectories, one dict per vehicle
+
+        Each vehicle gets `{"roads_data": {road_name: {column: array}}}` with the roads in the
+        order it drove through them. The arrays are copies, the vehicles are ordered by id.
+        """
+        order = np.argsort(self.trajectory("vehicle_id"), kind="stable")
+        vehicle_ids = self.trajectory("vehicle_id")[order]
+        boundaries = np.flatnonzero(np.diff(vehicle_ids)) + 1
+
+        simulation_evolution = []
+        for rows in np.split(order, boundaries) if order.size else []:
+            roads = self.trajectory("road")[rows]
+            _, first_rows = np.unique(roads, return_index=True)
+
+            roads_data = {}
+            for road in roads[np.sort(first_rows)]:
+                road_rows = rows[roads == road]
+                roads_data[self.road_names[int(road)]] = {
+                    name: self.trajectory(name)[road_rows]
+                    for name in ("time", "position", "velocity", "acceleration")
+                }
+            simulation_evolution.append({"roads_data": roads_data})
+
+        return simulation_evolution
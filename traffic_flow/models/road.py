@@ -1,12 +1,15 @@
 # Postpone evaluation of annotations so you can use own class in a method definitions.
 from __future__ import annotations
 
-from collections import deque
-
-import numpy as np
+import math
 
+from .road_occupancy import RoadOccupancy
 from .traffic_lights import TrafficLights
-from .vehicle import Vehicle
+from .vehicle import Vehicle, max_entry_velocity
+
+
+def _rear(vehicle: Vehicle) -> float:
+    return vehicle.new_position - vehicle.vehicle_type.vehicle_length
 
 
 class Road:
@@ -23,33 +26,103 @@ class Road:
         self.end_point = end_point
         self.length = self._calculate_road_length()  # length in meters
 
-        # TODO: Use graphs for it.
+        # Links of the roadmap, compiled into the graph of `RoadNetwork`.
         self.next_roads: dict[str | int, Road] = {}
         self.road_name = road_name
 
-        self.vehicles = deque[Vehicle]()  # type: ignore
+        self.vehicles = RoadOccupancy()
+        self.head_vehicle: Vehicle | None = None
+        self.tail_vehicle: Vehicle | None = None
 
         self.green_light = True
         self.traffic_lights: TrafficLights | None = None  # type: ignore # noqa
 
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+
+        # Between the ticks each vehicle follows the previous one on its road.
+        previous_vehicle = None
+        for vehicle in self.vehicles:
+            vehicle.leading_vehicle = previous_vehicle
+            vehicle.following_vehicle = None
+            if previous_vehicle is not None:
+                previous_vehicle.following_vehicle = vehicle
+            previous_vehicle = vehicle
+
     def add_next_road(self, next_road: Road) -> None:
         self.next_roads[next_road.road_name] = next_road
 
-    def get_next_road(self, road_name: str) -> Road:
-        return self.next_roads[road_name]
-
     def set_traffic_lights(self, traffic_lights: "TrafficLights"):  # type: ignore # noqa
         self.traffic_lights = traffic_lights
 
     def set_green_light(self, green_light_state: bool) -> None:
         self.green_light = green_light_state
 
-    def _calculate_road_length(self):
-        # float() used to get rid of annoying warning.
-        return float(np.linalg.norm(np.array(self.start_point) - np.array(self.end_point)))
+    def _calculate_road_length(self) -> float:
+        return math.dist(self.start_point, self.end_point)
 
     def add_vehicle(self, vehicle: "Vehicle") -> None:  # type: ignore # noqa
-        self.vehicles.append(vehicle)
-
-    def remove_vehicle(self) -> None:
-        self.vehicles.popleft()
+        """Put the vehicle at its position (`new_position`), between its leader and follower
+
+        Usually behind the tail vehicle, but a vehicle merging from another road may be ahead
+        of the ones which entered before it in the same tick. If it would come closer than the
+        minimal desired distance to the vehicle ahead of it, or the vehicle behind it to it -
+        vehicles merging from different roads at about the same time - it queues behind them
+        instead, at the start of the road (possibly still before it). It enters no faster than
+        `max_entry_velocity` allows behind the vehicle ahead of it.
+        """
+        vehicles = self.vehicles
+        vehicle_type = vehicle.vehicle_type
+        minimal_distance = vehicle_type.mininimal_desired_distance
+
+        position = vehicle.new_position
+        leader = vehicles.leader(position)
+        follower = vehicles.follower(position)
+        if leader is not None and _rear(leader) - position < minimal_distance:
+            position = _rear(leader) - minimal_distance
+        while follower is not None and (
+            position - vehicle_type.vehicle_length - follower.new_position < minimal_distance
+        ):
+            leader = follower
+            position = _rear(leader) - minimal_distance
+            follower = follower.following_vehicle
+
+        vehicle.new_position = position
+        if leader is not None:
+            vehicle.new_velocity = min(
+                vehicle.new_velocity,
+                max_entry_velocity(
+                    _rear(leader) - position,
+                    leader.new_velocity,
+                    vehicle_type.maximum_acceleration,
+                    minimal_distance,
+                    vehicle_type.driver_reaction_time,
+                    vehicle_type.two_sqrt_ab,
+                ),
+            )
+
+        vehicles.insert(vehicle)
+        self.head_vehicle = vehicles.head
+        self.tail_vehicle = vehicles.tail
+
+    def remove_vehicle(self, vehicle: "Vehicle") -> None:  # type: ignore # noqa
+        """Remove the vehicle leaving the road past its end
+
+        It is the head vehicle, the one following it becomes the new head. The new head keeps
+        its `leading_vehicle` until its own move, so it still reacts to the leaving vehicle in
+        the tick the latter passes the end of the road. A vehicle which overtook the head (after
+        vehicles merging at the same time got too close) leaves its follower to its leader.
+        """
+        vehicles = self.vehicles
+        if vehicle is vehicles.head:
+            vehicles.pop_head()
+        else:
+            vehicles.remove(vehicle)
+            if (follower := vehicle.following_vehicle) is not None:
+                follower.leading_vehicle = vehicle.leading_vehicle
+            if (leader := vehicle.leading_vehicle) is not None:
+                leader.following_vehicle = follower
+
+        self.head_vehicle = vehicles.head
+        self.tail_vehicle = vehicles.tail
+        vehicle.following_vehicle = None
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import heapq
+from collections import deque
+
+import numpy as np
+
+from .road import Road
+
+
+class RoadNetwork:
+    """Roadmap compiled into a graph with integer road ids
+
+    Road `n` is the `n`-th road of the roadmap. Roads reachable from road `n` are
+    `adjacency[adjacency_offsets[n] : adjacency_offsets[n + 1]]` (CSR layout). Routes are
+    validated once and cached both as road ids and as `Road` objects, so following them during
+    a simulation needs no lookups by name. `shortest_route` finds the shortest (in meters) route
+    between two roads, also cached.
+    """
+
+    def __init__(self, roadmap: dict[str | int, Road]) -> None:
+        self.roadmap = roadmap
+        self.roads = list(roadmap.values())
+        self.road_names = list(roadmap)
+        self.road_ids = {road_name: n for n, road_name in enumerate(roadmap)}
+        self.road_lengths = np.array([road.length for road in self.roads])
+
+        next_road_ids = []
+        for road_name, road in roadmap.items():
+            for next_road_name, next_road in road.next_roads.items():
+                if roadmap.get(next_road_name) is not next_road:
+                    raise ValueError(
+                        f"Road {next_road_name} following {road_name} is not in the roadmap!"
+                    )
+            next_road_ids.append([self.road_ids[name] for name in road.next_roads])
+
+        self.adjacency_offsets = np.cumsum([0] + [len(ids) for ids in next_road_ids])
+        self.adjacency = np.array([id_ for ids in next_road_ids for id_ in ids], dtype=np.int64)
+
+        self._route_ids: dict[tuple, tuple[int, ...]] = {}
+        self._route_roads: dict[tuple, tuple[Road, ...]] = {}
+        self._shortest_routes: dict[tuple, tuple[str | int, ...]] = {}
+        self._route_lengths: dict[tuple, float] = {}
+
+    def immutable_data(self) -> list:
+        """Parts which do not depend on the `Road` objects, copies of simulations share them"""
+        return [
+            self.road_names,
+            self.road_ids,
+            self.road_lengths,
+            self.adjacency_offsets,
+            self.adjacency,
+            self._route_ids,
+            self._shortest_routes,
+            self._route_lengths,
+        ]
+
+    def __len__(self) -> int:
+        return len(self.roads)
+
+    def next_road_ids(self, road_id: int) -> np.ndarray:
+        return self.adjacency[
+            self.adjacency_offsets[road_id] : self.adjacency_offsets[road_id + 1]
+        ]
+
+    def route_ids(self, route: list[str | int]) -> tuple[int, ...]:
+        """Ids of the roads of the route, checked to be connected one after another"""
+        key = tuple(route)
+        if (route_ids := self._route_ids.get(key)) is not None:
+            return route_ids
+
+        if not route:
+            raise ValueError("Each vehicle must have non-empty route!")
+        for road_name in route:
+            if road_name not in self.road_ids:
+                raise ValueError(f"Road {road_name} is not in the roadmap!")
+
+        route_ids = tuple(self.road_ids[road_name] for road_name in route)
+        for road_id, next_road_id in zip(route_ids, route_ids[1:]):
+            if next_road_id not in self.next_road_ids(road_id):
+                raise ValueError(
+                    f"Road {self.road_names[next_road_id]} does not follow"
+                    f" {self.road_names[road_id]}!"
+                )
+
+        self._route_ids[key] = route_ids
+        return route_ids
+
+    def route_roads(self, route: list[str | int]) -> tuple[Road, ...]:
+        key = tuple(route)
+        if (route_roads := self._route_roads.get(key)) is None:
+            route_roads = tuple(self.roads[road_id] for road_id in self.route_ids(route))
+            self._route_roads[key] = route_roads
+
+        return route_roads
+
+    def partition(self, partitions_count: int) -> list[int]:
+        """Split the roads into `partitions_count` connected regions of about equal length
+
+        Roads are ordered breadth-first (ignoring the direction of the connections, so
+        neighbouring roads end up close to each other) and the order is cut into pieces of equal
+        total length. Returns the partition of each road id.
+        """
+        if not 1 <= partitions_count <= len(self.roads):
+            raise ValueError("Number of partitions must be between 1 and the number of roads!")
+
+        neighbours: list[list[int]] = [[] for _ in self.roads]
+        for road_id in range(len(self.roads)):
+            for next_road_id in self.next_road_ids(road_id).tolist():
+                neighbours[road_id].append(next_road_id)
+                neighbours[next_road_id].append(road_id)
+
+        order = []
+        visited = [False] * len(self.roads)
+        for first_road_id in range(len(self.roads)):
+            if visited[first_road_id]:
+                continue
+            visited[first_road_id] = True
+            queue = deque([first_road_id])
+            while queue:
+                road_id = queue.popleft()
+                order.append(road_id)
+                for neighbour in neighbours[road_id]:
+                    if not visited[neighbour]:
+                        visited[neighbour] = True
+                        queue.append(neighbour)
+
+        # Road in the middle of a piece decides which piece it belongs to.
+        cumulative_lengths = np.cumsum(self.road_lengths[order]) - self.road_lengths[order] / 2
+        pieces = np.minimum(
+            (cumulative_lengths / self.road_lengths.sum() * partitions_count).astype(int),
+            partitions_count - 1,
+        )
+
+        partitions = [0] * len(self.roads)
+        for road_id, piece in zip(order, pieces.tolist()):
+            partitions[road_id] = piece
+        return partitions
+
+    def route_length(self, route: list[str | int]) -> float:
+        key = tuple(route)
+        if (route_length := self._route_lengths.get(key)) is None:
+            route_length = float(self.road_lengths[list(self.route_ids(route))].sum())
+            self._route_lengths[key] = route_length
+
+        return route_length
+
+    def shortest_route(self, origin: str | int, destination: str | int) -> tuple[str | int, ...]:
+        """Route from the `origin` road to the `destination` one with the smallest total length"""
+        key = (origin, destination)
+        if (shortest_route := self._shortest_routes.get(key)) is not None:
+            return shortest_route
+
+        for road_name in key:
+            if road_name not in self.road_ids:
+                raise ValueError(f"Road {road_name} is not in the roadmap!")
+        origin_id = self.road_ids[origin]
+        destination_id = self.road_ids[destination]
+
+        # Dijkstra's algorithm, the cost of entering a road is its length.
+        distances = {origin_id: self.road_lengths[origin_id]}
+        previous_road_ids: dict[int, int] = {}
+        queue = [(distances[origin_id], origin_id)]
+        while queue:
+            distance, road_id = heapq.heappop(queue)
+            if road_id == destination_id:
+                break
+            if distance > distances[road_id]:
+                continue
+
+            for next_road_id in self.next_road_ids(road_id).tolist():
+                next_distance = distance + self.road_lengths[next_road_id]
+                if next_distance < distances.get(next_road_id, np.inf):
+                    distances[next_road_id] = next_distance
+                    previous_road_ids[next_road_id] = road_id
+                    heapq.heappush(queue, (next_distance, next_road_id))
+        else:
+            raise ValueError(f"Road {destination} cannot be reached from {origin}!")
+
+        route_ids = [destination_id]
+        while route_ids[-1] != origin_id:
+            route_ids.append(previous_road_ids[route_ids[-1]])
+        shortest_route = tuple(self.road_names[road_id] for road_id in reversed(route_ids))
+
+        self._shortest_routes[key] = shortest_route
+        self._route_ids.setdefault(shortest_route, tuple(reversed(route_ids)))
+        return shortest_route
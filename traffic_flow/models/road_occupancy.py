@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import bisect
+import itertools
+import math
+from typing import Iterator
+
+from .vehicle import Vehicle
+
+
+def _behind(vehicle: Vehicle) -> float:
+    # Sort key, increasing from the head of the road to its tail.
+    return -vehicle.new_position
+
+
+class RoadOccupancy:
+    """Vehicles of a road ordered by position, from the head (the furthest along) to the tail
+
+    Vehicles on a lane do not overtake each other, so the order set when a vehicle enters the
+    road stays valid while they move, and the index is searched by their current positions
+    (`new_position`, the state after their latest move). The vehicles are kept in blocks of at
+    most `BLOCK_SIZE`: the place of a position is found by binary searches over the blocks and
+    within one, O(log n), and inserting there shifts a single block. Vehicles leave the road
+    only at its head.
+
+    `leader` and `follower` are the nearest vehicles ahead of and behind a position, `gap` the
+    free space there - merging vehicles and vehicles entering the network are put between the
+    right ones, not just behind the tail.
+    """
+
+    BLOCK_SIZE = 64
+
+    def __init__(self) -> None:
+        self._blocks: list[list[Vehicle]] = []
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Vehicle]:
+        return itertools.chain.from_iterable(self._blocks)
+
+    @property
+    def head(self) -> Vehicle | None:
+        return self._blocks[0][0] if self._blocks else None
+
+    @property
+    def tail(self) -> Vehicle | None:
+        return self._blocks[-1][-1] if self._blocks else None
+
+    def _locate(self, position: float) -> tuple[int, int]:
+        """Block and index within it of the first vehicle behind `position`
+
+        Vehicles exactly at `position` count as ahead of it. Past the tail it is the end of the
+        last block.
+        """
+        blocks = self._blocks
+        if not blocks:
+            return 0, 0
+
+        block_index = bisect.bisect_right(blocks, -position, key=lambda block: _behind(block[-1]))
+        if block_index == len(blocks):
+            return block_index - 1, len(blocks[-1])
+
+        return block_index, bisect.bisect_right(blocks[block_index], -position, key=_behind)
+
+    def _previous(self, block_index: int, index: int) -> Vehicle | None:
+        if index > 0:
+            return self._blocks[block_index][index - 1]
+        return self._blocks[block_index - 1][-1] if block_index > 0 else None
+
+    def _next(self, block_index: int, index: int) -> Vehicle | None:
+        blocks = self._blocks
+        if block_index < len(blocks) and index < len(blocks[block_index]):
+            return blocks[block_index][index]
+        return blocks[block_index + 1][0] if block_index + 1 < len(blocks) else None
+
+    def leader(self, position: float) -> Vehicle | None:
+        """Nearest vehicle at or ahead of `position`"""
+        return self._previous(*self._locate(position))
+
+    def follower(self, position: float) -> Vehicle | None:
+        """Nearest vehicle behind `position`"""
+        return self._next(*self._locate(position))
+
+    def gap(self, position: float, vehicle_length: float = 0.0) -> float:
+        """Free space at `position` for a vehicle of `vehicle_length` with its front there
+
+        The smaller of the distances to the rear of the leader and from the front of the
+        follower to the rear of the vehicle, infinite on an empty road.
+        """
+        block_index, index = self._locate(position)
+        gap = math.inf
+        if (leader := self._previous(block_index, index)) is not None:
+            gap = leader.new_position - leader.vehicle_type.vehicle_length - position
+        if (follower := self._next(block_index, index)) is not None:
+            gap = min(gap, position - vehicle_length - follower.new_position)
+
+        return gap
+
+    def insert(self, vehicle: Vehicle) -> None:
+        """Put the vehicle at its position, linked to its leader and follower"""
+        block_index, index = self._locate(vehicle.new_position)
+        leader = self._previous(block_index, index)
+        follower = self._next(block_index, index)
+
+        if not self._blocks:
+            self._blocks.append([vehicle])
+        else:
+            block = self._blocks[block_index]
+            block.insert(index, vehicle)
+            if len(block) > self.BLOCK_SIZE:
+                half = len(block) // 2
+                self._blocks[block_index : block_index + 1] = [block[:half], block[half:]]
+        self._length += 1
+
+        vehicle.leading_vehicle = leader
+        vehicle.following_vehicle = follower
+        if leader is not None:
+            leader.following_vehicle = vehicle
+        if follower is not None:
+            follower.leading_vehicle = vehicle
+
+    def remove(self, vehicle: Vehicle) -> None:
+        """Remove the vehicle wherever it is, its links are left to the caller"""
+        blocks = self._blocks
+        # It is in the block of its position, unless it overtook the vehicles around it.
+        located_block_index, _ = self._locate(vehicle.new_position)
+        for block_index in itertools.chain(
+            [located_block_index] if blocks else [], range(len(blocks))
+        ):
+            block = blocks[block_index]
+            for index, block_vehicle in enumerate(block):
+                if block_vehicle is vehicle:
+                    del block[index]
+                    if not block:
+                        del blocks[block_index]
+                    self._length -= 1
+                    return
+
+        raise ValueError("Vehicle is not on the road!")
+
+    def pop_head(self) -> Vehicle:
+        """Remove the head vehicle, its links are left to the caller"""
+        if not self._blocks:
+            raise IndexError("pop from an empty road")
+
+        first_block = self._blocks[0]
+        vehicle = first_block.pop(0)
+        if not first_block:
+            del self._blocks[0]
+        self._length -= 1
+
+        return vehicle
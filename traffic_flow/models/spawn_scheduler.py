@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import heapq
+from collections import deque
+from typing import Hashable, Iterable, Iterator
+
+
+class SpawnScheduler:
+    """Releases the vehicles of the demand when their rides are due
+
+    The demand is given as time-ordered streams of vehicle specifications (e.g. one stream per
+    origin), merged with a heap which holds only the next vehicle of each stream. `pop_due`
+    releases all the vehicles due at a given time at once.
+
+    A released vehicle which cannot enter its first road yet (there is no room at its start)
+    waits in the first in, first out queue of that entry. Entries are whatever the simulation
+    uses to tell them apart, e.g. road names.
+    """
+
+    def __init__(self, streams: Iterable[Iterable[dict]] = ()) -> None:
+        # Entries: (ride start time, stream index, specification), one per stream.
+        self._heap: list[tuple[float, int, dict]] = []
+        self._streams: list[Iterator[dict]] = []
+        self.waiting: dict[Hashable, deque[tuple[int, float, dict]]] = {}
+
+        for stream in streams:
+            self.add_stream(stream)
+
+    def add_stream(self, stream: Iterable[dict]) -> None:
+        self._streams.append(iter(stream))
+        self._push_next(len(self._streams) - 1)
+
+    def _push_next(self, stream_index: int) -> None:
+        if (vehicle_specification := next(self._streams[stream_index], None)) is not None:
+            ride_start_time = vehicle_specification["ride_start_time"]
+            # The caller's specifications may be used again, e.g. by another simulation.
+            vehicle_specification = {
+                key: value
+                for key, value in vehicle_specification.items()
+                if key != "ride_start_time"
+            }
+            heapq.heappush(self._heap, (ride_start_time, stream_index, vehicle_specification))
+
+    @property
+    def next_ride_start_time(self) -> float | None:
+        return self._heap[0][0] if self._heap else None
+
+    def scheduled(self) -> list[tuple[float, dict]]:
+        """Ride start times and specifications of the next vehicle of each stream"""
+        return [
+            (ride_start_time, vehicle_specification)
+            for ride_start_time, _, vehicle_specification in self._heap
+        ]
+
+    def pop_due(self, time: float) -> list[tuple[float, dict]]:
+        """Release all the vehicles with the ride start time not later than `time`"""
+        due = []
+        while self._heap and self._heap[0][0] <= time:
+            ride_start_time, stream_index, vehicle_specification = heapq.heappop(self._heap)
+            self._push_next(stream_index)
+            due.append((ride_start_time, vehicle_specification))
+
+        return due
+
+    def wait(
+        self, entry: Hashable, vehicle_id: int, ride_start_time: float, vehicle_specification: dict
+    ) -> None:
+        self.waiting.setdefault(entry, deque()).append(
+            (vehicle_id, ride_start_time, vehicle_specification)
+        )
+
+    def is_waiting(self, entry: Hashable) -> bool:
+        return bool(self.waiting.get(entry))
+
+    @property
+    def waiting_vehicles_count(self) -> int:
+        return sum(len(queue) for queue in self.waiting.values())
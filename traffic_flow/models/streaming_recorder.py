@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .recorder import Recorder, RecordingLevel
+
+METADATA_FILE = "metadata.json"
+TRAVEL_TIMES_FILE = "travel_times.npy"
+ENTRY_DELAYS_FILE = "entry_delays.npy"
+
+
+class StreamingRecorder(Recorder):
+    """Recorder writing the trajectories to disk while the simulation runs
+
+    The rows are gathered in memory and appended to `directory` every `chunk_rows` rows - one
+    raw float64 file per column, so each of them can be opened with `np.memmap` (see
+    `read_trajectories`). `metadata.json` is rewritten after each chunk, so the data written
+    so far can be read even if the run is interrupted. Travel times are kept in memory and saved
+    to `travel_times.npy` (rows: vehicle ids, travel times) when the simulation is over, the
+    entry delays to `entry_delays.npy` in the same way.
+    """
+
+    def __init__(
+        self,
+        directory: Path | str,
+        recording_level: RecordingLevel | str = RecordingLevel.FULL,
+        recording_interval: int = 1,
+        chunk_rows: int = 2**16,
+    ) -> None:
+        super().__init__(recording_level, recording_interval)
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_rows = chunk_rows
+        self.written_rows = 0
+
+        # Start from empty files, an existing recording in the directory is overwritten.
+        for name in self.TRAJECTORY_COLUMNS:
+            self._column_path(name).write_bytes(b"")
+        self._write_metadata()
+
+    def _column_path(self, name: str) -> Path:
+        return self.directory / f"{name}.bin"
+
+    def _write_metadata(self) -> None:
+        metadata = {
+            "columns": list(self.TRAJECTORY_COLUMNS),
+            "dtype": "float64",
+            "rows": self.written_rows,
+            "road_names": self.road_names,
+        }
+        with open(self.directory / METADATA_FILE, "w") as file:
+            json.dump(metadata, file)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+
+        # Drop the rows written after the snapshot of the simulation was taken.
+        for name in self.TRAJECTORY_COLUMNS:
+            with open(self._column_path(name), "rb+") as file:
+                file.truncate(self.written_rows * np.dtype(np.float64).itemsize)
+        self._write_metadata()
+
+    def set_road_names(self, road_names: list[str | int]) -> None:
+        super().set_road_names(road_names)
+        self._write_metadata()
+
+    def flush(self) -> None:
+        if not self.trajectories:
+            return
+
+        for name in self.TRAJECTORY_COLUMNS:
+            with open(self._column_path(name), "ab") as file:
+                self.trajectories[name].tofile(file)
+
+        self.written_rows += len(self.trajectories)
+        self.trajectories.clear()
+        self._write_metadata()
+
+    def record_trajectories(self, *args, **kwargs) -> None:
+        super().record_trajectories(*args, **kwargs)
+
+        if len(self.trajectories) >= self.chunk_rows:
+            self.flush()
+
+    def finish(self) -> None:
+        self.flush()
+        np.save(
+            self.directory / TRAVEL_TIMES_FILE,
+            np.stack([self.travel_times_data[name] for name in self.TRAVEL_TIME_COLUMNS]),
+        )
+        np.save(
+            self.directory / ENTRY_DELAYS_FILE,
+            np.stack([self.entry_delays_data[name] for name in self.ENTRY_DELAY_COLUMNS]),
+        )
+
+    def trajectory(self, name: str) -> np.ndarray:
+        """Column of the rows written so far, memory-mapped from disk"""
+        return read_trajectories(self.directory)[name]
+
+
+def read_trajectories(directory: Path | str) -> dict[str, np.ndarray | list]:
+    """Open the trajectories written by `StreamingRecorder` without loading them into memory
+
+    Returns read-only `np.memmap` for each column and the `road_names` the `road` column refers
+    to. An empty recording gives empty arrays.
+    """
+    directory = Path(directory)
+    with open(directory / METADATA_FILE) as file:
+        metadata = json.load(file)
+
+    trajectories: dict[str, np.ndarray | list] = {"road_names": metadata["road_names"]}
+    for name in metadata["columns"]:
+        if metadata["rows"]:
+            trajectories[name] = np.memmap(
+                directory / f"{name}.bin",
+                dtype=metadata["dtype"],
+                mode="r",
+                shape=(metadata["rows"],),
+            )
+        else:
+            trajectories[name] = np.empty(0, dtype=metadata["dtype"])
+
+    return trajectories
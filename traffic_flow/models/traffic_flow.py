@@ -1,102 +1,525 @@
 from __future__ import annotations
 
+import copy
+import math
+import os
+import pickle
 from collections import deque
+from pathlib import Path
+from typing import Iterable, Iterator
 
+from .instrumentation import Instrumentation
+from .integration_schemes import ExplicitScheme, IntegrationScheme
+from .recorder import Recorder
+from .road_network import RoadNetwork
+from .spawn_scheduler import SpawnScheduler
+from .streaming_recorder import StreamingRecorder
 from .traffic_lights import TrafficLights
-from .vehicle import Vehicle
+from .vehicle import Vehicle, VehicleType
 
 
 class TrafficFlow:
-    """Single simulation of a traffic flow"""
+    """Single simulation of a traffic flow
+
+    The gathered data is kept by the `recorder` - by default it records full trajectories.
+    The `integration_scheme` sets the time steps, by default it's the fixed 1/60 s explicit one.
+    """
 
     def __init__(
         self,
-        vehicles_specification: list[dict],
+        vehicles_specification: Iterable[dict],
         roadmap: dict[str, "Road"],  # type: ignore # noqa
         traffic_lights: list[TrafficLights] | None = None,
+        recorder: Recorder | None = None,
+        integration_scheme: IntegrationScheme | None = None,
     ) -> None:
-        self.time_step = 1 / 60  # seconds
+        self.integration_scheme = (
+            integration_scheme if integration_scheme is not None else ExplicitScheme()
+        )
+        self.time_step = self.integration_scheme.time_step  # seconds
         self.total_time = 120  # seconds
+        self.time = 0.0
+        self.tick = 0
 
-        self.vehicles_specification_queue = self._prepare_vehicles_specification_queue(
-            vehicles_specification
+        self.roadmap = roadmap
+        self.network = RoadNetwork(roadmap)
+        self.road_indices = self.network.road_ids
+
+        self.spawn_scheduler = SpawnScheduler(
+            [self._prepare_vehicles_specification_queue(vehicles_specification)]
         )
 
         self.vehicles = deque[Vehicle]()
         self.retired_vehicles = deque[Vehicle]()
 
-        self.roadmap = roadmap
+        self.vehicles_count = 0
+
         self.traffic_lights = traffic_lights
+        # The lights are updated only when any of them switches, see `TrafficLights`.
+        self.next_traffic_lights_switch_time = min(
+            (lights.next_switch_time for lights in traffic_lights or []), default=math.inf
+        )
+
+        # Jump over the ticks in which there is no vehicle on the roads.
+        self.time_skipping = True
+        # Phase timers, counters and observers, see `Instrumentation`.
+        self.instrumentation: Instrumentation | None = None
+        # Snapshots of the whole state saved while running, see `enable_snapshots`.
+        self.snapshot_path: Path | None = None
+        self.snapshot_interval = math.inf
+        self.next_snapshot_time = math.inf
+
+        self.recorder = recorder if recorder is not None else Recorder()
+        self.recorder.set_road_names(list(roadmap))
+        self.recorder.set_road_lengths(self.network.road_lengths)
+        self.travel_times: list[float] = []
+        self.entry_delays: list[float] = []
 
         self.stop_simulation = False
 
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # Observers are rarely picklable, instrumentation belongs to a run anyway.
+        state["instrumentation"] = None
+        return state
+
+    def enable_snapshots(self, path: Path | str, interval: float) -> None:
+        """Save a snapshot to `path` every `interval` seconds of the simulated time"""
+        if interval <= 0:
+            raise ValueError("Snapshot interval must be positive!")
+        self.snapshot_path = Path(path)
+        self.snapshot_interval = interval
+        self.next_snapshot_time = self.time + interval
+
+    def save_snapshot(self, path: Path | str) -> None:
+        """Save the whole state of the simulation, replacing the previous snapshot atomically
+
+        The vehicles specification must be picklable - a list or a `VehiclesStream`, not
+        a generator.
+        """
+        path = Path(path)
+        temporary_path = path.with_name(f"{path.name}.tmp")
+        with open(temporary_path, "wb") as file:
+            pickle.dump(self, file, pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load_snapshot(cls, path: Path | str) -> TrafficFlow:
+        """Simulation saved with `save_snapshot`, `run` continues it with identical results"""
+        with open(path, "rb") as file:
+            simulation = pickle.load(file)
+
+        if not isinstance(simulation, cls):
+            raise TypeError(f"Snapshot in {path} is not a {cls.__name__}!")
+        return simulation
+
+    def _shared_objects(self) -> list:
+        """Immutable data which forks share with this simulation instead of copying it"""
+        return [self.integration_scheme, *self.network.immutable_data()]
+
+    def fork(
+        self,
+        traffic_lights_cycle_times: list[list[float]] | None = None,
+        vehicles_specification: Iterable[dict] | None = None,
+        recorder: Recorder | None = None,
+    ) -> TrafficFlow:
+        """Independent copy of the simulation continuing from its current state
+
+        Meant for variants sharing a warm-up: run it once, then fork it for each variant, which
+        runs only the measurement window. The network, vehicle types and the integration scheme
+        are shared, the vehicles, roads and traffic lights are copied.
+
+        - `traffic_lights_cycle_times` - new timings, one list per traffic lights,
+        - `vehicles_specification` - demand replacing the one not released yet (vehicles already
+          waiting at the entries stay), its ride start times should not precede the fork,
+        - `recorder` - records the fork from now on, by default the fork gets a copy of the
+          recorder with the warm-up data. A `StreamingRecorder` must be replaced, the copy would
+          write to (and on restoring truncate) the same files.
+
+        Snapshots are not taken by the fork unless enabled again.
+        """
+        if traffic_lights_cycle_times is not None and len(traffic_lights_cycle_times) != len(
+            self.traffic_lights or []
+        ):
+            raise ValueError("Give new cycle times for each of the traffic lights!")
+        if recorder is None and isinstance(self.recorder, StreamingRecorder):
+            raise ValueError("Give the fork its own recorder, it cannot share streamed files!")
+
+        memo = {id(shared_object): shared_object for shared_object in self._shared_objects()}
+        if recorder is not None:
+            memo[id(self.recorder)] = recorder
+        fork = copy.deepcopy(self, memo)
+
+        if traffic_lights_cycle_times is not None:
+            for traffic_lights, cycle_times in zip(
+                fork.traffic_lights, traffic_lights_cycle_times
+            ):
+                traffic_lights.set_cycle_times(cycle_times)
+            fork._update_traffic_lights(fork.time)
+
+        if vehicles_specification is not None:
+            waiting = fork.spawn_scheduler.waiting
+            fork.spawn_scheduler = SpawnScheduler(
+                [fork._prepare_vehicles_specification_queue(vehicles_specification)]
+            )
+            fork.spawn_scheduler.waiting = waiting
+
+        if recorder is not None:
+            recorder.set_road_names(self.recorder.road_names)
+            recorder.set_road_lengths(self.recorder.road_lengths)
+
+        fork.snapshot_path = None
+        fork.next_snapshot_time = math.inf
+        return fork
+
     def _prepare_vehicles_specification_queue(
-        self, vehicles_specification: list[dict]
-    ) -> deque[dict]:
-        if not vehicles_specification:
-            raise ValueError("You cannot start simulation with no vehicle specified!")
-        vehicles_specification = sorted(
-            vehicles_specification, key=lambda vehicle_spec: vehicle_spec["ride_start_time"]
+        self, vehicles_specification: Iterable[dict]
+    ) -> Iterator[dict]:
+        """Lists are sorted by the ride start time here, other iterables must be time-ordered
+
+        An iterable such as `VehiclesStream` is consumed lazily, one vehicle at a time.
+        """
+        if isinstance(vehicles_specification, list):
+            if not vehicles_specification:
+                raise ValueError("You cannot start simulation with no vehicle specified!")
+            vehicles_specification = sorted(
+                vehicles_specification, key=lambda vehicle_spec: vehicle_spec["ride_start_time"]
+            )
+
+        return iter(vehicles_specification)
+
+    def _resolve_route(self, vehicle_specification: dict) -> dict:
+        """Give the shortest route to a vehicle specified by `origin` and `destination` roads"""
+        if "route" in vehicle_specification:
+            return vehicle_specification
+
+        vehicle_specification = dict(vehicle_specification)
+        vehicle_specification["route"] = list(
+            self.network.shortest_route(
+                vehicle_specification.pop("origin"), vehicle_specification.pop("destination")
+            )
         )
+        return vehicle_specification
 
-        return deque(vehicles_specification)
+    @property
+    def next_vehicle_ride_start_time(self) -> float | None:
+        return self.spawn_scheduler.next_ride_start_time
 
-    def start_vehicle_ride(self, vehicle_specification: dict) -> None:
+    @staticmethod
+    def _vehicle_type(vehicle_specification: dict) -> VehicleType:
+        if (vehicle_type := vehicle_specification.get("vehicle_type")) is not None:
+            return vehicle_type
+        return VehicleType.from_configs(vehicle_specification.get("vehicle_configs"))
+
+    def _entries(self, vehicle_specification: dict) -> list:
+        """Entries the vehicle enters the network through - the first road of its route"""
+        return [vehicle_specification["route"][0]]
+
+    def _entry_gap(self, entry) -> float:
+        """Free space at the start of the entry road, behind the nearest vehicle there"""
+        return self.roadmap[entry].vehicles.gap(0.0)
+
+    def start_vehicle_ride(self, vehicle_specification: dict, vehicle_id: int, entry) -> None:
         vehicle = Vehicle(**vehicle_specification)
-        vehicle.start_ride(self.roadmap)
+        vehicle.vehicle_id = vehicle_id
+        vehicle.start_ride(self.network)
 
         self.vehicles.append(vehicle)
 
+    def _record_entry_delay(self, entry, vehicle_id: int, entry_delay: float) -> None:
+        self.recorder.record_entry_delays([vehicle_id], [entry_delay])
+
+    def _enter(
+        self, entry, vehicle_id: int, ride_start_time: float, vehicle_specification: dict
+    ) -> bool:
+        """Start the ride if there is room at the entry, i.e. the minimal desired distance"""
+        minimal_distance = self._vehicle_type(vehicle_specification).mininimal_desired_distance
+        if self._entry_gap(entry) < minimal_distance:
+            return False
+
+        self.start_vehicle_ride(vehicle_specification, vehicle_id, entry)
+        self._record_entry_delay(entry, vehicle_id, self.time - ride_start_time)
+        return True
+
+    def _new_vehicle_id(self, vehicle_specification: dict) -> int:
+        vehicle_id = self.vehicles_count
+        self.vehicles_count += 1
+        return vehicle_id
+
+    def _spawn_vehicles(self) -> None:
+        """Let in the waiting vehicles, then all the vehicles due in this tick
+
+        A vehicle gets its id when it's due. It waits (behind the vehicles already waiting
+        there) if its entry is occupied, its travel time starts when it enters.
+        """
+        spawn_scheduler = self.spawn_scheduler
+        for entry, waiting_vehicles in spawn_scheduler.waiting.items():
+            while waiting_vehicles and self._enter(entry, *waiting_vehicles[0]):
+                waiting_vehicles.popleft()
+
+        for ride_start_time, vehicle_specification in spawn_scheduler.pop_due(self.time):
+            vehicle_specification = self._resolve_route(vehicle_specification)
+            vehicle_id = self._new_vehicle_id(vehicle_specification)
+
+            for entry in self._entries(vehicle_specification):
+                if spawn_scheduler.is_waiting(entry) or not self._enter(
+                    entry, vehicle_id, ride_start_time, vehicle_specification
+                ):
+                    spawn_scheduler.wait(entry, vehicle_id, ride_start_time, vehicle_specification)
+
+    def _has_active_vehicles(self) -> bool:
+        return bool(self.vehicles)
+
+    def unfinished_travel_times(self) -> list[float]:
+        """Time spent so far on the roads by the vehicles which have not finished their rides"""
+        return [vehicle.travel_time for vehicle in self.vehicles]
+
+    def _active_vehicles_count(self) -> int:
+        return len(self.vehicles)
+
     def update(self):
-        if not self.vehicles:
-            if not self.vehicles_specification_queue:
-                self.stop_simulation = True
-            pass
+        if not self.vehicles and self.next_vehicle_ride_start_time is None:
+            self.stop_simulation = True
+        retired_vehicles = []
         for _ in range(len(self.vehicles)):
             vehicle = self.vehicles.popleft()
             if vehicle.is_ride_finished:
-                self.retired_vehicles.append(vehicle)
+                retired_vehicles.append(vehicle)
             else:
                 self.vehicles.append(vehicle)
 
+        if retired_vehicles:
+            self.retired_vehicles.extend(retired_vehicles)
+            vehicle_ids = [vehicle.vehicle_id for vehicle in retired_vehicles]
+            self.recorder.record_travel_times(
+                vehicle_ids, [vehicle.travel_time for vehicle in retired_vehicles]
+            )
+            self.recorder.record_delays(
+                vehicle_ids,
+                [
+                    vehicle.travel_time
+                    - self.network.route_length(vehicle.route)
+                    / vehicle.vehicle_type.desired_velocity
+                    for vehicle in retired_vehicles
+                ],
+            )
+
+    def _record(self) -> None:
+        if not self.vehicles:
+            return
+
+        road_indices = self.road_indices
+        self.recorder.record_trajectories(
+            self.time + self.time_step,
+            [vehicle.vehicle_id for vehicle in self.vehicles],
+            [road_indices[vehicle.current_road.road_name] for vehicle in self.vehicles],
+            [vehicle.new_position for vehicle in self.vehicles],
+            [vehicle.new_velocity for vehicle in self.vehicles],
+            [vehicle.acceleration for vehicle in self.vehicles],
+            self.time_step,
+        )
+
     def _gather_data(self):
-        simulation_evolution = []
-        travel_times = []
+        self.travel_times = self.recorder.travel_times
+        self.entry_delays = self.recorder.entry_delays
 
-        for vehicle in self.retired_vehicles:
-            travel_times.append(vehicle.travel_time)
-        for vehicle in self.vehicles + self.retired_vehicles:
-            simulation_evolution.append(vehicle.ride_data)
+    @property
+    def simulation_evolution(self) -> list[dict]:
+        """Recorded trajectories of all the vehicles, see `Recorder.simulation_evolution`"""
+        return self.recorder.simulation_evolution()
 
-        self.simulation_evolution = simulation_evolution
-        self.travel_times = travel_times
+    def needs_fine_time_step(self, lookahead_time: float, velocity_tolerance: float) -> bool:
+        """Check if any vehicle's dynamics is too fast or too close to events for a long step
 
-    def run(self):
-        next_vehicle = self.vehicles_specification_queue.popleft()
-
-        next_vehicle_ride_start_time = next_vehicle.pop(
-            "ride_start_time"
-        )  # NOTE: At the moment you cannot add vehicle at the same time.
-
-        time = 0
-
-        while not self.stop_simulation and time <= self.total_time:
-            if next_vehicle_ride_start_time is not None and time >= next_vehicle_ride_start_time:
-                self.start_vehicle_ride(next_vehicle)
-                if self.vehicles_specification_queue:
-                    next_vehicle = self.vehicles_specification_queue.popleft()
-                    next_vehicle_ride_start_time = next_vehicle.pop("ride_start_time")
-                else:
-                    next_vehicle_ride_start_time = None
-
-            for road in self.roadmap.values():
-                for vehicle in list(road.vehicles):
-                    vehicle.move(self.time_step)
-
-            if self.traffic_lights:
-                for trafffic_lights in self.traffic_lights:
-                    trafffic_lights.tic(self.time_step)
-            self.update()
+        Used by `AdaptiveScheme`. True if the current acceleration of any vehicle changes its
+        velocity by more than `velocity_tolerance` within `lookahead_time` or a vehicle can
+        reach the end of its road (so it enters the next one close to its start), the border of
+        the slowing down or stopping zone of red traffic lights or the minimal desired distance
+        to its leader within that time. Vehicles standing still behind standing vehicles do not
+        need the fine time step.
+
+        Within the slowing down zone of traffic lights the fine time step is kept while the
+        lights are about to switch. On red, a head still braking hard towards the approaching
+        speed needs it too. In the stopping zone the velocity of the head decays exponentially,
+        it never gets further than `velocity * approaching_speed / desired_deceleration` - a
+        head which stops short of the node that way is treated as standing, only the one which
+        creeps up to the node keeps the fine time step.
+        """
+        switch_is_near = self.next_traffic_lights_switch_time - self.time < lookahead_time
+        for vehicle in self.vehicles:
+            if abs(vehicle.acceleration) * lookahead_time > velocity_tolerance:
+                return True
+
+            road = vehicle.current_road
+            velocity = vehicle.new_velocity
+            reach = velocity * lookahead_time
+            distance_to_node = road.length - vehicle.new_position
+
+            if (traffic_lights := road.traffic_lights) is not None and (
+                distance_to_node < traffic_lights.slowing_down_distance
+            ):
+                if switch_is_near:
+                    return True
+
+            if road.head_vehicle is vehicle and velocity > 0:
+                if distance_to_node < reach:
+                    return True
+
+                if (traffic_lights := road.traffic_lights) and not road.green_light:
+                    for zone_distance in (
+                        traffic_lights.slowing_down_distance,
+                        traffic_lights.stopping_distance,
+                    ):
+                        if 0 <= distance_to_node - zone_distance < reach:
+                            return True
+
+                    vehicle_type = vehicle.vehicle_type
+                    approaching_speed = traffic_lights.approaching_speed
+                    if distance_to_node < traffic_lights.stopping_distance:
+                        creep = velocity * approaching_speed / vehicle_type.desired_deceleration
+                        if creep + reach >= distance_to_node:
+                            return True
+                    elif distance_to_node < traffic_lights.slowing_down_distance:
+                        # A follower which became the head in the zone has not braked yet.
+                        braking = vehicle_type.maximum_acceleration * (
+                            (velocity / approaching_speed) ** vehicle_type.acceleration_exponent
+                            - 1
+                        )
+                        if braking * lookahead_time > velocity_tolerance:
+                            return True
+
+            leader = vehicle.leading_vehicle
+            if leader is None or leader.current_road is not road:
+                continue
+
+            if velocity > 0 or leader.new_velocity > 0:
+                vehicle_type = vehicle.vehicle_type
+                net_distance = (
+                    leader.new_position - vehicle.new_position - vehicle_type.vehicle_length
+                )
+                approaching_rate = max(velocity - leader.new_velocity, 0)
+                critical_gap = (
+                    vehicle_type.mininimal_desired_distance
+                    + reach
+                    + approaching_rate * lookahead_time
+                )
+                if net_distance < critical_gap:
+                    return True
+
+        return False
+
+    def _move_vehicles(self) -> None:
+        if (instrumentation := self.instrumentation) is not None:
+            remaining_roads = sum(len(vehicle.remaining_roads) for vehicle in self.vehicles)
+
+        for road in self.roadmap.values():
+            for vehicle in list(road.vehicles):
+                vehicle.move(self.time_step, self.integration_scheme)
+
+        if instrumentation is not None:
+            instrumentation.count(
+                "road_changes",
+                remaining_roads - sum(len(vehicle.remaining_roads) for vehicle in self.vehicles),
+            )
+            instrumentation.count(
+                "red_light_stops",
+                sum(
+                    vehicle.velocity > 0 and vehicle.new_velocity == 0 for vehicle in self.vehicles
+                ),
+            )
+
+    def _skip_idle_time(self, next_ride_start_time: float | None = None) -> None:
+        """Jump to the tick in which the next vehicle starts its ride
+
+        The clock is advanced with the very same arithmetic as in the regular ticks and the
+        traffic lights are looked up in their timetables, so the simulation continues exactly
+        as if it stepped through them. `next_ride_start_time` defaults to the one of the demand
+        of this simulation.
+        """
+        if next_ride_start_time is None:
+            next_ride_start_time = self.next_vehicle_ride_start_time
+
+        time = self.time
+        ticks = 0
+        while time < next_ride_start_time and time <= self.total_time:
             time += self.time_step
+            ticks += 1
+
+        self.time = time
+        self.tick += ticks
+        self._update_traffic_lights(time)
+
+    def _update_traffic_lights(self, time: float) -> None:
+        """Switch the traffic lights due by `time`, find when the next ones switch"""
+        next_switch_time = math.inf
+        for traffic_lights in self.traffic_lights or []:
+            traffic_lights.update(time)
+            next_switch_time = min(next_switch_time, traffic_lights.next_switch_time)
+
+        self.next_traffic_lights_switch_time = next_switch_time
+
+    def _tick(self, instrumentation: Instrumentation | None = None) -> None:
+        """Spawn, move and record the vehicles over a single time step"""
+        self._spawn_vehicles()
+        if instrumentation:
+            instrumentation.lap("spawn")
+            active_vehicles = self._active_vehicles_count()
+
+        self.time_step = self.integration_scheme.next_time_step(self)
+        if instrumentation:
+            instrumentation.lap("time_step")
+        self._move_vehicles()
+        if instrumentation:
+            instrumentation.lap("moves")
+
+        if (
+            self.time + self.time_step + TrafficLights.SWITCH_TOLERANCE
+            >= self.next_traffic_lights_switch_time
+        ):
+            self._update_traffic_lights(self.time + self.time_step)
+        if instrumentation:
+            instrumentation.lap("traffic_lights")
+        if self.recorder.should_record_tick(self.tick):
+            self._record()
+        if instrumentation:
+            instrumentation.lap("record")
+        self.update()
+        self.time += self.time_step
+        self.tick += 1
+
+        if instrumentation:
+            instrumentation.lap("update")
+            instrumentation.end_tick(self, active_vehicles)
+
+    def run(self):
+        instrumentation = self.instrumentation
+
+        while not self.stop_simulation and self.time <= self.total_time:
+            if instrumentation:
+                instrumentation.start()
+
+            if (
+                self.time_skipping
+                and self.next_vehicle_ride_start_time is not None
+                and not self._has_active_vehicles()
+            ):
+                self._skip_idle_time()
+                if self.time > self.total_time:
+                    break
+            if instrumentation:
+                instrumentation.lap("skip")
+
+            self._tick(instrumentation)
+
+            if self.time >= self.next_snapshot_time:
+                self.save_snapshot(self.snapshot_path)
+                self.next_snapshot_time = self.time + self.snapshot_interval
 
+        if instrumentation:
+            instrumentation.start()
+        self.recorder.finish()
         self._gather_data()
+        if instrumentation:
+            instrumentation.lap("gather")
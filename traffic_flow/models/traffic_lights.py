@@ -1,9 +1,24 @@
 from __future__ import annotations
 
-from itertools import cycle
+import bisect
+import itertools
+import math
 
 
 class TrafficLights:
+    """Fixed-time traffic lights of a group of roads
+
+    The signal plan is compiled into a periodic timetable: phase `n` lasts `cycle_times[n]`
+    seconds with the `cycle_green_lights[n]` state of the roads, the cycle starts at
+    `cycle_start_time` and repeats every `period`. The state at any time is a lookup
+    (`phase_at`) and the time of the next switch is known in advance, so the simulation updates
+    the lights only when they switch. The times come from the timetable, not from a counter
+    decremented each tick, so nothing drifts over long horizons.
+    """
+
+    # Times closer than this to a switch are regarded as past it (the clock is a float sum).
+    SWITCH_TOLERANCE = 1e-6
+
     def __init__(
         self,
         roads: list["Road"],  # type: ignore # noqa
@@ -17,18 +32,21 @@ class TrafficLights:
             raise ValueError("The length of cycle_green_lights and cycle_times must be equal!")
         self.roads = self._set_up_roads(roads)
 
-        self.cycle_times = cycle(cycle_times)
         self.cycle_green_lights = self._set_up_cycle_green_lights(cycle_green_lights)
+        self.cycle_start_time = 0.0
+        self._compile_timetable(cycle_times)
 
         self.approaching_speed = approaching_speed
         self.slowing_down_distance = slowing_down_distance
         self.stopping_distance = stopping_distance
 
-        self._next_cycle()
+        self.phase = -1
+        self.next_switch_time = -math.inf
+        self.update(0.0)
 
     def _set_up_cycle_green_lights(
         self, cycle_green_lights: list[tuple[bool]]
-    ) -> cycle[tuple[bool]]:
+    ) -> list[tuple[bool]]:
 
         for cycle_lights_set in cycle_green_lights:
             if len(cycle_lights_set) != len(self.roads):
@@ -36,7 +54,7 @@ class TrafficLights:
                     "Length of each element of cycle_green_lights must be equal to number of roads!"  # noqa
                 )
 
-        return cycle(cycle_green_lights)
+        return list(cycle_green_lights)
 
     def _set_up_roads(self, roads: list["Road"]) -> list["Road"]:  # type: ignore # noqa
         for road in roads:
@@ -44,16 +62,52 @@ class TrafficLights:
 
         return roads
 
-    def _next_cycle(self) -> None:
-        green_lights = next(self.cycle_green_lights)
+    def _compile_timetable(self, cycle_times: list[float]) -> None:
+        if min(cycle_times) <= 0:
+            raise ValueError("Each phase must last a positive time!")
+
+        self.cycle_times = list(cycle_times)
+        self.period = sum(self.cycle_times)
+        # Ends of the phases, measured from the start of the cycle.
+        self.phase_end_times = list(itertools.accumulate(self.cycle_times))
+
+    def locate(self, time: float) -> tuple[int, float]:
+        """Phase of the lights at `time` and the time it ends"""
+        cycles, elapsed_time = divmod(
+            time - self.cycle_start_time + self.SWITCH_TOLERANCE, self.period
+        )
+        phase = min(
+            bisect.bisect_right(self.phase_end_times, elapsed_time), len(self.cycle_times) - 1
+        )
+
+        return phase, self.cycle_start_time + cycles * self.period + self.phase_end_times[phase]
+
+    def phase_at(self, time: float) -> int:
+        return self.locate(time)[0]
+
+    def green_lights_at(self, time: float) -> tuple[bool]:
+        return self.cycle_green_lights[self.phase_at(time)]
+
+    def update(self, time: float) -> bool:
+        """Set the state of the roads for `time` if the lights switched since the last update"""
+        if time + self.SWITCH_TOLERANCE < self.next_switch_time:
+            return False
+
+        self.phase, self.next_switch_time = self.locate(time)
+        for road, green_light in zip(self.roads, self.cycle_green_lights[self.phase]):
+            road.set_green_light(green_light)
 
-        for n, road in enumerate(self.roads):
-            road.set_green_light(green_lights[n])
+        return True
 
-        self.counter = next(self.cycle_times)
+    def set_cycle_times(self, cycle_times: list[float]) -> None:
+        """Change the timings, the time already spent in the current phase counts in the new one
 
-    def tic(self, time_step: float) -> None:
-        self.counter -= time_step
+        The lights switch at the next `update` if the current phase is already over.
+        """
+        if len(cycle_times) != len(self.cycle_times):
+            raise ValueError("The length of cycle_times must not change!")
 
-        if self.counter <= 0:
-            self._next_cycle()
+        phase_start_time = self.next_switch_time - self.cycle_times[self.phase]
+        self._compile_timetable(cycle_times)
+        self.cycle_start_time = phase_start_time - sum(self.cycle_times[: self.phase])
+        self.next_switch_time = phase_start_time + self.cycle_times[self.phase]
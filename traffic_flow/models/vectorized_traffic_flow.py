@@ -0,0 +1,530 @@
+from __future__ import annotations
+
+import math
+from typing import Iterable
+
+import numpy as np
+
+from .integration_schemes import IntegrationScheme
+from .recorder import Recorder
+from .traffic_flow import TrafficFlow
+from .traffic_lights import TrafficLights
+from .vehicle import DEFAULT_VEHICLE_STARTING_PROPERTIES, max_entry_velocity
+from .vehicles_state import VehiclesState
+
+
+class VectorizedTrafficFlow(TrafficFlow):
+    """Single simulation of a traffic flow advanced with array operations
+
+    Follows the same model as `TrafficFlow` (and `Vehicle.move`), but keeps the state of all
+    the vehicles in a `VehiclesState` and updates all of them at once in each tick. Only the
+    rare events - entering, changing and leaving roads - are handled one vehicle at a time.
+    """
+
+    STEP_COLUMNS = ("position", "velocity", "acceleration", "max_velocity", "slower_zone")
+
+    def __init__(
+        self,
+        vehicles_specification: Iterable[dict],
+        roadmap: dict[str, "Road"],  # type: ignore # noqa
+        traffic_lights: list[TrafficLights] | None = None,
+        recorder: Recorder | None = None,
+        integration_scheme: IntegrationScheme | None = None,
+    ) -> None:
+        super().__init__(
+            vehicles_specification, roadmap, traffic_lights, recorder, integration_scheme
+        )
+
+        self.state = VehiclesState()
+        self.routes: list[list[int]] = []
+
+        self.roads = list(roadmap.values())
+        self.road_lengths = np.array([road.length for road in self.roads])
+        self.road_tails = [-1] * len(self.roads)
+        self._set_up_roads_traffic_lights()
+
+    def _set_up_roads_traffic_lights(self) -> None:
+        self.roads_with_traffic_lights = np.array(
+            [road.traffic_lights is not None for road in self.roads]
+        )
+        self.approaching_speeds = np.zeros(len(self.roads))
+        self.slowing_down_distances = np.zeros(len(self.roads))
+        self.stopping_distances = np.zeros(len(self.roads))
+
+        for n, road in enumerate(self.roads):
+            if (traffic_lights := road.traffic_lights) is not None:
+                self.approaching_speeds[n] = traffic_lights.approaching_speed
+                self.slowing_down_distances[n] = traffic_lights.slowing_down_distance
+                self.stopping_distances[n] = traffic_lights.stopping_distance
+
+        self._update_red_lights()
+
+    def _update_red_lights(self) -> None:
+        self.red_lights = self.roads_with_traffic_lights & np.array(
+            [not road.green_light for road in self.roads]
+        )
+
+    def _update_traffic_lights(self, time: float) -> None:
+        # The state of all the roads is gathered into an array only when any lights switch.
+        super()._update_traffic_lights(time)
+        self._update_red_lights()
+
+    def _shared_objects(self) -> list:
+        # Routes of the vehicles are never modified, only the list of them is.
+        return [
+            *super()._shared_objects(),
+            self.road_lengths,
+            self.roads_with_traffic_lights,
+            self.approaching_speeds,
+            self.slowing_down_distances,
+            self.stopping_distances,
+            *self.routes,
+        ]
+
+    def _prepare_route(self, route: list[str]) -> list[int]:
+        return list(self.network.route_ids(route))
+
+    def _vehicle_values(self, vehicle_specification: dict, vehicle_id: int) -> dict:
+        """Row of the state of a new vehicle, apart from its road and leader"""
+        vehicle_type = self._vehicle_type(vehicle_specification)
+        values = vehicle_type.as_dict() | DEFAULT_VEHICLE_STARTING_PROPERTIES
+        values |= vehicle_specification.get("vehicle_starting_properties", {})
+
+        return values | {
+            "max_velocity": vehicle_type.desired_velocity,
+            "vehicle_id": vehicle_id,
+            "route_step": 0,
+            "start_time": self.time,
+            "slower_zone": False,
+        }
+
+    def _add_vehicle(self, values: dict, route: list[int]) -> None:
+        first_road = route[0]
+        row = self.state.append(values | {"road": first_road, "leader": -1})
+        self._insert(row, first_road)
+        self.routes.append(route)
+
+    def _entries(self, vehicle_specification: dict) -> list[int]:
+        return [self._prepare_route(vehicle_specification["route"])[0]]
+
+    def _entry_gap(self, entry: int) -> float:
+        if (tail := self.road_tails[entry]) < 0:
+            return math.inf
+        return self.state["position"][tail] - self.state["vehicle_length"][tail]
+
+    def start_vehicle_ride(self, vehicle_specification: dict, vehicle_id: int, entry: int) -> None:
+        # Entries of `BatchedTrafficFlow` are the first roads of the route in other variants.
+        route = self._prepare_route(vehicle_specification["route"])
+        offset = entry - route[0]
+        self._add_vehicle(
+            self._vehicle_values(vehicle_specification, vehicle_id),
+            [offset + road for road in route],
+        )
+
+    def _red_lights(self) -> np.ndarray:
+        return self.red_lights
+
+    def _accelerations(self, heads: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Calculate accelerations, max velocities and slower zone flags of all the vehicles
+
+        Only the `heads` react to the traffic lights. The state itself is not modified.
+        """
+        state = self.state
+        position = state["position"]
+        velocity = state["velocity"]
+        road = state["road"]
+        leader = state["leader"]
+        max_velocity = state["max_velocity"]
+        slower_zone = state["slower_zone"]
+
+        red_light = heads & self._red_lights()[road]
+        stopping = None
+
+        if red_light.any():
+            distance_to_node = self.road_lengths[road] - position
+
+            slowing_down = red_light & (distance_to_node < self.slowing_down_distances[road])
+            max_velocity = np.where(slowing_down, self.approaching_speeds[road], max_velocity)
+            slower_zone = slower_zone | slowing_down
+            stopping = red_light & (distance_to_node < self.stopping_distances[road])
+
+        if slower_zone.any():
+            speeding_up = slower_zone & ~red_light
+            max_velocity = np.where(speeding_up, state["desired_velocity"], max_velocity)
+            slower_zone = slower_zone & red_light
+
+        acceleration = state["maximum_acceleration"] * (
+            1 - (velocity / max_velocity) ** state["acceleration_exponent"]
+        )
+
+        # Vehicles without a leader follow themselves, the values calculated for them are masked.
+        has_leader = leader >= 0
+        leaders = np.where(has_leader, leader, np.arange(len(state)))
+        net_distance = position[leaders] - position - state["vehicle_length"]
+        desired_minimum_gap = (
+            state["mininimal_desired_distance"]
+            + state["driver_reaction_time"] * velocity
+            + velocity * (velocity - velocity[leaders]) / state["two_sqrt_ab"]
+        )
+        acceleration -= np.where(has_leader, (desired_minimum_gap / net_distance) ** 2, 0)
+
+        if stopping is not None:
+            acceleration = np.where(
+                stopping, -state["desired_deceleration"] * velocity / max_velocity, acceleration
+            )
+
+        return acceleration, max_velocity, slower_zone
+
+    def _integrate(self, acceleration: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Calculate positions and velocities after a single time step"""
+        return self.integration_scheme.integrate_arrays(
+            self.state["position"], self.state["velocity"], acceleration, self.time_step
+        )
+
+    def _step(self, heads: np.ndarray) -> tuple[np.ndarray, ...]:
+        acceleration, max_velocity, slower_zone = self._accelerations(heads)
+        position, velocity = self._integrate(acceleration)
+
+        return position, velocity, acceleration, max_velocity, slower_zone
+
+    def _commit(self, step: tuple[np.ndarray, ...], rows: np.ndarray | slice) -> None:
+        for name, values in zip(self.STEP_COLUMNS, step):
+            self.state[name][rows] = values[rows]
+
+    def _change_roads(
+        self, crossing: np.ndarray, start_of_tick: tuple[np.ndarray, np.ndarray]
+    ) -> tuple[list[int], list[int], list[int]]:
+        """Move vehicles past the end of their road to the next one
+
+        Returns the vehicles which finished their ride, the ones which entered a road that
+        `TrafficFlow` visits later in the same tick (so they are moved once more there) and the
+        vehicles on such roads they got in front of (which move behind them there instead).
+        `start_of_tick` - positions and velocities before the move - is what `TrafficFlow`
+        sees of the vehicles on such a road when one enters it, they have not moved yet.
+        """
+        state = self.state
+        position = state["position"]
+        velocity = state["velocity"]
+        start_position, start_velocity = start_of_tick
+        road = state["road"]
+        leader = state["leader"]
+        route_step = state["route_step"]
+
+        # Same order as roads (and vehicles on them) are visited in `TrafficFlow`.
+        crossing = crossing[np.lexsort((-position[crossing], road[crossing]))]
+
+        finished = []
+        # Vehicles which entered a road visited later, by the road, until they are moved there.
+        entered_later_roads: dict[int, list[int]] = {}
+        overtaken: dict[int, list[int]] = {}
+        for row in crossing.tolist():
+            current_road = road[row]
+            # The head leaves its follower without a leader, a vehicle which overtook the head
+            # leaves it to its own leader.
+            leader[leader == row] = leader[row]
+            if self.road_tails[current_road] == row:
+                self.road_tails[current_road] = int(leader[row])
+
+            route = self.routes[row]
+            next_step = route_step[row] + 1
+            if next_step == len(route):
+                finished.append(row)
+                continue
+
+            next_road = route[next_step]
+            route_step[row] = next_step
+            road[row] = next_road
+            position[row] -= self.road_lengths[current_road]
+            start_position[row] = position[row]
+            start_velocity[row] = velocity[row]
+            if self._postpones_joining(next_road):
+                continue
+            if next_road > current_road:
+                follower = self._insert(row, next_road, start_position, start_velocity)
+                entered_later_roads.setdefault(next_road, []).append(row)
+                if follower >= 0:
+                    overtaken.setdefault(next_road, []).append(follower)
+            else:
+                # `TrafficFlow` has visited the road, the vehicles which entered it earlier in
+                # the tick have moved there.
+                if (moved_rows := entered_later_roads.pop(next_road, None)) is not None:
+                    self._move_entered(moved_rows, overtaken.pop(next_road, []), start_of_tick)
+                self._insert(row, next_road)
+            start_position[row] = position[row]
+            start_velocity[row] = velocity[row]
+
+        if self.instrumentation is not None:
+            self.instrumentation.count("road_changes", len(crossing) - len(finished))
+
+        return (
+            finished,
+            [row for rows in entered_later_roads.values() for row in rows],
+            [row for rows in overtaken.values() for row in rows],
+        )
+
+    def _postpones_joining(self, road: int) -> bool:
+        """Whether `_change_roads` leaves the vehicles entering `road` off its queue for now"""
+        return False
+
+    def _move_entered(
+        self, rows: list[int], overtaken: list[int], start_of_tick: tuple[np.ndarray, np.ndarray]
+    ) -> None:
+        """Move the vehicles which entered a road `TrafficFlow` visits later once more
+
+        As there, the vehicles ahead of them on the road are seen as they were before their
+        own move - `start_of_tick`, where the vehicles which entered a road are at their entry.
+        The `overtaken` vehicles they got in front of make their move of the tick again, from
+        `start_of_tick`, behind them.
+        """
+        state = self.state
+        position = state["position"]
+        velocity = state["velocity"]
+
+        moved_position, moved_velocity = position.copy(), velocity.copy()
+        position[:], velocity[:] = start_of_tick
+        step = self._step(state["leader"] < 0)
+        position[:], velocity[:] = moved_position, moved_velocity
+
+        self._commit(step, list(set(rows).union(overtaken)))
+        state["start_time"][rows] -= self.time_step
+
+    def _insert(
+        self,
+        row: int,
+        road: int,
+        positions: np.ndarray | None = None,
+        velocities: np.ndarray | None = None,
+    ) -> int:
+        """Link the vehicle entering the road between its leader and follower by position
+
+        As `Road.add_vehicle` of `TrafficFlow`: usually behind the tail, but a vehicle merging
+        from another road may be ahead of the ones which entered before it, and it queues
+        behind the vehicles it would come too close to. Only the vehicles behind it are
+        visited, following the leaders from the tail. `positions` and `velocities` of the
+        vehicles on the road are the current ones unless given. Returns the follower, -1 at
+        the tail.
+        """
+        state = self.state
+        leader = state["leader"]
+        vehicle_length = state["vehicle_length"]
+        minimal_distance = state["mininimal_desired_distance"][row]
+        positions = state["position"] if positions is None else positions
+        velocities = state["velocity"] if velocities is None else velocities
+        position = state["position"][row]
+
+        # Vehicles behind the new one, from the tail.
+        behind = []
+        vehicle_ahead = self.road_tails[road]
+        while vehicle_ahead >= 0 and positions[vehicle_ahead] < position:
+            behind.append(vehicle_ahead)
+            vehicle_ahead = leader[vehicle_ahead]
+
+        new_position = position
+        if vehicle_ahead >= 0:
+            new_position = min(
+                new_position,
+                positions[vehicle_ahead] - vehicle_length[vehicle_ahead] - minimal_distance,
+            )
+        while behind and (
+            new_position - vehicle_length[row] - positions[behind[-1]] < minimal_distance
+        ):
+            vehicle_ahead = behind.pop()
+            new_position = (
+                positions[vehicle_ahead] - vehicle_length[vehicle_ahead] - minimal_distance
+            )
+
+        state["position"][row] = new_position
+        if vehicle_ahead >= 0:
+            state["velocity"][row] = min(
+                state["velocity"][row],
+                max_entry_velocity(
+                    positions[vehicle_ahead] - vehicle_length[vehicle_ahead] - new_position,
+                    velocities[vehicle_ahead],
+                    state["maximum_acceleration"][row],
+                    minimal_distance,
+                    state["driver_reaction_time"][row],
+                    state["two_sqrt_ab"][row],
+                ),
+            )
+
+        leader[row] = vehicle_ahead
+        if not behind:
+            self.road_tails[road] = row
+            return -1
+
+        leader[behind[-1]] = row
+        return behind[-1]
+
+    def _retire_vehicles(self, finished: list[int]) -> None:
+        state = self.state
+        vehicle_id = state["vehicle_id"]
+
+        # Vehicles are retired in the order they were started, as in `TrafficFlow.update`.
+        finished = sorted(finished, key=lambda row: vehicle_id[row])
+        self._record_travel_times(finished)
+        self._drop_rows(finished)
+
+    def _drop_rows(self, rows: list[int]) -> None:
+        keep = np.ones(len(self.state), dtype=bool)
+        keep[rows] = False
+        new_rows = self.state.compress(keep)
+
+        self.routes = [route for route, kept in zip(self.routes, keep) if kept]
+        self.road_tails = [-1 if tail < 0 else int(new_rows[tail]) for tail in self.road_tails]
+
+    def _free_flow_times(self, finished: list[int]) -> np.ndarray:
+        """Travel times of the vehicles if they drove their routes at the desired velocity"""
+        route_lengths = [self.road_lengths[self.routes[row]].sum() for row in finished]
+        return np.array(route_lengths) / self.state["desired_velocity"][finished]
+
+    def _record_travel_times(self, finished: list[int]) -> None:
+        state = self.state
+        vehicle_ids = state["vehicle_id"][finished]
+        travel_times = self.time + self.time_step - state["start_time"][finished]
+
+        self.recorder.record_travel_times(vehicle_ids, travel_times)
+        self.recorder.record_delays(vehicle_ids, travel_times - self._free_flow_times(finished))
+
+    def needs_fine_time_step(self, lookahead_time: float, velocity_tolerance: float) -> bool:
+        if not self.state:
+            return False
+
+        state = self.state
+        if (np.abs(state["acceleration"]) * lookahead_time > velocity_tolerance).any():
+            return True
+
+        position = state["position"]
+        velocity = state["velocity"]
+        road = state["road"]
+        leader = state["leader"]
+        reach = velocity * lookahead_time
+        moving = velocity > 0
+
+        moving_heads = (leader < 0) & moving
+        distance_to_node = self.road_lengths[road] - position
+
+        in_lights_zone = distance_to_node < self.slowing_down_distances[road]
+        if (
+            self.next_traffic_lights_switch_time - self.time < lookahead_time
+            and in_lights_zone.any()
+        ):
+            return True
+
+        if (moving_heads & (distance_to_node < reach)).any():
+            return True
+
+        approaching_red_lights = moving_heads & self._red_lights()[road]
+        if approaching_red_lights.any():
+            for zone_distances in (self.slowing_down_distances, self.stopping_distances):
+                distance_to_zone = distance_to_node - zone_distances[road]
+                near_zone = (distance_to_zone >= 0) & (distance_to_zone < reach)
+                if (approaching_red_lights & near_zone).any():
+                    return True
+
+            in_stopping_zone = distance_to_node < self.stopping_distances[road]
+            approaching_speed = self.approaching_speeds[road]
+
+            stopping = np.flatnonzero(approaching_red_lights & in_stopping_zone)
+            creep = (
+                velocity[stopping]
+                * approaching_speed[stopping]
+                / state["desired_deceleration"][stopping]
+            )
+            if (creep + reach[stopping] >= distance_to_node[stopping]).any():
+                return True
+
+            slowing_down = np.flatnonzero(
+                approaching_red_lights & in_lights_zone & ~in_stopping_zone
+            )
+            braking = state["maximum_acceleration"][slowing_down] * (
+                (velocity[slowing_down] / approaching_speed[slowing_down])
+                ** state["acceleration_exponent"][slowing_down]
+                - 1
+            )
+            if (braking * lookahead_time > velocity_tolerance).any():
+                return True
+
+        followers = np.flatnonzero(leader >= 0)
+        leaders = leader[followers]
+        followers_moving = moving[followers] | moving[leaders]
+        followers, leaders = followers[followers_moving], leaders[followers_moving]
+
+        net_distance = position[leaders] - position[followers] - state["vehicle_length"][followers]
+        approaching_rate = np.maximum(velocity[followers] - velocity[leaders], 0)
+        critical_gap = (
+            state["mininimal_desired_distance"][followers]
+            + reach[followers]
+            + approaching_rate * lookahead_time
+        )
+
+        return bool((net_distance < critical_gap).any())
+
+    def _move_vehicles(self) -> None:
+        if self.state:
+            self._move_state()
+
+    def _move_state(self) -> None:
+        leader = self.state["leader"]
+        road_lengths = self.road_lengths[self.state["road"]]
+
+        heads = leader < 0
+        step = self._step(heads)
+        crossing = step[0] > road_lengths
+
+        if any_crossing := crossing.any():
+            # In `TrafficFlow` the vehicle behind the one leaving the road already acts as the
+            # head.
+            new_heads = (leader >= 0) & crossing[leader]
+            if new_heads.any():
+                step = self._step(heads | new_heads)
+                crossing = step[0] > road_lengths
+
+        if self.instrumentation is not None:
+            self.instrumentation.count(
+                "red_light_stops",
+                int(np.count_nonzero((step[1] == 0) & (self.state["velocity"] > 0))),
+            )
+
+        if not any_crossing:
+            self._commit(step, slice(None))
+            return
+
+        start_of_tick = self.state["position"].copy(), self.state["velocity"].copy()
+        self._commit(step, slice(None))
+        finished, entered_later_roads, overtaken = self._change_roads(
+            np.flatnonzero(crossing), start_of_tick
+        )
+
+        if entered_later_roads:
+            self._move_entered(entered_later_roads, overtaken, start_of_tick)
+
+        if finished:
+            self._retire_vehicles(finished)
+
+    def _has_active_vehicles(self) -> bool:
+        return bool(self.state)
+
+    def _active_vehicles_count(self) -> int:
+        return len(self.state)
+
+    def unfinished_travel_times(self) -> list[float]:
+        return (self.time - self.state["start_time"]).tolist()
+
+    def update(self):
+        if not self.state and self.next_vehicle_ride_start_time is None:
+            self.stop_simulation = True
+
+    def _record(self) -> None:
+        if not self.state:
+            return
+
+        state = self.state
+        self.recorder.record_trajectories(
+            self.time + self.time_step,
+            state["vehicle_id"],
+            state["road"],
+            state["position"],
+            state["velocity"],
+            state["acceleration"],
+            self.time_step,
+        )
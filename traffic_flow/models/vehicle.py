@@ -1,143 +1,223 @@
 # Postpone evaluation of annotations so you can use own class in a method definitions.
 from __future__ import annotations
 
-from collections import defaultdict, deque
+import math
+from collections import deque
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .integration_schemes import IntegrationScheme
 
 # from traffic_flow.models.road import Road
 
+DEFAULT_VEHICLE_CONFIGS = {
+    "vehicle_length": 5,  # l, m
+    "desired_velocity": 33.333,  # v0, m/s
+    "maximum_acceleration": 0.73,  # a, m/s²
+    "desired_deceleration": 1.67,  # b, m/s²,
+    "mininimal_desired_distance": 2,  # s0, m
+    "acceleration_exponent": 4,  # delta
+    "driver_reaction_time": 1.6,  # T, s
+}
+
+# Strongest braking of a vehicle entering a road, about the physical limit on a dry road, m/s².
+MAXIMUM_DECELERATION = 9.0
+
+DEFAULT_VEHICLE_STARTING_PROPERTIES = {
+    "position": 0.0,
+    "velocity": 0,
+    "acceleration": 0,
+}
+
+
+def max_entry_velocity(
+    gap: float,
+    leader_velocity: float,
+    maximum_acceleration: float,
+    mininimal_desired_distance: float,
+    driver_reaction_time: float,
+    two_sqrt_ab: float,
+) -> float:
+    """Highest velocity of a vehicle entering a road `gap` behind its leader
+
+    The one at which the interaction term of the acceleration is `MAXIMUM_DECELERATION`. A
+    vehicle coming onto a road right behind a slower one (it had no leader on the previous road)
+    would brake with hundreds of m/s², it enters as slow as such braking would leave it.
+    """
+    # Desired minimum gap of the model at which the interaction term is the maximum one.
+    desired_minimum_gap = gap * math.sqrt(MAXIMUM_DECELERATION / maximum_acceleration)
+    # s0 + v * T + v * (v - v_leader) / (2 * sqrt(a * b)) = desired_minimum_gap, solved for v.
+    linear_coefficient = driver_reaction_time - leader_velocity / two_sqrt_ab
+    free_gap = max(desired_minimum_gap - mininimal_desired_distance, 0.0)
+    return (
+        two_sqrt_ab
+        / 2
+        * (-linear_coefficient + math.sqrt(linear_coefficient**2 + 4 * free_gap / two_sqrt_ab))
+    )
+
+
+class VehicleType:
+    """Parameters of the model shared by all the vehicles of the same type
+
+    Get them with `VehicleType.from_configs` - equal configs give the very same instance, so
+    thousands of identical vehicles point at a single record. Constants derived from the
+    parameters are calculated once per type.
+    """
+
+    __slots__ = (*DEFAULT_VEHICLE_CONFIGS, "two_sqrt_ab")
+
+    _types: dict[tuple, VehicleType] = {}
+
+    def __init__(self, **vehicle_configs) -> None:
+        self.vehicle_length: float  # l, m
+        self.desired_velocity: float  # v0, m/s
+        self.maximum_acceleration: float  # a, m/s²
+        self.desired_deceleration: float  # b, m/s²,
+        self.mininimal_desired_distance: float  # s0, m
+        self.acceleration_exponent: float  # delta
+        self.driver_reaction_time: float  # T, s
+
+        for key, value in (DEFAULT_VEHICLE_CONFIGS | vehicle_configs).items():
+            setattr(self, key, value)
+
+        # Constant part of the interaction term of the model.
+        self.two_sqrt_ab = 2 * (self.maximum_acceleration * self.desired_deceleration) ** (1 / 2)
+
+    @classmethod
+    def from_configs(cls, vehicle_configs: dict | None = None) -> VehicleType:
+        vehicle_configs = DEFAULT_VEHICLE_CONFIGS | (vehicle_configs or {})
+        key = tuple(sorted(vehicle_configs.items()))
+
+        if (vehicle_type := cls._types.get(key)) is None:
+            vehicle_type = cls._types[key] = cls(**vehicle_configs)
+        return vehicle_type
+
+    def as_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __copy__(self) -> VehicleType:
+        return self
+
+    def __deepcopy__(self, memo: dict) -> VehicleType:
+        # Types are immutable and shared, copies of simulations keep pointing at them.
+        return self
+
 
 class Vehicle:
     """Single agent in a simulation
 
     A vehicle is defined by a set of parameters required by the model
-    (references will be placed in README).
+    (references will be placed in README). The parameters are kept in a `vehicle_type` shared
+    with other vehicles (given directly or built from `vehicle_configs`).
     """
 
+    __slots__ = (
+        "route",
+        "remaining_roads",
+        "current_road",
+        "vehicle_id",
+        "vehicle_type",
+        "leading_vehicle",
+        "following_vehicle",
+        "is_ride_finished",
+        "position",
+        "velocity",
+        "acceleration",
+        "new_position",
+        "new_velocity",
+        "max_velocity",
+        "slower_zone",
+        "travel_time",
+    )
+
     def __init__(
         self,
         route: list[str],
-        # TODO: Refactor this mess.
         vehicle_configs: dict | None = None,
         vehicle_starting_properties: dict | None = None,
-        ride_data: dict | None = None,
+        vehicle_type: VehicleType | None = None,
     ) -> None:
         if not route:
             raise ValueError("Each vehicle must have non-empty route!")
-        self.route = deque(route)
-        self.ride_data = self._initialize_ride_data(ride_data)
-
-        self._set_vehicle_configs(vehicle_configs)
-        self._set_vehicle_starting_properties(vehicle_starting_properties)
+        self.route = list(route)
+        self.vehicle_id: int | None = None  # Set by the simulation the vehicle takes part in.
+        self.vehicle_type = (
+            vehicle_type if vehicle_type is not None else VehicleType.from_configs(vehicle_configs)
+        )
 
-        self.leading_vehicle = None
+        self.leading_vehicle: Vehicle | None = None
+        self.following_vehicle: Vehicle | None = None
         self.is_ride_finished = False
 
-        self.vehicle_length: int  # l, m
-        self.desired_velocity: float  # v0, m/s
-        self.maximum_acceleration: float  # a, m/s²
-        self.desired_deceleration: float  # b, m/s²,
-        self.mininimal_desired_distance: float  # s0, m
-        self.acceleration_exponent: float  # delta
-        self.driver_reaction_time: float  # T, s
-
         # Position in meters with respect to the road the vehicle is currently on.
-        self.position: float
-        self.velocity: float
-        self.acceleration: float
+        starting_properties = DEFAULT_VEHICLE_STARTING_PROPERTIES | (
+            vehicle_starting_properties or {}
+        )
+        self.position: float = starting_properties["position"]
+        self.velocity: float = starting_properties["velocity"]
+        self.acceleration: float = starting_properties["acceleration"]
 
-        self.new_position: float
-        self.new_velocity: float
+        self.new_position = self.position
+        self.new_velocity = self.velocity
 
-        self.max_velocity = self.desired_velocity
+        self.max_velocity = self.vehicle_type.desired_velocity
         self.slower_zone = False
 
         self.travel_time = 0
 
-    def _set_attributes(self, attributes: dict) -> None:
-        for key, value in attributes.items():
-            setattr(self, key, value)
-
-    def _set_vehicle_configs(self, vehicle_configs: dict | None) -> None:
-        default_vehicle_configs = {
-            "vehicle_length": 5,  # l, m
-            "desired_velocity": 33.333,  # v0, m/s
-            "maximum_acceleration": 0.73,  # a, m/s²
-            "desired_deceleration": 1.67,  # b, m/s²,
-            "mininimal_desired_distance": 2,  # s0, m
-            "acceleration_exponent": 4,  # delta
-            "driver_reaction_time": 1.6,  # T, s
-        }
-
-        if vehicle_configs:
-            default_vehicle_configs |= vehicle_configs
-
-        self._set_attributes(default_vehicle_configs)
-
-    def _set_vehicle_starting_properties(self, vehicle_starting_properties: dict | None) -> None:
-        default_vehicle_starting_properties = {
-            "position": 0.0,
-            "velocity": 0,
-            "acceleration": 0,
+    def __getstate__(self) -> dict:
+        # The links to the neighbouring vehicles are restored by the road (see
+        # `Road.__setstate__`), pickling them would recurse along the whole queue.
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in ("leading_vehicle", "following_vehicle") and hasattr(self, name)
         }
 
-        if vehicle_starting_properties:
-            default_vehicle_starting_properties |= vehicle_starting_properties
-
-        self._set_attributes(default_vehicle_starting_properties)
+    def __setstate__(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
 
-        for key, value in default_vehicle_starting_properties.items():
-            setattr(self, "_".join(["new", key]), value)
+        # The road may have linked the vehicle already, when it was unpickled first.
+        for name in ("leading_vehicle", "following_vehicle"):
+            if not hasattr(self, name):
+                setattr(self, name, None)
 
-    def start_ride(self, roadmap: dict[str, "Road"]) -> None:  # type: ignore # noqa
-        first_road = roadmap[self.route.popleft()]
+    def start_ride(self, road_network: "RoadNetwork") -> None:  # type: ignore # noqa
+        # Roads still ahead of the vehicle, validated by the network once per route.
+        self.remaining_roads = deque(road_network.route_roads(self.route))
+        first_road = self.remaining_roads.popleft()
         self.current_road = first_road
-        if first_road.vehicles:
-            self.leading_vehicle = first_road.vehicles[-1]
 
         first_road.add_vehicle(self)
 
     def _change_road(self, distance_passed: float) -> None:
-        try:
-            next_road_name = self.route.popleft()
-            next_road = self.current_road.get_next_road(next_road_name)
-
-            self.current_road = next_road
-            if next_road.vehicles:
-                self.leading_vehicle = next_road.vehicles[-1]
-            else:
-                self.leading_vehicle = None
-
-            next_road.add_vehicle(self)
-            self.new_position = distance_passed
-
-        except IndexError:
+        if not self.remaining_roads:
             self.is_ride_finished = True
+            return
 
-    def _initialize_ride_data(self, ride_data: dict | None) -> dict:
-        if ride_data is None:
-            ride_data = {}
-
-        roads_data = {}
-        for road_name in self.route:
-            roads_data[road_name] = defaultdict(list)
+        next_road = self.remaining_roads.popleft()
+        self.current_road = next_road
 
-        ride_data["roads_data"] = roads_data
-        return ride_data
+        # The position decides where between the vehicles on the next road this one goes.
+        self.new_position = distance_passed
+        next_road.add_vehicle(self)
 
-    def _update_free_road_acceleration_component(self):
-        return self.maximum_acceleration * (
-            1 - (self.velocity / self.max_velocity) ** self.acceleration_exponent
+    def _update_free_road_acceleration_component(self, vehicle_type: VehicleType):
+        return vehicle_type.maximum_acceleration * (
+            1 - (self.velocity / self.max_velocity) ** vehicle_type.acceleration_exponent
         )
 
-    def _update_leading_vehicle_acceleration_component(self, leading_vehicle: Vehicle):
+    def _update_leading_vehicle_acceleration_component(
+        self, vehicle_type: VehicleType, leading_vehicle: Vehicle
+    ):
         approaching_rate = self.velocity - leading_vehicle.velocity
-        net_distance = leading_vehicle.position - self.position - self.vehicle_length
+        net_distance = leading_vehicle.position - self.position - vehicle_type.vehicle_length
 
         desired_minimum_gap = (
-            self.mininimal_desired_distance
-            + self.driver_reaction_time * self.velocity
-            + (self.velocity * approaching_rate)
-            / (2 * (self.maximum_acceleration * self.desired_deceleration) ** (1 / 2))
+            vehicle_type.mininimal_desired_distance
+            + vehicle_type.driver_reaction_time * self.velocity
+            + (self.velocity * approaching_rate) / vehicle_type.two_sqrt_ab
         )
 
         deceleration_term = desired_minimum_gap / net_distance
@@ -145,38 +225,31 @@ class Vehicle:
         return -(deceleration_term**2)
 
     def _update_acceleration(self) -> None:
-        acceleration = self._update_free_road_acceleration_component()
+        vehicle_type = self.vehicle_type
+        acceleration = self._update_free_road_acceleration_component(vehicle_type)
 
         if self.leading_vehicle:
             acceleration += self._update_leading_vehicle_acceleration_component(
-                self.leading_vehicle
+                vehicle_type, self.leading_vehicle
             )
 
         self.acceleration = acceleration
 
-    def _calculate_updated_velocity(self, time_step: float):
-        return self.velocity + self.acceleration * time_step
-
-    def _update_position(self, time_step: float):
-        self.new_position += self.new_velocity * time_step + (self.acceleration * time_step**2) / 2
-
-    def _update_position_negative_velocity(self, time_step: float):
-        self.new_position -= self.new_velocity * time_step / 2
-
-    def _update_ride_data(self):
-        road_data = self.ride_data["roads_data"][self.current_road.road_name]
-
-        road_data["position"].append(self.new_position)
-        road_data["velocity"].append(self.new_velocity)
-        road_data["acceleration"].append(self.acceleration)
-
     def _slow_down(self, max_velocity: float):
         self.max_velocity = max_velocity
 
     def _stop_vehicle(self):
-        self.acceleration = -self.desired_deceleration * self.velocity / self.max_velocity
+        self.acceleration = (
+            -self.vehicle_type.desired_deceleration * self.velocity / self.max_velocity
+        )
+
+    def move(self, time_step: float, integration_scheme: IntegrationScheme | None = None) -> None:
+        if integration_scheme is None:
+            # The schemes import NumPy, the roads and vehicles alone do not need it.
+            from .integration_schemes import ExplicitScheme
+
+            integration_scheme = ExplicitScheme()
 
-    def move(self, time_step: float) -> None:
         # Swap variables.
         self.velocity = self.new_velocity
         self.position = self.new_position
@@ -184,7 +257,7 @@ class Vehicle:
         distance_to_node = self.current_road.length - self.position
 
         # Check only if the vehicle is first vehicle - others adapt according to the equation.
-        if self.current_road.vehicles.index(self) == 0:
+        if self.current_road.head_vehicle is self:
             if (
                 traffic_lights := self.current_road.traffic_lights
             ) and not self.current_road.green_light:
@@ -198,34 +271,26 @@ class Vehicle:
                     self._update_acceleration()
             else:
                 if self.slower_zone:
-                    self.max_velocity = self.desired_velocity
+                    self.max_velocity = self.vehicle_type.desired_velocity
                     self.slower_zone = False
                 self._update_acceleration()
         else:
             if self.slower_zone:
-                self.max_velocity = self.desired_velocity
+                self.max_velocity = self.vehicle_type.desired_velocity
                 self.slower_zone = False
             self._update_acceleration()
 
-        updated_velocity = self._calculate_updated_velocity(time_step)
-
-        if updated_velocity < 0:
-            self._update_position_negative_velocity(time_step)
-            self.new_velocity = 0
-        else:
-            self.new_velocity = updated_velocity
-            self._update_position(time_step)
+        self.new_position, self.new_velocity = integration_scheme.integrate(
+            self.position, self.velocity, self.acceleration, time_step
+        )
 
         # New distance!
         distance_to_node = self.current_road.length - self.new_position
-        # TODO: Optimize it later by making the road remember the first vehicle.
-        if self.current_road.vehicles.index(self) == 0:
+        if self.current_road.head_vehicle is self:
             self.leading_vehicle = None
 
         if distance_to_node < 0:
-            self.current_road.remove_vehicle()
+            self.current_road.remove_vehicle(self)
             self._change_road(-distance_to_node)
 
-        self._update_ride_data()
-
         self.travel_time += time_step
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import numpy as np
+
+from .vehicle import DEFAULT_VEHICLE_CONFIGS
+
+
+class VehiclesState:
+    """Struct-of-arrays storage of the vehicles taking part in a simulation
+
+    Every vehicle occupies one row, every property is a separate column. Active rows are kept
+    compact in `[0, len(self))`, the columns grow by doubling their capacity.
+    """
+
+    FLOAT_COLUMNS = (
+        "position",
+        "velocity",
+        "acceleration",
+        "max_velocity",
+        "two_sqrt_ab",  # 2 * sqrt(a * b), constant part of the IDM interaction term
+        "start_time",
+        *DEFAULT_VEHICLE_CONFIGS,
+    )
+    INT_COLUMNS = (
+        "vehicle_id",
+        "road",
+        "leader",  # row of the leading vehicle on the same road, -1 for the head vehicle
+        "route_step",
+    )
+    BOOL_COLUMNS = ("slower_zone",)
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.size = 0
+        self.capacity = capacity
+
+        self.columns: dict[str, np.ndarray] = {}
+        for dtype, names in (
+            (np.float64, self.FLOAT_COLUMNS),
+            (np.int64, self.INT_COLUMNS),
+            (np.bool_, self.BOOL_COLUMNS),
+        ):
+            for name in names:
+                self.columns[name] = np.zeros(capacity, dtype=dtype)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name][: self.size]
+
+    def __getstate__(self) -> dict:
+        # Only the active rows, not the spare capacity.
+        return {"size": self.size, "columns": {name: self[name].copy() for name in self.columns}}
+
+    def __setstate__(self, state: dict) -> None:
+        self.size = state["size"]
+        self.capacity = max(self.size, 64)
+        self.columns = {}
+        for name, column in state["columns"].items():
+            self.columns[name] = np.zeros(self.capacity, dtype=column.dtype)
+            self.columns[name][: self.size] = column
+
+    def _grow(self) -> None:
+        self.capacity *= 2
+        for name, column in self.columns.items():
+            grown_column = np.zeros(self.capacity, dtype=column.dtype)
+            grown_column[: self.size] = column[: self.size]
+            self.columns[name] = grown_column
+
+    def append(self, values: dict) -> int:
+        if self.size == self.capacity:
+            self._grow()
+
+        row = self.size
+        for name, value in values.items():
+            self.columns[name][row] = value
+        self.size += 1
+
+        return row
+
+    def compress(self, keep: np.ndarray) -> np.ndarray:
+        """Drop rows where `keep` is False
+
+        Returns an array mapping old rows to new ones (-1 for dropped rows), so the callers can
+        update the references they hold. Leader references are remapped here.
+        """
+        new_rows = np.full(self.size, -1, dtype=np.int64)
+        new_size = int(keep.sum())
+        new_rows[keep] = np.arange(new_size)
+
+        leader = self["leader"]
+        self.columns["leader"][: self.size] = np.where(leader >= 0, new_rows[leader], -1)
+
+        for name, column in self.columns.items():
+            column[:new_size] = column[: self.size][keep]
+        self.size = new_size
+
+        return new_rows
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import heapq
+import math
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from traffic_flow.models.vehicle import VehicleType
+
+
+class ArrivalProcess(ABC):
+    """Vehicles of a single kind entering the network on the same route
+
+    An iterator over the ride start times, drawn in chunks of `chunk_size` arrays - only the
+    current chunk is kept in memory. Arrivals happen in `[start_time, end_time)`, at most
+    `count` of them. `vehicle_type` is a `VehicleType` or a dict of vehicle configs.
+    """
+
+    def __init__(
+        self,
+        route: list[str | int],
+        vehicle_type: VehicleType | dict | None = None,
+        vehicle_starting_properties: dict | None = None,
+        start_time: float = 0.0,
+        end_time: float = math.inf,
+        count: int | None = None,
+        chunk_size: int = 1024,
+    ) -> None:
+        if not route:
+            raise ValueError("Each vehicle must have non-empty route!")
+
+        self.route = list(route)
+        self.vehicle_type = (
+            vehicle_type
+            if isinstance(vehicle_type, VehicleType)
+            else VehicleType.from_configs(vehicle_type)
+        )
+        self.vehicle_starting_properties = vehicle_starting_properties or {}
+        self.start_time = start_time
+        self.end_time = end_time
+        self.count = count
+        self.chunk_size = chunk_size
+
+        self.arrivals_count = 0
+        self._chunk = np.empty(0)
+        self._chunk_position = 0
+
+    @abstractmethod
+    def _next_chunk(self) -> np.ndarray:
+        """Next `chunk_size` arrival times, sorted, not yet limited by `end_time` or `count`"""
+
+    def __iter__(self) -> ArrivalProcess:
+        return self
+
+    def __next__(self) -> float:
+        if self.count is not None and self.arrivals_count >= self.count:
+            raise StopIteration
+
+        if self._chunk_position == len(self._chunk):
+            self._chunk = self._next_chunk()
+            self._chunk_position = 0
+
+        arrival_time = float(self._chunk[self._chunk_position])
+        if arrival_time >= self.end_time:
+            raise StopIteration
+
+        self._chunk_position += 1
+        self.arrivals_count += 1
+        return arrival_time
+
+    def vehicle_specification(self, ride_start_time: float) -> dict:
+        # The route and the vehicle type are shared by all the vehicles of the process.
+        return {
+            "route": self.route,
+            "vehicle_type": self.vehicle_type,
+            "vehicle_starting_properties": self.vehicle_starting_properties,
+            "ride_start_time": ride_start_time,
+        }
+
+
+class FixedHeadwayArrivals(ArrivalProcess):
+    """A vehicle every `headway` seconds, the first one at `start_time`"""
+
+    def __init__(self, route: list[str | int], headway: float, **kwargs) -> None:
+        if headway <= 0:
+            raise ValueError("Headway must be positive!")
+        super().__init__(route, **kwargs)
+        self.headway = headway
+
+    def _next_chunk(self) -> np.ndarray:
+        # Computed from the index of the arrival, so the times do not drift.
+        indices = np.arange(self.arrivals_count, self.arrivals_count + self.chunk_size)
+        return self.start_time + indices * self.headway
+
+
+class PoissonArrivals(ArrivalProcess):
+    """Arrivals with exponentially distributed headways, `rate` vehicles per second"""
+
+    def __init__(
+        self,
+        route: list[str | int],
+        rate: float,
+        seed: int | np.random.SeedSequence | None = None,
+        **kwargs,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError("Arrival rate must be positive!")
+        super().__init__(route, **kwargs)
+        self.rate = rate
+        self.random_generator = np.random.default_rng(seed)
+        self._last_arrival_time = self.start_time
+
+    def _next_chunk(self) -> np.ndarray:
+        chunk = self._last_arrival_time + np.cumsum(
+            self.random_generator.exponential(1 / self.rate, self.chunk_size)
+        )
+        self._last_arrival_time = chunk[-1]
+        return chunk
+
+
+class TimeVaryingPoissonArrivals(PoissonArrivals):
+    """Poisson arrivals with a piecewise constant rate
+
+    The rate is `rates[n]` vehicles per second from `rate_change_times[n]` until the next
+    change time (the last rate lasts until the end, a zero one ends the arrivals). Arrivals are
+    drawn with the maximal rate and thinned.
+    """
+
+    def __init__(
+        self,
+        route: list[str | int],
+        rate_change_times: list[float],
+        rates: list[float],
+        seed: int | np.random.SeedSequence | None = None,
+        **kwargs,
+    ) -> None:
+        if len(rate_change_times) != len(rates) or not rates:
+            raise ValueError("Each rate must have its change time!")
+        if np.any(np.diff(rate_change_times) <= 0):
+            raise ValueError("Rate change times must be increasing!")
+        if min(rates) < 0 or max(rates) == 0:
+            raise ValueError("Arrival rates must be non-negative, at least one positive!")
+
+        kwargs.setdefault("start_time", rate_change_times[0])
+        super().__init__(route, max(rates), seed, **kwargs)
+        self.rate_change_times = np.asarray(rate_change_times, dtype=float)
+        self.rates = np.asarray(rates, dtype=float)
+        if rates[-1] == 0:
+            self.end_time = min(self.end_time, rate_change_times[-1])
+
+    def rate_at(self, time: np.ndarray) -> np.ndarray:
+        periods = np.searchsorted(self.rate_change_times, time, side="right") - 1
+        return np.where(periods >= 0, self.rates[np.maximum(periods, 0)], 0)
+
+    def _next_chunk(self) -> np.ndarray:
+        while True:
+            candidates = super()._next_chunk()
+            accepted = self.random_generator.random(len(candidates)) * self.rate < self.rate_at(
+                candidates
+            )
+            # Times past the end are kept, so the iteration stops there.
+            if accepted.any() or candidates[-1] >= self.end_time:
+                return candidates[accepted | (candidates >= self.end_time)]
+
+
+class VehiclesStream:
+    """Time-ordered stream of vehicle specifications merged from many arrival processes
+
+    Specifications are built only when the simulation asks for the next vehicle, so the demand
+    never has to exist in memory as a whole. `vehicles_specifications` - explicitly listed
+    vehicles - are merged in as well.
+    """
+
+    def __init__(
+        self,
+        arrival_processes: list[ArrivalProcess],
+        vehicles_specifications: list[dict] | None = None,
+    ) -> None:
+        self.arrival_processes = arrival_processes
+        self.vehicles_specifications = sorted(
+            vehicles_specifications or [],
+            key=lambda specification: specification["ride_start_time"],
+        )
+        self._next_specification = 0
+
+        # Entries: (ride start time, process index), the index breaks ties deterministically.
+        self._heap: list[tuple[float, int]] = []
+        for n in range(len(arrival_processes)):
+            self._push_next_arrival(n)
+
+    def _push_next_arrival(self, process_index: int) -> None:
+        if (arrival_time := next(self.arrival_processes[process_index], None)) is not None:
+            heapq.heappush(self._heap, (arrival_time, process_index))
+
+    def __iter__(self) -> VehiclesStream:
+        return self
+
+    def __next__(self) -> dict:
+        specifications = self.vehicles_specifications
+        if self._next_specification < len(specifications) and (
+            not self._heap
+            or specifications[self._next_specification]["ride_start_time"] <= self._heap[0][0]
+        ):
+            self._next_specification += 1
+            return dict(specifications[self._next_specification - 1])
+
+        if not self._heap:
+            raise StopIteration
+
+        arrival_time, process_index = heapq.heappop(self._heap)
+        self._push_next_arrival(process_index)
+        return self.arrival_processes[process_index].vehicle_specification(arrival_time)
@@ -0,0 +1,253 @@
+import argparse
+import json
+import platform
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from traffic_flow import models
+from traffic_flow.simulation_helpers.arrival_processes import FixedHeadwayArrivals
+from traffic_flow.simulation_helpers.vehicle_generator import VehiclesGenerator
+
+ROAD_LENGTH = 2000  # m
+DESIRED_VELOCITY = 15  # m/s
+
+ENGINES = {
+    "object": models.TrafficFlow,
+    "vectorized": models.VectorizedTrafficFlow,
+}
+
+# The base case and each of the parameters scaled on its own.
+DEFAULT_CASES = [
+    {"intersections": 1, "vehicles_per_road": 10, "horizon": 600},
+    {"intersections": 1, "vehicles_per_road": 20, "horizon": 600},
+    {"intersections": 1, "vehicles_per_road": 40, "horizon": 600},
+    {"intersections": 4, "vehicles_per_road": 10, "horizon": 600},
+    {"intersections": 16, "vehicles_per_road": 10, "horizon": 600},
+    {"intersections": 1, "vehicles_per_road": 10, "horizon": 2400},
+]
+
+# Relative increase of a metric regarded as a regression. The runs are deterministic, so any
+# more ticks or vehicle updates mean more work.
+DEFAULT_TOLERANCES = {
+    "wall_time": 0.1,
+    "peak_memory_mb": 0.1,
+    "ticks": 0.0,
+    "vehicle_updates": 0.0,
+}
+
+# Metrics measured on another machine than the baseline are not comparable.
+MACHINE_DEPENDENT_METRICS = ("wall_time", "peak_memory_mb")
+
+# Committed with the repository, so the comparison has a reference on a fresh checkout.
+DEFAULT_BASELINE = Path(__file__).parents[2] / "benchmarks" / "baseline.json"
+
+
+def build_benchmark_scenario(
+    intersections: int,
+    vehicles_per_road: int,
+    horizon: float,
+    simulation_class: type[models.TrafficFlow] = models.TrafficFlow,
+) -> models.TrafficFlow:
+    """Independent copies of the simple traffic light intersection
+
+    Each intersection has two incoming roads with traffic lights and one outgoing road, so there
+    are `3 * intersections` roads. Vehicles arrive to the incoming roads with the headway which
+    keeps about `vehicles_per_road` of them on a freely flowing road, until `horizon`.
+    """
+    roadmap = {}
+    traffic_lights = []
+    vehicles_generator = VehiclesGenerator()
+    vehicle_type = models.VehicleType.from_configs({"desired_velocity": DESIRED_VELOCITY})
+    headway = ROAD_LENGTH / DESIRED_VELOCITY / vehicles_per_road
+
+    for intersection in range(intersections):
+        in_road1, in_road2, out_road = (
+            models.Road((0, 0), (ROAD_LENGTH, 0), f"{intersection}-{name}")
+            for name in ("in1", "in2", "out")
+        )
+        in_road1.add_next_road(out_road)
+        in_road2.add_next_road(out_road)
+        roadmap |= {road.road_name: road for road in (in_road1, in_road2, out_road)}
+
+        traffic_lights.append(
+            models.TrafficLights(
+                [in_road1, in_road2],
+                [30, 2, 30, 2],
+                [(True, False), (False, False), (False, True), (False, False)],  # type: ignore
+                approaching_speed=5,
+                slowing_down_distance=100,
+                stopping_distance=30,
+            )
+        )
+
+        for in_road in (in_road1, in_road2):
+            vehicles_generator.add_arrival_process(
+                FixedHeadwayArrivals(
+                    [in_road.road_name, out_road.road_name],
+                    headway,
+                    vehicle_type=vehicle_type,
+                    vehicle_starting_properties={"velocity": DESIRED_VELOCITY},
+                    end_time=horizon,
+                )
+            )
+
+    simulation = simulation_class(
+        vehicles_generator.vehicles_stream(),
+        roadmap,
+        traffic_lights,
+        models.Recorder(models.RecordingLevel.TRAVEL_TIMES),
+    )
+    simulation.total_time = horizon
+
+    return simulation
+
+
+def case_key(engine: str, case: dict) -> str:
+    return f"{engine}-{case['intersections']}x{case['vehicles_per_road']}-{case['horizon']}s"
+
+
+def _run_case(engine: str, case: dict) -> dict:
+    simulation = build_benchmark_scenario(**case, simulation_class=ENGINES[engine])
+
+    start = time.perf_counter()
+    simulation.run()
+    wall_time = time.perf_counter() - start
+
+    return {
+        "wall_time": wall_time,
+        "ticks": simulation.tick,
+        "ticks_per_second": simulation.tick / wall_time,
+        "finished_vehicles": len(simulation.travel_times),
+        # Peak resident memory of the whole process (kilobytes on Linux).
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _count_vehicle_updates(engine: str, case: dict) -> int:
+    # Instrumentation makes each tick do more work, so it counts in a run which is not timed.
+    simulation = build_benchmark_scenario(**case, simulation_class=ENGINES[engine])
+    simulation.instrumentation = models.Instrumentation()
+    simulation.run()
+
+    return simulation.instrumentation.counters["vehicle_updates"]
+
+
+def run_benchmarks(
+    engines: list[str] | None = None, cases: list[dict] | None = None, repeats: int = 3
+) -> dict:
+    """Run each case `repeats` times, each time in a fresh process, keep the fastest run
+
+    A fresh process per run keeps the peak memory of one case from hiding the next ones. The
+    runs are deterministic, so the vehicle updates are counted in one more, instrumented run.
+    """
+    results = {}
+    for engine in engines or list(ENGINES):
+        for case in cases or DEFAULT_CASES:
+            runs = []
+            for _ in range(repeats):
+                with ProcessPoolExecutor(1) as executor:
+                    runs.append(executor.submit(_run_case, engine, case).result())
+            fastest_run = min(runs, key=lambda run: run["wall_time"])
+
+            with ProcessPoolExecutor(1) as executor:
+                vehicle_updates = executor.submit(_count_vehicle_updates, engine, case).result()
+            results[case_key(engine, case)] = (
+                {"engine": engine, **case}
+                | fastest_run
+                | {
+                    "vehicle_updates": vehicle_updates,
+                    "vehicle_updates_per_second": vehicle_updates / fastest_run["wall_time"],
+                }
+            )
+
+    return {
+        "machine": {"platform": platform.platform(), "python": platform.python_version()},
+        "cases": results,
+    }
+
+
+def same_machine(results: dict, baseline: dict) -> bool:
+    return results["machine"] == baseline["machine"]
+
+
+def find_regressions(
+    results: dict, baseline: dict, tolerances: dict[str, float] | None = None
+) -> list[str]:
+    """Describe the metrics which grew by more than their tolerance against the baseline
+
+    A case missing from the baseline cannot be checked, so it is reported as well. If the
+    baseline was measured on another machine, only the machine independent metrics are checked.
+    """
+    tolerances = tolerances if tolerances is not None else DEFAULT_TOLERANCES
+    if not same_machine(results, baseline):
+        tolerances = {
+            metric: tolerance
+            for metric, tolerance in tolerances.items()
+            if metric not in MACHINE_DEPENDENT_METRICS
+        }
+
+    regressions = []
+    for key, metrics in results["cases"].items():
+        if (baseline_metrics := baseline["cases"].get(key)) is None:
+            regressions.append(f"{key}: not in the baseline")
+            continue
+        for metric, tolerance in tolerances.items():
+            change = metrics[metric] / baseline_metrics[metric] - 1
+            if change > tolerance:
+                regressions.append(
+                    f"{key}: {metric} {baseline_metrics[metric]:.6g} -> {metrics[metric]:.6g}"
+                    f" (+{change:.1%})"
+                )
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the traffic flow engines.")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baseline"
+    )
+    arguments = parser.parse_args()
+
+    # Nothing to compare against, a run without a baseline does not pass.
+    if not arguments.save and not arguments.baseline.exists():
+        print(f"ERROR no baseline in {arguments.baseline}, store one with --save.")
+        return 2
+
+    results = run_benchmarks(arguments.engines, repeats=arguments.repeats)
+    for key, metrics in results["cases"].items():
+        print(
+            f"{key:>28}: {metrics['wall_time']:8.2f} s,"
+            f" {metrics['ticks_per_second']:8.0f} ticks/s,"
+            f" {metrics['vehicle_updates_per_second']:10.0f} vehicle updates/s,"
+            f" {metrics['peak_memory_mb']:6.1f} MB"
+        )
+
+    if arguments.save:
+        arguments.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(arguments.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        return 0
+
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+    if not same_machine(results, baseline):
+        print(
+            f"WARNING the baseline was measured on another machine ({baseline['machine']}),"
+            f" {', '.join(MACHINE_DEPENDENT_METRICS)} are not compared."
+        )
+    regressions = find_regressions(results, baseline)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from statistics import NormalDist
+from typing import Callable
+
+import numpy as np
+
+
+def t_quantile(probability: float, degrees_of_freedom: int) -> float:
+    """Quantile of the Student's t-distribution
+
+    Newton's method from the normal quantile on the exact distribution function, so it is exact
+    up to the float precision for any number of degrees of freedom.
+    """
+    if probability < 0.5:
+        return -t_quantile(1 - probability, degrees_of_freedom)
+
+    v = degrees_of_freedom
+    # Density at 0, the density at t is this times (1 + t²/v)^(-(v + 1)/2).
+    density_scale = math.exp(math.lgamma((v + 1) / 2) - math.lgamma(v / 2)) / math.sqrt(
+        v * math.pi
+    )
+    quantile = NormalDist().inv_cdf(probability)
+    for _ in range(100):
+        # The distribution function is concave above 0, so the steps approach the quantile from
+        # below and never overshoot it.
+        density = density_scale * (1 + quantile**2 / v) ** (-(v + 1) / 2)
+        step = (probability - _t_cdf(quantile, v)) / density
+        quantile += step
+        if step <= 1e-12 * quantile:
+            break
+
+    return quantile
+
+
+def _t_cdf(t: float, degrees_of_freedom: int) -> float:
+    """Distribution function of the Student's t-distribution at t >= 0
+
+    The finite series of Abramowitz and Stegun 26.7.3 and 26.7.4 for P(|T| < t).
+    """
+    v = degrees_of_freedom
+    theta = math.atan(t / math.sqrt(v))
+    cos_squared = math.cos(theta) ** 2
+    if v % 2 == 0:
+        term = series = 1.0
+        for k in range(1, v // 2):
+            term *= cos_squared * (2 * k - 1) / (2 * k)
+            series += term
+        probability = math.sin(theta) * series
+    else:
+        series = 0.0
+        if v > 1:
+            term = series = math.cos(theta)
+            for k in range(1, (v - 1) // 2):
+                term *= cos_squared * 2 * k / (2 * k + 1)
+                series += term
+        probability = 2 / math.pi * (theta + math.sin(theta) * series)
+
+    return (1 + probability) / 2
+
+
+class EnsembleRunner:
+    """Replications of stochastic scenarios until the confidence interval of a metric is tight
+
+    `replication(seed, **parameters)` runs a scenario once with its randomness drawn from
+    `seed` (a `np.random.SeedSequence`, spawn independent streams from it, e.g. one per arrival
+    process) and returns the metric, e.g. the mean travel time. It has to be picklable, so
+    a module-level function. Replication `n` of a scenario always gets the same seed, derived
+    from `seed` of the runner, the scenario and `n`, so the ensemble is reproducible.
+
+    Each scenario runs `min_replications` first, then more replications go to the scenarios
+    with the widest confidence interval relative to the required one - the noisy ones - until
+    the half-width of the interval at `confidence` is at most `relative_half_width` of the mean
+    (or `absolute_half_width`), or `max_replications` is reached. Replications already running
+    when a scenario converges are kept, so with many processes there can be a few more of them.
+    """
+
+    def __init__(
+        self,
+        replication: Callable[..., float],
+        scenarios: dict[str, dict],
+        seed: int | None = 0,
+        confidence: float = 0.95,
+        relative_half_width: float = 0.02,
+        absolute_half_width: float = 0.0,
+        min_replications: int = 5,
+        max_replications: int = 100,
+        processes: int | None = None,
+    ) -> None:
+        if not scenarios:
+            raise ValueError("At least one scenario must be run!")
+        if not 3 <= min_replications <= max_replications:
+            raise ValueError("At least 3 replications must be run, not more than the maximum!")
+        if not 0 < confidence < 1:
+            raise ValueError("Confidence must be between 0 and 1!")
+
+        self.replication = replication
+        self.scenarios = scenarios
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.confidence = confidence
+        self.relative_half_width = relative_half_width
+        self.absolute_half_width = absolute_half_width
+        self.min_replications = min_replications
+        self.max_replications = max_replications
+        self.processes = processes if processes is not None else os.cpu_count() or 1
+
+        # Metric of each finished replication, by scenario and replication number.
+        self.values: dict[str, dict[int, float]] = {name: {} for name in scenarios}
+
+    def replication_seed(self, scenario_index: int, replication: int) -> np.random.SeedSequence:
+        return np.random.SeedSequence(
+            self.seed_sequence.entropy, spawn_key=(scenario_index, replication)
+        )
+
+    def statistics(self, name: str) -> dict:
+        values = list(self.values[name].values())
+        count = len(values)
+        mean = float(np.mean(values)) if values else math.nan
+        half_width = (
+            t_quantile((1 + self.confidence) / 2, count - 1)
+            * float(np.std(values, ddof=1))
+            / math.sqrt(count)
+            if count > 1
+            else math.inf
+        )
+        required_half_width = max(self.relative_half_width * abs(mean), self.absolute_half_width)
+
+        return {
+            "mean": mean,
+            "half_width": half_width,
+            "required_half_width": required_half_width,
+            "replications": count,
+            "converged": count >= self.min_replications and half_width <= required_half_width,
+        }
+
+    def _needed_replications(self, name: str) -> int:
+        """Estimate of the replications needed in total, from the current variance"""
+        statistics = self.statistics(name)
+        count = statistics["replications"]
+        if count < self.min_replications:
+            return self.min_replications
+        if statistics["converged"]:
+            return count
+        if statistics["required_half_width"] == 0:
+            return self.max_replications
+
+        ratio = statistics["half_width"] / statistics["required_half_width"]
+        return min(self.max_replications, max(count + 1, math.ceil(count * ratio**2)))
+
+    def _next_scenario(self, issued: dict[str, int]) -> str | None:
+        """Scenario which needs more replications the most, relative to the ones issued"""
+        best_name, best_ratio = None, 0.0
+        for name in self.scenarios:
+            needed = self._needed_replications(name)
+            if issued[name] < needed:
+                ratio = needed / issued[name] if issued[name] else math.inf
+                if ratio > best_ratio:
+                    best_name, best_ratio = name, ratio
+
+        return best_name
+
+    def run(self) -> dict[str, dict]:
+        """Run the replications, return the statistics and the values of each scenario"""
+        scenario_indices = {name: n for n, name in enumerate(self.scenarios)}
+        issued = {name: len(self.values[name]) for name in self.scenarios}
+        running: dict[Future, tuple[str, int]] = {}
+
+        with ProcessPoolExecutor(self.processes) as executor:
+            while True:
+                while (
+                    len(running) < self.processes
+                    and (name := self._next_scenario(issued)) is not None
+                ):
+                    replication = issued[name]
+                    future = executor.submit(
+                        self.replication,
+                        self.replication_seed(scenario_indices[name], replication),
+                        **self.scenarios[name],
+                    )
+                    running[future] = (name, replication)
+                    issued[name] += 1
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, replication = running.pop(future)
+                    self.values[name][replication] = float(future.result())
+
+        return {
+            name: self.statistics(name)
+            | {"values": [self.values[name][n] for n in sorted(self.values[name])]}
+            for name in self.scenarios
+        }
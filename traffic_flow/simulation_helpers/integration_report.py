@@ -0,0 +1,65 @@
+import time
+from typing import Callable
+
+import numpy as np
+
+from traffic_flow import models
+
+
+def _run(simulation: models.TrafficFlow) -> tuple[dict[int, float], float]:
+    start = time.perf_counter()
+    simulation.run()
+    wall_time = time.perf_counter() - start
+
+    travel_times_data = simulation.recorder.travel_times_data
+    travel_times = dict(
+        zip(
+            travel_times_data["vehicle_id"].astype(int).tolist(),
+            travel_times_data["travel_time"].tolist(),
+        )
+    )
+    return travel_times, wall_time
+
+
+def compare_integration_schemes(
+    simulation_factory: Callable[[models.IntegrationScheme], models.TrafficFlow],
+    integration_schemes: dict[str, models.IntegrationScheme],
+    reference_scheme: models.IntegrationScheme | None = None,
+) -> dict[str, dict[str, float]]:
+    """Report travel time errors of the integration schemes against the reference one
+
+    `simulation_factory` builds a ready to run simulation with the given scheme, recording at
+    least the travel times. The reference is the fixed 1/60 s `ExplicitScheme` by default.
+    Travel times are matched by vehicle, only vehicles finished in both runs are compared.
+    """
+    if reference_scheme is None:
+        reference_scheme = models.ExplicitScheme()
+
+    reference_simulation = simulation_factory(reference_scheme)
+    reference_travel_times, reference_wall_time = _run(reference_simulation)
+
+    report = {}
+    for name, integration_scheme in integration_schemes.items():
+        simulation = simulation_factory(integration_scheme)
+        travel_times, wall_time = _run(simulation)
+
+        vehicle_ids = sorted(travel_times.keys() & reference_travel_times.keys())
+        reference = np.array([reference_travel_times[vehicle_id] for vehicle_id in vehicle_ids])
+        compared = np.array([travel_times[vehicle_id] for vehicle_id in vehicle_ids])
+        errors = np.abs(compared - reference) if vehicle_ids else np.zeros(1)
+
+        report[name] = {
+            "ticks": simulation.tick,
+            "ticks_reduction": reference_simulation.tick / max(simulation.tick, 1),
+            "wall_time": wall_time,
+            "speedup": reference_wall_time / wall_time,
+            "finished_vehicles": len(travel_times),
+            "reference_finished_vehicles": len(reference_travel_times),
+            "mean_absolute_error": float(errors.mean()),
+            "max_absolute_error": float(errors.max()),
+            "mean_travel_time_error": (
+                float(compared.mean() - reference.mean()) if vehicle_ids else 0.0
+            ),
+        }
+
+    return report
@@ -0,0 +1,271 @@
+"""Synthetic networks of a chosen size with origin-destination demand, for scaling the engines
+
+- `manhattan_grid` - two-way streets between `rows x columns` signalised intersections, each
+  street leaving the grid has an entry and an exit road,
+- `arterial` - a single two-way main road crossed by side streets at signalised intersections,
+- `merge_tree` - a binary tree of unsignalised merges, the leaves feed a single exit road.
+
+`manhattan_grid(30, 30)` has 3 720 roads, `merge_tree(11)` 4 095.
+"""
+
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+
+from traffic_flow import models
+from traffic_flow.simulation_helpers.arrival_processes import PoissonArrivals
+from traffic_flow.simulation_helpers.vehicle_generator import VehiclesGenerator
+
+# Directions of the streets leaving an intersection, as steps of (row, column).
+DIRECTIONS = {"N": (-1, 0), "E": (0, 1), "S": (1, 0), "W": (0, -1)}
+OPPOSITE_DIRECTIONS = {"N": "S", "E": "W", "S": "N", "W": "E"}
+
+
+class SyntheticNetwork:
+    """Roadmap and traffic lights of a generated network with its entry and exit roads
+
+    `origins` are the roads vehicles enter the network on and `destinations` the ones they
+    leave it by. `add_demand` draws origin-destination pairs and adds Poisson arrivals on
+    the shortest route of each, all of them seeded, so the same arguments give the same demand.
+    """
+
+    def __init__(self) -> None:
+        self.roadmap: dict[str | int, models.Road] = {}
+        self.traffic_lights: list[models.TrafficLights] = []
+        self.origins: list[str | int] = []
+        self.destinations: list[str | int] = []
+
+    def __len__(self) -> int:
+        return len(self.roadmap)
+
+    def add_road(
+        self, start_point: tuple[int, int], end_point: tuple[int, int], road_name: str | int
+    ) -> models.Road:
+        if road_name in self.roadmap:
+            raise ValueError(f"Road {road_name} is already in the network!")
+
+        road = models.Road(start_point, end_point, road_name)
+        self.roadmap[road_name] = road
+        return road
+
+    def od_pairs(
+        self, count: int, seed: int | np.random.SeedSequence | None = 0
+    ) -> list[tuple[str | int, str | int]]:
+        """`count` distinct origin-destination pairs connected by a route, drawn at random"""
+        network = models.RoadNetwork(self.roadmap)
+        random_generator = np.random.default_rng(seed)
+
+        candidates = [
+            (origin, destination)
+            for origin, destination in itertools.product(self.origins, self.destinations)
+            if network.road_ids[origin] != network.road_ids[destination]
+        ]
+        pairs = []
+        for index in random_generator.permutation(len(candidates)).tolist():
+            try:
+                network.shortest_route(*candidates[index])
+            except ValueError:
+                continue
+            pairs.append(candidates[index])
+            if len(pairs) == count:
+                break
+
+        return pairs
+
+    def add_demand(
+        self,
+        vehicles_generator: VehiclesGenerator,
+        vehicles_count: int,
+        duration: float,
+        od_pairs_count: int = 100,
+        seed: int | None = 0,
+        vehicle_type: models.VehicleType | dict | None = None,
+    ) -> list[tuple[str | int, str | int]]:
+        """Poisson arrivals of about `vehicles_count` vehicles in `duration` seconds
+
+        The vehicles are split evenly between `od_pairs_count` random origin-destination pairs
+        and take the shortest route between them. Each pair draws its arrivals from its own
+        stream spawned from `seed`. Returns the pairs.
+        """
+        if vehicles_count <= 0 or duration <= 0:
+            raise ValueError("Number of vehicles and the duration of the demand must be positive!")
+
+        seed_sequence = np.random.SeedSequence(seed)
+        pairs_seed, arrivals_seed = seed_sequence.spawn(2)
+        od_pairs = self.od_pairs(od_pairs_count, pairs_seed)
+        if not od_pairs:
+            raise ValueError("No destination can be reached from the origins!")
+
+        network = models.RoadNetwork(self.roadmap)
+        vehicle_type = (
+            vehicle_type
+            if vehicle_type is not None
+            else models.VehicleType.from_configs({"desired_velocity": 15})
+        )
+        rate = vehicles_count / duration / len(od_pairs)
+        for (origin, destination), pair_seed in zip(od_pairs, arrivals_seed.spawn(len(od_pairs))):
+            vehicles_generator.add_arrival_process(
+                PoissonArrivals(
+                    list(network.shortest_route(origin, destination)),
+                    rate,
+                    pair_seed,
+                    vehicle_type=vehicle_type,
+                    vehicle_starting_properties={"velocity": 10},
+                    end_time=duration,
+                )
+            )
+
+        return od_pairs
+
+    def build_simulation(
+        self,
+        vehicles_count: int,
+        duration: float,
+        simulation_class: type[models.TrafficFlow] = models.VectorizedTrafficFlow,
+        od_pairs_count: int = 100,
+        seed: int | None = 0,
+        recorder: models.Recorder | None = None,
+    ) -> models.TrafficFlow:
+        """Simulation of the network with `add_demand`, running until `duration`"""
+        vehicles_generator = VehiclesGenerator()
+        self.add_demand(vehicles_generator, vehicles_count, duration, od_pairs_count, seed)
+
+        if recorder is None:
+            recorder = models.Recorder(models.RecordingLevel.TRAVEL_TIMES)
+
+        simulation = simulation_class(
+            vehicles_generator.vehicles_stream(), self.roadmap, self.traffic_lights, recorder
+        )
+        simulation.total_time = duration
+
+        return simulation
+
+
+def manhattan_grid(
+    rows: int,
+    columns: int,
+    block_length: int = 200,
+    green_times: tuple[float, float] = (30, 30),
+    clearance_time: float = 2,
+) -> SyntheticNetwork:
+    """Grid of `rows x columns` signalised intersections `block_length` apart
+
+    Neighbouring intersections are linked by a road in each direction, and each street leaving
+    the grid ends with an entry road (`in-...`, an origin) and an exit road (`out-...`, a
+    destination). Vehicles may turn anywhere but back. The lights give `green_times[0]` to the
+    east-west roads and `green_times[1]` to the north-south ones, with `clearance_time` of red
+    for all after each.
+    """
+    if rows < 1 or columns < 1:
+        raise ValueError("Grid must have at least one intersection!")
+
+    network = SyntheticNetwork()
+
+    def point(row: int, column: int) -> tuple[int, int]:
+        return column * block_length, row * block_length
+
+    # Roads entering and leaving each intersection, by the direction they come from / go to.
+    incoming: dict[tuple[int, int], dict[str, models.Road]] = {}
+    outgoing: dict[tuple[int, int], dict[str, models.Road]] = {}
+    for row, column in itertools.product(range(rows), range(columns)):
+        incoming[row, column] = {}
+        outgoing[row, column] = {}
+
+    for row, column in itertools.product(range(rows), range(columns)):
+        for direction, (row_step, column_step) in DIRECTIONS.items():
+            neighbour = (row + row_step, column + column_step)
+            if neighbour in incoming:
+                road = network.add_road(
+                    point(row, column),
+                    point(*neighbour),
+                    f"{row}.{column}>{neighbour[0]}.{neighbour[1]}",
+                )
+                outgoing[row, column][direction] = road
+                incoming[neighbour][OPPOSITE_DIRECTIONS[direction]] = road
+            else:
+                entry_road = network.add_road(
+                    point(*neighbour), point(row, column), f"in-{row}.{column}{direction}"
+                )
+                exit_road = network.add_road(
+                    point(row, column), point(*neighbour), f"out-{row}.{column}{direction}"
+                )
+                incoming[row, column][direction] = entry_road
+                outgoing[row, column][direction] = exit_road
+                network.origins.append(entry_road.road_name)
+                network.destinations.append(exit_road.road_name)
+
+    east_west_green_time, north_south_green_time = green_times
+    for intersection in incoming:
+        for from_direction, in_road in incoming[intersection].items():
+            for to_direction, out_road in outgoing[intersection].items():
+                # No U-turns, the road back leads where the vehicle came from.
+                if to_direction != from_direction:
+                    in_road.add_next_road(out_road)
+
+        roads = list(incoming[intersection].values())
+        east_west = tuple(direction in "EW" for direction in incoming[intersection])
+        north_south = tuple(direction in "NS" for direction in incoming[intersection])
+        all_red = (False,) * len(roads)
+        network.traffic_lights.append(
+            models.TrafficLights(
+                roads,
+                [east_west_green_time, clearance_time, north_south_green_time, clearance_time],
+                [east_west, all_red, north_south, all_red],  # type: ignore
+                approaching_speed=5,
+                slowing_down_distance=50,
+                stopping_distance=15,
+            )
+        )
+
+    return network
+
+
+def arterial(
+    intersections: int,
+    spacing: int = 300,
+    green_times: tuple[float, float] = (40, 20),
+    clearance_time: float = 2,
+) -> SyntheticNetwork:
+    """Two-way main road through `intersections` signalised intersections `spacing` apart
+
+    A single row of `manhattan_grid`: each intersection is crossed by a side street with an
+    entry and an exit road on both sides, and the main road gets the longer green time.
+    """
+    return manhattan_grid(1, intersections, spacing, green_times, clearance_time)
+
+
+def merge_tree(depth: int, road_length: int = 500) -> SyntheticNetwork:
+    """Binary tree of merges, `2 ** depth` entry roads flowing into a single exit road
+
+    Every road except the entry ones (the origins) has two roads merging into it, without
+    traffic lights. The exit road, the root of the tree, is the only destination. There are
+    `2 ** (depth + 1) - 1` roads.
+    """
+    if depth < 0:
+        raise ValueError("Depth of the tree must not be negative!")
+
+    network = SyntheticNetwork()
+
+    # Road `n` of a level is fed by the roads `2n` and `2n + 1` of the level above it.
+    previous_level: list[models.Road] = []
+    for level in range(depth + 1):
+        roads_count = 2 ** (depth - level)
+        spread = road_length * 2**level
+        current_level = []
+        for n in range(roads_count):
+            y = round((n + 0.5) * spread)
+            road = network.add_road(
+                (level * road_length, y), ((level + 1) * road_length, y), f"{level}.{n}"
+            )
+            for feeding_road in previous_level[2 * n : 2 * n + 2]:
+                feeding_road.add_next_road(road)
+            current_level.append(road)
+
+        if level == 0:
+            network.origins = [road.road_name for road in current_level]
+        previous_level = current_level
+
+    network.destinations = [previous_level[0].road_name]
+    return network
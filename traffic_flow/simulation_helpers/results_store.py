@@ -0,0 +1,192 @@
+import copy
+import enum
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+from traffic_flow import models
+
+CONFIG_FILE = "config.json"
+
+
+def _plain(value: Any) -> Any:
+    """JSON-serializable copy of configuration data, objects become dicts of their attributes"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+
+    attributes = (
+        {name: getattr(value, name) for name in value.__slots__}
+        if hasattr(value, "__slots__")
+        else vars(value)
+    )
+    return {"class": type(value).__name__} | _plain(attributes)
+
+
+def scenario_config(simulation: models.TrafficFlow) -> dict:
+    """Everything the results of a simulation depend on, except the demand, as plain data"""
+    network = simulation.network
+    recorder = simulation.recorder
+
+    return _plain(
+        {
+            "engine": type(simulation).__name__,
+            "network": {
+                "road_names": network.road_names,
+                "road_lengths": network.road_lengths,
+                "adjacency_offsets": network.adjacency_offsets,
+                "adjacency": network.adjacency,
+            },
+            "traffic_lights": [
+                {
+                    "roads": [road.road_name for road in traffic_lights.roads],
+                    "cycle_times": traffic_lights.cycle_times,
+                    "cycle_green_lights": traffic_lights.cycle_green_lights,
+                    "cycle_start_time": traffic_lights.cycle_start_time,
+                    "approaching_speed": traffic_lights.approaching_speed,
+                    "slowing_down_distance": traffic_lights.slowing_down_distance,
+                    "stopping_distance": traffic_lights.stopping_distance,
+                }
+                for traffic_lights in simulation.traffic_lights or []
+            ],
+            "integration_scheme": simulation.integration_scheme,
+            "time_step": simulation.time_step,
+            "horizon": simulation.total_time,
+            "recorder": {
+                "class": type(recorder).__name__,
+                "recording_level": recorder.recording_level,
+                "recording_interval": recorder.recording_interval,
+            },
+        }
+    )
+
+
+def scenario_hash(simulation: models.TrafficFlow) -> str:
+    """SHA-256 of the configuration and of the demand of a simulation which has not started
+
+    The demand is read from a copy of the spawn scheduler, one ride start time at a time and
+    only up to the horizon, so the simulation itself is left untouched and no large demand is
+    held in memory.
+    """
+    if simulation.tick:
+        raise ValueError("Only simulations which have not started yet can be hashed!")
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps(scenario_config(simulation), sort_keys=True).encode())
+
+    spawn_scheduler = copy.deepcopy(simulation.spawn_scheduler)
+    while (
+        ride_start_time := spawn_scheduler.next_ride_start_time
+    ) is not None and ride_start_time <= simulation.total_time:
+        for vehicle in spawn_scheduler.pop_due(ride_start_time):
+            digest.update(json.dumps(_plain(vehicle), sort_keys=True).encode())
+
+    return digest.hexdigest()
+
+
+def variant_key(key: str, variant: dict) -> str:
+    """Key of results derived from the scenario `key` other than by running it on its own
+
+    E.g. a cell of a batched run or a fork of a warm-up - such a simulation cannot be hashed
+    by `scenario_hash`, the `variant` (plain data) tells its results apart from the scenario's.
+    """
+    return hashlib.sha256(json.dumps([key, _plain(variant)], sort_keys=True).encode()).hexdigest()
+
+
+def simulation_outputs(simulation: models.TrafficFlow) -> dict[str, np.ndarray]:
+    return {
+        "travel_times": np.asarray(simulation.travel_times, dtype=float),
+        "entry_delays": np.asarray(simulation.entry_delays, dtype=float),
+    }
+
+
+class ResultsStore:
+    """Results of simulations as binary arrays, stored under the hash of their scenario
+
+    Each result is a directory named by its key with one `.npy` file per array and the
+    `config.json` of the scenario. It is written aside and renamed into place, so a result
+    interrupted while being saved is not there at all. `load` memory-maps the arrays, nothing
+    is read until it is used. Named indexes (`write_index`, `read_index`) map e.g. the cells of
+    a sweep to their keys.
+    """
+
+    def __init__(self, directory: Path | str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return (self.directory / key).is_dir()
+
+    def keys(self) -> list[str]:
+        return sorted(
+            path.name
+            for path in self.directory.iterdir()
+            if path.is_dir() and not path.name.startswith(".")
+        )
+
+    def save(self, key: str, arrays: dict[str, np.ndarray], config: dict | None = None) -> None:
+        temporary_path = self.directory / f".{key}.{os.getpid()}"
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        temporary_path.mkdir()
+
+        for name, array in arrays.items():
+            np.save(temporary_path / f"{name}.npy", np.asarray(array))
+        with open(temporary_path / CONFIG_FILE, "w") as file:
+            json.dump(config or {}, file)
+
+        try:
+            os.replace(temporary_path, self.directory / key)
+        except OSError:
+            # Saved meanwhile by another process, the results are the same.
+            shutil.rmtree(temporary_path)
+
+    def load(self, key: str) -> dict[str, np.ndarray]:
+        """Read-only memory-mapped arrays of a result"""
+        if key not in self:
+            raise KeyError(key)
+
+        return {
+            path.stem: np.load(path, mmap_mode="r")
+            for path in sorted((self.directory / key).glob("*.npy"))
+        }
+
+    def config(self, key: str) -> dict:
+        with open(self.directory / key / CONFIG_FILE) as file:
+            return json.load(file)
+
+    def run(
+        self,
+        simulation: models.TrafficFlow,
+        outputs: Callable[[models.TrafficFlow], dict[str, np.ndarray]] = simulation_outputs,
+    ) -> str:
+        """Run the simulation unless its results are stored already, return their key
+
+        The key covers the scenario, not `outputs`, so keep using the same outputs with a store.
+        """
+        key = scenario_hash(simulation)
+        if key not in self:
+            config = scenario_config(simulation)
+            simulation.run()
+            self.save(key, outputs(simulation), config)
+
+        return key
+
+    def write_index(self, name: str, keys: dict[str, str]) -> None:
+        with open(self.directory / f"{name}.json", "w") as file:
+            json.dump(keys, file)
+
+    def read_index(self, name: str) -> dict[str, str]:
+        with open(self.directory / f"{name}.json") as file:
+            return json.load(file)
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+
+class SuccessiveHalving:
+    """Budgeted search for the parameters with the lowest simulated cost
+
+    `evaluate(parameters, horizon)` runs a scenario with the `parameters` for `horizon` seconds
+    of the simulated time and returns its cost, lower is better. It has to be picklable, so
+    a module-level function. The parameters are continuous, each one sampled uniformly from its
+    `bounds` and rounded to `resolution` (e.g. green light times to 0.1 s).
+
+    All the candidates are evaluated on `min_horizon`, then only the best `1 / reduction_factor`
+    of them on a `reduction_factor` times longer horizon, and so on until `max_horizon` - the
+    long runs are spent only on the promising candidates.
+    """
+
+    def __init__(
+        self,
+        evaluate: Callable[[dict, float], float],
+        bounds: dict[str, tuple[float, float]],
+        candidates: int = 81,
+        min_horizon: float = 400,
+        max_horizon: float = 72000,
+        reduction_factor: int = 3,
+        resolution: float = 0.1,
+        seed: int | None = None,
+        processes: int | None = None,
+    ) -> None:
+        if not bounds:
+            raise ValueError("At least one parameter must be searched!")
+        if reduction_factor < 2:
+            raise ValueError("Reduction factor must be at least 2!")
+        if not 0 < min_horizon <= max_horizon:
+            raise ValueError("Horizons must be positive, the minimal one not above the maximal!")
+
+        self.evaluate = evaluate
+        self.bounds = bounds
+        self.candidates = candidates
+        self.min_horizon = min_horizon
+        self.max_horizon = max_horizon
+        self.reduction_factor = reduction_factor
+        self.resolution = resolution
+        self.random_generator = np.random.default_rng(seed)
+        self.processes = processes
+
+    def sample_candidates(self) -> list[dict[str, float]]:
+        samples = {
+            name: np.round(
+                self.random_generator.uniform(low, high, self.candidates) / self.resolution
+            )
+            * self.resolution
+            for name, (low, high) in self.bounds.items()
+        }
+        return [
+            {name: float(values[n]) for name, values in samples.items()}
+            for n in range(self.candidates)
+        ]
+
+    def horizons(self) -> list[float]:
+        horizons = [self.min_horizon]
+        while horizons[-1] < self.max_horizon:
+            horizons.append(min(horizons[-1] * self.reduction_factor, self.max_horizon))
+
+        return horizons
+
+    def run(self, candidates: list[dict[str, float]] | None = None) -> dict:
+        """Search among the `candidates` (sampled by default)
+
+        Returns the best parameters with their cost on the longest horizon, the costs of all
+        the candidates evaluated in each rung and the simulated time spent, to be compared with
+        `candidates * max_horizon` of the exhaustive evaluation.
+        """
+        candidates = candidates if candidates is not None else self.sample_candidates()
+        rungs = []
+        simulated_time = 0.0
+
+        with ProcessPoolExecutor(self.processes) as executor:
+            for horizon in self.horizons():
+                costs = list(
+                    executor.map(
+                        self.evaluate, candidates, [horizon] * len(candidates), chunksize=1
+                    )
+                )
+                simulated_time += horizon * len(candidates)
+
+                ranking = sorted(range(len(candidates)), key=lambda n: costs[n])
+                rungs.append(
+                    {
+                        "horizon": horizon,
+                        "results": [
+                            {"parameters": candidates[n], "cost": costs[n]} for n in ranking
+                        ],
+                    }
+                )
+                candidates = [
+                    candidates[n]
+                    for n in ranking[: max(1, len(candidates) // self.reduction_factor)]
+                ]
+
+        best = rungs[-1]["results"][0]
+        return {
+            "parameters": best["parameters"],
+            "cost": best["cost"],
+            "rungs": rungs,
+            "simulated_time": simulated_time,
+        }
@@ -0,0 +1,99 @@
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable
+
+
+class SweepRunner:
+    """Runs a scenario for every cell of a parameter grid in a pool of processes
+
+    `scenario_factory` is called with keyword arguments - one value for each parameter of
+    `parameter_grid` - and must return JSON-serializable result. It has to be picklable, so a
+    module-level function. Each finished cell is appended right away as a single line to
+    `results_path` (JSON Lines), cells already present there are not run again. Without
+    `results_path` every cell is run and nothing is saved, e.g. when the scenario factory keeps
+    its results itself (`ResultsStore`).
+    """
+
+    def __init__(
+        self,
+        scenario_factory: Callable[..., Any],
+        parameter_grid: dict[str, list],
+        results_path: Path | None,
+        processes: int | None = None,
+    ) -> None:
+        if not parameter_grid:
+            raise ValueError("Parameter grid must have at least one parameter!")
+
+        self.scenario_factory = scenario_factory
+        self.parameter_grid = parameter_grid
+        self.results_path = Path(results_path) if results_path is not None else None
+        self.processes = processes
+
+    @staticmethod
+    def cell_key(parameters: dict) -> str:
+        return "_".join(str(value) for value in parameters.values())
+
+    def cells(self) -> list[dict]:
+        names = list(self.parameter_grid)
+        return [
+            dict(zip(names, values)) for values in itertools.product(*self.parameter_grid.values())
+        ]
+
+    def load_results(self) -> dict[str, Any]:
+        """Read the cells saved so far, a line cut off by a crash is skipped"""
+        results = {}
+        if self.results_path is None or not self.results_path.exists():
+            return results
+
+        with open(self.results_path) as file:
+            for line in file:
+                try:
+                    saved_cell = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[saved_cell["key"]] = saved_cell["result"]
+
+        return results
+
+    def _drop_incomplete_line(self) -> None:
+        if self.results_path is None or not self.results_path.exists():
+            return
+
+        with open(self.results_path, "rb+") as file:
+            content = file.read()
+            if content and not content.endswith(b"\n"):
+                file.truncate(content.rfind(b"\n") + 1)
+
+    def _save_result(self, key: str, parameters: dict, result: Any) -> None:
+        if self.results_path is None:
+            return
+
+        with open(self.results_path, "a") as file:
+            file.write(json.dumps({"key": key, "parameters": parameters, "result": result}))
+            file.write("\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def run(self) -> dict[str, Any]:
+        """Run the missing cells, return results of all of them in the grid order"""
+        if self.results_path is not None:
+            self.results_path.parent.mkdir(parents=True, exist_ok=True)
+        self._drop_incomplete_line()
+        results = self.load_results()
+        pending_cells = [cell for cell in self.cells() if self.cell_key(cell) not in results]
+
+        if pending_cells:
+            with ProcessPoolExecutor(self.processes) as executor:
+                futures = {
+                    executor.submit(self.scenario_factory, **cell): cell for cell in pending_cells
+                }
+                for future in as_completed(futures):
+                    cell = futures[future]
+                    key = self.cell_key(cell)
+                    results[key] = future.result()
+                    self._save_result(key, cell, results[key])
+
+        return {key: results[key] for key in (self.cell_key(cell) for cell in self.cells())}
@@ -1,4 +1,7 @@
-import copy
+from traffic_flow.simulation_helpers.arrival_processes import (
+    ArrivalProcess,
+    VehiclesStream,
+)
 
 
 class VehiclesGenerator:
@@ -13,6 +16,7 @@ class VehiclesGenerator:
         )
 
         self.vehicles_specifications = []
+        self.arrival_processes: list[ArrivalProcess] = []
 
     def _gather_configs(
         self,
@@ -40,10 +44,11 @@ class VehiclesGenerator:
         return default_vehicle_specification
 
     def _copy_specifications(self, vehicle_specifications: dict | None = None):
+        # The configs are only read by the simulation, so they can be shared by the vehicles.
         if vehicle_specifications is None:
-            return copy.deepcopy(self._default_vehicle_specification)
+            return dict(self._default_vehicle_specification)
         else:
-            return copy.deepcopy(vehicle_specifications)
+            return dict(vehicle_specifications)
 
     def _add_vehicle(self, route, ride_start_time, vehicle_specifications: dict | None = None):
         vehicle_specifications = self._copy_specifications(vehicle_specifications)
@@ -59,8 +64,26 @@ class VehiclesGenerator:
         for ride_start_time in ride_start_times:
             self.add_vehicle(route, ride_start_time)
 
+    def add_vehicles_between(self, origin, destination, ride_start_times: list[float]) -> None:
+        """Vehicles taking the shortest route from the `origin` road to the `destination` one"""
+        for ride_start_time in ride_start_times:
+            vehicle_specifications = self._copy_specifications()
+            vehicle_specifications["origin"] = origin
+            vehicle_specifications["destination"] = destination
+            vehicle_specifications["ride_start_time"] = ride_start_time
+
+            self.vehicles_specifications.append(vehicle_specifications)
+
     def add_special_vehicle(
         self, route, ride_start_time, vehicle_configs, vehicle_starting_properties
     ):
         vehicle_specifications = self._gather_configs(vehicle_configs, vehicle_starting_properties)
         self._add_vehicle(route, ride_start_time, vehicle_specifications)
+
+    def add_arrival_process(self, arrival_process: ArrivalProcess) -> None:
+        self.arrival_processes.append(arrival_process)
+
+    def vehicles_stream(self) -> VehiclesStream:
+        """Lazy, time-ordered stream of all the vehicles - from the arrival processes and the
+        ones added one by one - to be passed to the simulation instead of a list"""
+        return VehiclesStream(self.arrival_processes, self.vehicles_specifications)
@@ -1,15 +1,21 @@
+import itertools
 import json
 from pathlib import Path
 
 import numpy as np
 
 from traffic_flow import models
+from traffic_flow.simulation_helpers.arrival_processes import (
+    FixedHeadwayArrivals,
+    PoissonArrivals,
+    VehiclesStream,
+)
 from traffic_flow.simulation_helpers.vehicle_generator import VehiclesGenerator
 
 
-def prepare_scenario(
+def build_network(
     street1_green_light_time: float, street2_green_light_time: float
-) -> list[dict]:
+) -> tuple[dict[str, models.Road], list[models.TrafficLights]]:
     in_street1 = models.Road((0, 0), (2000, 0), "Street1")
     in_street2 = models.Road((0, 0), (2000, 0), "Street2")
     out_street = models.Road((0, 0), (2000, 0), "Street3")
@@ -18,8 +24,6 @@ def prepare_scenario(
     in_street2.add_next_road(out_street)
 
     roadmap = {"Street1": in_street1, "Street2": in_street2, "Street3": out_street}
-    route1 = ["Street1", "Street3"]
-    route2 = ["Street2", "Street3"]
 
     traffic_lights = models.TrafficLights(
         [in_street1, in_street2],
@@ -30,31 +34,356 @@ def prepare_scenario(
         stopping_distance=30,
     )
 
-    vehicles_generator = VehiclesGenerator({"desired_velocity": 15}, {"velocity": 15})
+    return roadmap, [traffic_lights]
+
+
+def build_vehicles_stream() -> VehiclesStream:
+    route1 = ["Street1", "Street3"]
+    route2 = ["Street2", "Street3"]
+
+    vehicles_generator = VehiclesGenerator()
+    vehicle_type = models.VehicleType.from_configs({"desired_velocity": 15})
+
+    for route, headway, start_time, count in ((route1, 5, 5, 150), (route2, 10, 10.1, 75)):
+        vehicles_generator.add_arrival_process(
+            FixedHeadwayArrivals(
+                route,
+                headway,
+                vehicle_type=vehicle_type,
+                vehicle_starting_properties={"velocity": 15},
+                start_time=start_time,
+                count=count,
+            )
+        )
+
+    return vehicles_generator.vehicles_stream()
+
+
+def build_random_vehicles_stream(
+    seed_sequence: np.random.SeedSequence, end_time: float = 750
+) -> VehiclesStream:
+    """Poisson arrivals with the mean headways of `build_vehicles_stream`, until `end_time`
+
+    Each street draws from its own stream spawned from `seed_sequence`.
+    """
+    route1 = ["Street1", "Street3"]
+    route2 = ["Street2", "Street3"]
+
+    vehicles_generator = VehiclesGenerator()
+    vehicle_type = models.VehicleType.from_configs({"desired_velocity": 15})
+
+    for route, headway, street_seed in zip((route1, route2), (5, 10), seed_sequence.spawn(2)):
+        vehicles_generator.add_arrival_process(
+            PoissonArrivals(
+                route,
+                1 / headway,
+                street_seed,
+                vehicle_type=vehicle_type,
+                vehicle_starting_properties={"velocity": 15},
+                end_time=end_time,
+            )
+        )
+
+    return vehicles_generator.vehicles_stream()
+
+
+def build_scenario(
+    street1_green_light_time: float,
+    street2_green_light_time: float,
+    simulation_class: type[models.TrafficFlow] = models.TrafficFlow,
+    integration_scheme: models.IntegrationScheme | None = None,
+    recorder: models.Recorder | None = None,
+) -> models.TrafficFlow:
+    roadmap, traffic_lights = build_network(street1_green_light_time, street2_green_light_time)
+
+    simulation = simulation_class(
+        build_vehicles_stream(),
+        roadmap,
+        traffic_lights,
+        recorder if recorder is not None else models.Recorder(models.RecordingLevel.TRAVEL_TIMES),
+        integration_scheme,
+    )
+    simulation.total_time = 72000
+
+    return simulation
 
-    street1_cars_start_times = list(np.arange(1, 151) * 5)
-    street2_cars_start_times = list(np.arange(1, 76) * 10 + 0.1)
 
-    vehicles_generator.add_vehicles(route1, list(street1_cars_start_times))
-    vehicles_generator.add_vehicles(route2, list(street2_cars_start_times))
+def build_batched_scenario(
+    green_light_times: list[tuple[float, float]],
+    integration_scheme: models.IntegrationScheme | None = None,
+) -> models.BatchedTrafficFlow:
+    """Single engine running the scenario for each `(street1, street2)` pair of green times"""
+    networks = [
+        build_network(*variant_green_light_times)
+        for variant_green_light_times in green_light_times
+    ]
 
-    vehicles_specifications = vehicles_generator.vehicles_specifications
-    simulation = models.TrafficFlow(vehicles_specifications, roadmap, [traffic_lights])
+    simulation = models.BatchedTrafficFlow(
+        build_vehicles_stream(),
+        [roadmap for roadmap, _ in networks],
+        [traffic_lights for _, traffic_lights in networks],
+        [models.Recorder(models.RecordingLevel.TRAVEL_TIMES) for _ in networks],
+        integration_scheme,
+    )
     simulation.total_time = 72000
 
+    return simulation
+
+
+def prepare_scenario(
+    street1_green_light_time: float,
+    street2_green_light_time: float,
+    simulation_class: type[models.TrafficFlow] = models.TrafficFlow,
+    integration_scheme: models.IntegrationScheme | None = None,
+    snapshot_path: Path | None = None,
+    snapshot_interval: float = 3600,
+) -> list[float]:
+    """Run the scenario, resuming it from `snapshot_path` if a snapshot was saved there"""
+    if snapshot_path is not None and Path(snapshot_path).exists():
+        simulation = simulation_class.load_snapshot(snapshot_path)
+    else:
+        simulation = build_scenario(
+            street1_green_light_time,
+            street2_green_light_time,
+            simulation_class,
+            integration_scheme,
+        )
+        if snapshot_path is not None:
+            simulation.enable_snapshots(snapshot_path, snapshot_interval)
     simulation.run()
 
     return simulation.travel_times
 
 
-def run_simulation():
+def measure_scenario(street1_green_light_time: float, street2_green_light_time: float) -> dict:
+    """Run the scenario keeping only the aggregated metrics, see `MetricsRecorder`"""
+    recorder = models.MetricsRecorder()
+    simulation = build_scenario(
+        street1_green_light_time,
+        street2_green_light_time,
+        models.VectorizedTrafficFlow,
+        recorder=recorder,
+    )
+    simulation.run()
+
+    return recorder.metrics()
+
+
+def store_scenario(
+    street1_green_light_time: float,
+    street2_green_light_time: float,
+    store_directory: Path = Path("results", "store"),
+) -> str:
+    """Run the scenario unless its results are in the store already, return their key"""
+    from traffic_flow.simulation_helpers.results_store import ResultsStore
+
+    return ResultsStore(store_directory).run(
+        build_scenario(street1_green_light_time, street2_green_light_time)
+    )
+
+
+def stream_trajectories(
+    street1_green_light_time: float,
+    street2_green_light_time: float,
+    directory: Path = Path("results", "trajectories"),
+) -> None:
+    """Run the scenario writing full trajectories to `directory`, see `read_trajectories`"""
+    simulation = build_scenario(
+        street1_green_light_time,
+        street2_green_light_time,
+        models.VectorizedTrafficFlow,
+        recorder=models.StreamingRecorder(directory),
+    )
+    simulation.run()
+
+
+def run_simulation(processes: int | None = None):
+    """Run the cells missing in `results/store`, index their keys as `simulation1`
+
+    Cells are looked up by the hash of their whole scenario, so only the ones which changed are
+    run again.
+    """
+    from traffic_flow.simulation_helpers.results_store import ResultsStore
+    from traffic_flow.simulation_helpers.sweep_runner import SweepRunner
+
+    cycle_times = list(range(10, 61, 10))
+    sweep_runner = SweepRunner(
+        store_scenario,
+        {"street1_green_light_time": cycle_times, "street2_green_light_time": cycle_times},
+        None,
+        processes,
+    )
+    keys = sweep_runner.run()
+
+    ResultsStore(Path("results", "store")).write_index("simulation1", keys)
+
+
+def run_batched_simulation():
+    """Same grid as `run_simulation`, all the cells advanced together by `BatchedTrafficFlow`
+
+    The results go to `results/store`, indexed as `simulation1_batched`. The cells are run
+    again only if any of them is missing there.
+    """
+    from traffic_flow.simulation_helpers.results_store import (
+        ResultsStore,
+        scenario_config,
+        scenario_hash,
+        variant_key,
+    )
+    from traffic_flow.simulation_helpers.sweep_runner import SweepRunner
+
     cycle_times = list(range(10, 61, 10))
-    results = {}
-    for street1_green_light in cycle_times:
-        for street2_green_light in cycle_times:
-            results[f"{street1_green_light}_{street2_green_light}"] = prepare_scenario(
-                street1_green_light, street2_green_light
+    cells = list(itertools.product(cycle_times, cycle_times))
+    store = ResultsStore(Path("results", "store"))
+
+    # Each cell is keyed by the scenario it stands for, run on its own.
+    scenarios = [build_scenario(*cell, models.VectorizedTrafficFlow) for cell in cells]
+    variant = {"engine": models.BatchedTrafficFlow.__name__}
+    keys = [variant_key(scenario_hash(scenario), variant) for scenario in scenarios]
+
+    if not all(key in store for key in keys):
+        simulation = build_batched_scenario(cells)
+        simulation.run()
+
+        for scenario, key, recorder in zip(scenarios, keys, simulation.recorders):
+            store.save(
+                key,
+                {
+                    "travel_times": np.asarray(recorder.travel_times, dtype=float),
+                    "entry_delays": np.asarray(recorder.entry_delays, dtype=float),
+                },
+                scenario_config(scenario) | variant,
             )
 
-    with open(Path("results", "simulation1.json"), "w") as file:
+    store.write_index(
+        "simulation1_batched",
+        {SweepRunner.cell_key(dict(enumerate(cell))): key for cell, key in zip(cells, keys)},
+    )
+
+
+def run_forked_simulation(warm_up_time: float = 3600):
+    """Same grid as `run_simulation`, each cell forked from a single warm-up
+
+    The warm-up runs with 30 s green lights on both streets, travel times are recorded only
+    after it. The results go to `results/store`, indexed as `simulation1_forked`, the cells
+    found there are not run again.
+    """
+    from traffic_flow.simulation_helpers.results_store import (
+        ResultsStore,
+        scenario_config,
+        scenario_hash,
+        simulation_outputs,
+        variant_key,
+    )
+    from traffic_flow.simulation_helpers.sweep_runner import SweepRunner
+
+    cycle_times = list(range(10, 61, 10))
+    store = ResultsStore(Path("results", "store"))
+
+    warm_up = build_scenario(30, 30, models.VectorizedTrafficFlow)
+    warm_up.total_time = warm_up_time
+    warm_up_key = scenario_hash(warm_up)
+
+    keys = {}
+    for cell in itertools.product(cycle_times, cycle_times):
+        cycle_times_of_cell = [cell[0], 2, cell[1], 2]
+        variant = {"warm_up_time": warm_up_time, "cycle_times": cycle_times_of_cell}
+        key = variant_key(warm_up_key, variant)
+        keys[SweepRunner.cell_key(dict(enumerate(cell)))] = key
+        if key in store:
+            continue
+
+        if not warm_up.tick:
+            warm_up.run()
+        simulation = warm_up.fork(
+            [cycle_times_of_cell],
+            recorder=models.Recorder(models.RecordingLevel.TRAVEL_TIMES),
+        )
+        simulation.total_time = 72000
+        config = scenario_config(simulation) | {"warm_up": variant | {"key": warm_up_key}}
+        simulation.run()
+        store.save(key, simulation_outputs(simulation), config)
+
+    store.write_index("simulation1_forked", keys)
+
+
+def green_light_times_cost(parameters: dict[str, float], horizon: float) -> float:
+    """Mean travel time, the vehicles still on the roads count with their time so far"""
+    simulation = build_scenario(
+        parameters["street1_green_light_time"],
+        parameters["street2_green_light_time"],
+        models.VectorizedTrafficFlow,
+    )
+    simulation.total_time = horizon
+    simulation.run()
+
+    travel_times = simulation.travel_times + simulation.unfinished_travel_times()
+    return float(np.mean(travel_times)) if travel_times else 0.0
+
+
+def search_green_light_times(processes: int | None = None, seed: int | None = 0) -> dict:
+    """Successive halving over continuous green light times, instead of the 10 s grid"""
+    from traffic_flow.simulation_helpers.signal_timing_search import SuccessiveHalving
+
+    search = SuccessiveHalving(
+        green_light_times_cost,
+        {"street1_green_light_time": (5, 60), "street2_green_light_time": (5, 60)},
+        seed=seed,
+        processes=processes,
+    )
+    results = search.run()
+
+    Path("results").mkdir(exist_ok=True)
+    with open(Path("results", "green_light_times_search.json"), "w") as file:
         json.dump(results, file)
+
+    return results
+
+
+def random_scenario_travel_time(
+    seed_sequence: np.random.SeedSequence,
+    street1_green_light_time: float,
+    street2_green_light_time: float,
+) -> float:
+    """Mean travel time of a single replication of the scenario with Poisson arrivals
+
+    As in `green_light_times_cost`, the vehicles still on the roads count with their time so
+    far. A replication without any vehicle has no mean travel time, it is an error.
+    """
+    roadmap, traffic_lights = build_network(street1_green_light_time, street2_green_light_time)
+
+    simulation = models.VectorizedTrafficFlow(
+        build_random_vehicles_stream(seed_sequence),
+        roadmap,
+        traffic_lights,
+        models.Recorder(models.RecordingLevel.TRAVEL_TIMES),
+    )
+    simulation.total_time = 72000
+    simulation.run()
+
+    travel_times = simulation.travel_times + simulation.unfinished_travel_times()
+    if not travel_times:
+        raise ValueError("No vehicle entered the roads in this replication!")
+    return float(np.mean(travel_times))
+
+
+def run_ensemble(processes: int | None = None, seed: int | None = 0) -> dict:
+    """Replications of the random scenario until the mean travel times are known within 2%"""
+    from traffic_flow.simulation_helpers.ensemble_runner import EnsembleRunner
+
+    scenarios = {
+        f"{street1}_{street2}": {
+            "street1_green_light_time": street1,
+            "street2_green_light_time": street2,
+        }
+        for street1, street2 in itertools.product([10, 30, 50], repeat=2)
+    }
+    results = EnsembleRunner(
+        random_scenario_travel_time, scenarios, seed=seed, processes=processes
+    ).run()
+
+    Path("results").mkdir(exist_ok=True)
+    with open(Path("results", "simulation1_ensemble.json"), "w") as file:
+        json.dump(results, file)
+
+    return results